@@ -0,0 +1,111 @@
+# aggregator.py
+import asyncio
+import logging
+from collections import OrderedDict
+
+from metrics import DIGEST_MATCHES, DIGESTS
+
+logger = logging.getLogger(__name__)
+
+# Defaults of a job's digest: seconds the first match of a digest may wait,
+# and distinct matches that send the digest before the window closes
+DIGEST_WINDOW = 10.0
+DIGEST_SIZE = 50
+# Telegram rejects longer text messages
+MAX_MESSAGE_LENGTH = 4096
+
+TITLES = {'keywords': "Keyword matches", 'solana': "Solana contracts", 'ethereum': "Ethereum contracts",
+          'cashtags': "Cashtags"}
+
+
+class DigestAggregator:
+    """Folds text matches for a destination into one digest message.
+
+    Instead of one send per match, matches queued for a destination are
+    collected and sent as a single message listing every distinct match with
+    how often it was seen and the source chats it came from. A digest is
+    sent once it holds `size` distinct matches or once the `window` of its
+    oldest match is over, whichever comes first, so no match waits longer
+    than the window of its job. Digests longer than Telegram's limit are
+    split on line boundaries.
+    """
+
+    def __init__(self, submit, chat_name=str):
+        self.submit = submit  # submit(destination, text), e.g. SendDispatcher.submit
+        self.chat_name = chat_name
+        self._pending = {}  # destination -> (kind, value) -> [count, source chat IDs]
+        self._timers = {}  # destination -> (deadline, TimerHandle)
+
+    def add(self, destination, kind, value, chat_id, window=DIGEST_WINDOW, size=DIGEST_SIZE):
+        entries = self._pending.setdefault(destination, OrderedDict())
+        entry = entries.get((kind, value))
+        if entry is None:
+            entry = entries[(kind, value)] = [0, {}]
+        entry[0] += 1
+        entry[1][chat_id] = None
+        DIGEST_MATCHES.labels(destination).inc()
+
+        if len(entries) >= size:
+            self.flush(destination)
+            return
+        # Jobs with different windows can share a destination; the earliest deadline wins
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + window
+        timer = self._timers.get(destination)
+        if timer is None or deadline < timer[0]:
+            if timer is not None:
+                timer[1].cancel()
+            self._timers[destination] = (deadline, loop.call_at(deadline, self.flush, destination))
+
+    def flush(self, destination=None):
+        # Sends the pending digest of a destination, or of every destination
+        destinations = list(self._pending) if destination is None else [destination]
+        for destination in destinations:
+            timer = self._timers.pop(destination, None)
+            if timer is not None:
+                timer[1].cancel()
+            entries = self._pending.pop(destination, None)
+            if not entries:
+                continue
+            parts = split_message(self.format(entries))
+            for part in parts:
+                self.submit(destination, part)
+            DIGESTS.labels(destination).inc()
+            logger.info(f"Digest of {len(entries)} matches sent to {destination} in {len(parts)} messages")
+
+    def pending(self):
+        return sum(len(entries) for entries in self._pending.values())
+
+    def format(self, entries):
+        sections = OrderedDict()
+        for (kind, value), (count, chat_ids) in entries.items():
+            sources = ', '.join(self.chat_name(chat_id) for chat_id in chat_ids)
+            sections.setdefault(kind, []).append(f"{value} x{count} ({sources})")
+        lines = []
+        for kind, items in sections.items():
+            if lines:
+                lines.append('')
+            lines.append(f"{TITLES.get(kind, kind)} ({len(items)}):")
+            lines.extend(items)
+        return '\n'.join(lines)
+
+
+def split_message(text, limit=MAX_MESSAGE_LENGTH):
+    # Splits on newlines; a single line over the limit is cut into pieces
+    parts = []
+    current = ''
+    for line in text.split('\n'):
+        while len(line) > limit:
+            if current:
+                parts.append(current)
+                current = ''
+            parts.append(line[:limit])
+            line = line[limit:]
+        candidate = f"{current}\n{line}" if current else line
+        if len(candidate) > limit:
+            parts.append(current)
+            candidate = line
+        current = candidate
+    if current:
+        parts.append(current)
+    return parts
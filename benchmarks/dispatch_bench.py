@@ -0,0 +1,94 @@
+# benchmarks/dispatch_bench.py
+#
+# Sends the same burst of messages to several destinations, one of which
+# answers with a FloodWait, once with the old sequential send-and-sleep loop
+# and once through SendDispatcher. A second scenario counts the API requests
+# a burst from one source chat costs in text mode and in forward mode.
+#
+#   python -m benchmarks.dispatch_bench --destinations 10 --messages 5 --flood-wait 3
+import argparse
+import asyncio
+import time
+
+from telethon import errors
+
+from benchmarks.fake_telegram import FakeClient
+from dispatcher import SendDispatcher
+
+
+async def identity(destination):
+    return destination
+
+
+async def sequential(client, destinations, messages):
+    # The previous _send_message: sleep through a FloodWait, then drop the message
+    for text in messages:
+        for destination in destinations:
+            try:
+                await client.send_message(destination, text)
+            except errors.FloodWaitError as e:
+                await asyncio.sleep(e.seconds)
+
+
+async def dispatched(client, destinations, messages):
+    dispatcher = SendDispatcher(client, identity, rate=100, burst=100, global_rate=1000, global_burst=1000)
+    for text in messages:
+        for destination in destinations:
+            dispatcher.submit(destination, text)
+    await dispatcher.join()
+    dispatcher.close()
+    return dispatcher.stats()
+
+
+async def run(name, scenario, args):
+    client = FakeClient(latency=args.latency)
+    destinations = [f"dest{i}" for i in range(args.destinations)]
+    client.send_flood_waits[destinations[0]] = args.flood_wait
+    messages = [f"signal {i}" for i in range(args.messages)]
+
+    started = time.perf_counter()
+    await scenario(client, destinations, messages)
+    elapsed = time.perf_counter() - started
+
+    unaffected = [sent_at for destination, _, sent_at in client.sent if destination != destinations[0]]
+    last_unaffected = max(unaffected) - started if unaffected else 0
+    expected = len(destinations) * len(messages)
+    print(f"{name:>10}: delivered {len(client.sent)}/{expected} in {elapsed:.2f}s, "
+          f"unthrottled destinations done after {last_unaffected:.2f}s")
+
+
+async def burst_requests(send_mode, args):
+    client = FakeClient()
+    dispatcher = SendDispatcher(client, identity, rate=100, burst=100, global_rate=1000, global_burst=1000)
+    destinations = [f"dest{i}" for i in range(args.destinations)]
+    for i in range(args.messages * 4):
+        # Each group of four is one plain message followed by a three-message album
+        message = await client.push(-1, f"signal {i}", grouped_id=i // 4 if i % 4 else None)
+        dispatcher.albums.record(-1, message)
+        for destination in destinations:
+            if send_mode == 'forward':
+                dispatcher.submit_forward(destination, message)
+            else:
+                dispatcher.submit(destination, message.text)
+    await dispatcher.join()
+    dispatcher.close()
+    print(f"{send_mode:>10}: {args.messages * 4} matches x {len(destinations)} destinations "
+          f"-> {dispatcher.requests} requests")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--destinations', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=5)
+    parser.add_argument('--flood-wait', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.02)
+    args = parser.parse_args()
+
+    await run('sequential', sequential, args)
+    await run('dispatcher', dispatched, args)
+    for send_mode in ('text', 'forward'):
+        await burst_requests(send_mode, args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,170 @@
+# benchmarks/end_to_end.py
+#
+# Drives TelegramForwarder end to end against FakeClient: a trace is pushed
+# into the source chats, the job ingests, matches and dedups it, and the
+# send dispatcher delivers the matches. For every scenario it reports
+# ingest-to-handled throughput, match-to-send latency and, in a second run
+# under tracemalloc, peak and retained memory.
+#
+#   python -m benchmarks.end_to_end --messages 20000 --chats 20
+#   python -m benchmarks.end_to_end --scenario all --flood-wait-rate 0.01 --send-rate 30
+#   python -m benchmarks.end_to_end --trace result.json --speed 100 --ingest-mode poll
+#   python -m benchmarks.end_to_end --scenario all --rate 200 --send-rate 1 --digest-window 5
+import argparse
+import asyncio
+import logging
+import time
+import tracemalloc
+
+import ingest
+from benchmarks.fake_telegram import FakeClient
+from benchmarks.traces import KEYWORDS, load_trace, synthetic_trace
+from dispatcher import SendDispatcher
+from forwarder import TelegramForwarder
+from logs import configure_logging
+from metrics import MESSAGES_INGESTED
+
+DESTINATIONS = ['-2001', '-2002', '-2003']
+
+
+def keywords_job(sources):
+    return {'source_chats': sources, 'destinations': DESTINATIONS, 'keywords': KEYWORDS}
+
+
+def contracts_job(sources):
+    return dict(keywords_job(sources),
+                solana_enabled=True, solana_source_chats=sources, solana_destinations=DESTINATIONS,
+                eth_enabled=True, eth_source_chats=sources, eth_destinations=DESTINATIONS)
+
+
+def all_job(sources):
+    return dict(contracts_job(sources),
+                cashtag_enabled=True, cashtag_source_chats=sources, cashtag_destinations=DESTINATIONS)
+
+
+SCENARIOS = {'keywords': keywords_job, 'contracts': contracts_job, 'all': all_job}
+
+
+async def run_scenario(name, trace, args, run_id):
+    client = FakeClient(latency=args.latency, send_flood_wait_rate=args.flood_wait_rate,
+                        flood_wait_seconds=args.flood_wait, seed=args.seed)
+    chat_ids = sorted({chat_id for _, chat_id, _ in trace})
+    for chat_id in chat_ids:
+        client.add_dialog(chat_id, f"source {chat_id}")
+    await client.connect()
+
+    forwarder = TelegramForwarder(0, '', '+0', client=client)
+    forwarder.dispatcher = SendDispatcher(client, forwarder.dialogs.input_entity, rate=args.send_rate,
+                                          burst=args.send_rate, global_rate=args.send_rate * len(DESTINATIONS),
+                                          global_burst=args.send_rate * len(DESTINATIONS))
+    forwarder.pipeline.albums = forwarder.dispatcher.albums
+    # Keep every latency sample instead of the last LATENCY_SAMPLES
+    forwarder.dispatcher.latencies = []
+
+    # Source chats are given by title, so the job also resolves them through the dialog index
+    job_id = f"bench-{name}-{run_id}"
+    spec = SCENARIOS[name]([f"source {chat_id}" for chat_id in chat_ids])
+    job = asyncio.create_task(forwarder.forward_messages_to_channel(
+        None, ingest_mode=args.ingest_mode, send_mode=args.send_mode, job_id=job_id,
+        digest_window=args.digest_window, digest_size=args.digest_size, **spec))
+    while job_id not in forwarder.rules:
+        await asyncio.sleep(0.01)
+    # Event subscriptions and polling baselines are in place once the first poll interval passed
+    await asyncio.sleep(0.1 if args.ingest_mode == 'events' else ingest.POLL_INTERVAL + 0.1)
+    engine = forwarder.pipeline.engines[args.ingest_mode]
+    # The pipeline's counter is shared by every run of the same ingest mode
+    ingested = MESSAGES_INGESTED.labels(engine.job)
+    expected = ingested.value + len(trace)
+
+    started = time.perf_counter()
+    await client.replay(trace)
+    while ingested.value < expected:
+        await asyncio.sleep(0.01)
+    await engine.queue.join()
+    handled_after = time.perf_counter() - started
+    # Digests still inside their window are sent now, as when the job stops
+    forwarder.digests.flush()
+    await forwarder.dispatcher.join()
+    drained_after = time.perf_counter() - started
+
+    job.cancel()
+    await asyncio.gather(job, return_exceptions=True)
+    forwarder.dispatcher.close()
+    latencies = sorted(forwarder.dispatcher.latencies)
+    return {
+        'messages': len(trace),
+        'handled_after': handled_after,
+        'drained_after': drained_after,
+        # Send and forward requests; forward mode batches several messages per request
+        'sent': forwarder.dispatcher.sent,
+        'failed': forwarder.dispatcher.failed,
+        'dropped': forwarder.dispatcher.dropped,
+        'flood_waits': client.injected_flood_waits,
+        'p50': percentile(latencies, 0.50),
+        'p99': percentile(latencies, 0.99),
+    }
+
+
+async def measure_memory(name, trace, args, run_id):
+    # A separate run, tracemalloc slows every allocation down
+    tracemalloc.start()
+    try:
+        await run_scenario(name, trace, args, run_id)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak, current
+
+
+def percentile(ordered, fraction):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), nargs='+', default=['keywords', 'contracts', 'all'])
+    parser.add_argument('--messages', type=int, default=20000)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0.0, help="trace messages per second, 0 for one burst")
+    parser.add_argument('--trace', help="trace file from benchmarks.traces or a Telegram Desktop export")
+    parser.add_argument('--speed', type=float, default=1.0, help="replay speed-up of a recorded trace")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ingest-mode', choices=ingest.INGEST_MODES, default='events')
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    parser.add_argument('--send-mode', choices=('text', 'forward'), default='text')
+    parser.add_argument('--send-rate', type=float, default=10000.0,
+                        help="sends per second per destination; Telegram allows about 1")
+    parser.add_argument('--latency', type=float, default=0.0, help="simulated API round trip in seconds")
+    parser.add_argument('--flood-wait-rate', type=float, default=0.0, help="share of sends answered with a FloodWait")
+    parser.add_argument('--flood-wait', type=int, default=1, help="seconds of every injected FloodWait")
+    parser.add_argument('--digest-window', type=float, help="seconds matches are collected into one digest")
+    parser.add_argument('--digest-size', type=int, help="distinct matches that send a digest early")
+    parser.add_argument('--no-memory', action='store_true')
+    parser.add_argument('--log-level', default='ERROR')
+    args = parser.parse_args()
+    ingest.POLL_INTERVAL = args.poll_interval
+    configure_logging(getattr(logging, args.log_level.upper()), body_mode='truncate')
+
+    if args.trace:
+        trace = load_trace(args.trace, args.speed)
+    else:
+        trace = synthetic_trace(args.messages, [-1000 - i for i in range(args.chats)], args.rate, args.seed)
+
+    print(f"{len(trace)} messages in {len({chat_id for _, chat_id, _ in trace})} chats, "
+          f"{args.ingest_mode} ingest, {args.send_mode} sends")
+    print(f"{'scenario':>10} {'msg/s':>10} {'handled':>9} {'drained':>9} {'sent':>7} {'failed':>7} {'dropped':>7} "
+          f"{'floods':>7} {'p50 ms':>8} {'p99 ms':>8} {'peak MiB':>9} {'kept MiB':>9}")
+    for run_id, name in enumerate(args.scenario):
+        result = await run_scenario(name, trace, args, run_id)
+        peak, kept = (0, 0) if args.no_memory else await measure_memory(name, trace, args, f"{run_id}-memory")
+        print(f"{name:>10} {result['messages'] / result['handled_after']:>10.0f} "
+              f"{result['handled_after']:>8.2f}s {result['drained_after']:>8.2f}s "
+              f"{result['sent']:>7} {result['failed']:>7} {result['dropped']:>7} {result['flood_waits']:>7} "
+              f"{result['p50'] * 1000:>8.2f} {result['p99'] * 1000:>8.2f} "
+              f"{peak / 2 ** 20:>9.1f} {kept / 2 ** 20:>9.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
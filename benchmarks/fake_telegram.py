@@ -0,0 +1,143 @@
+# benchmarks/fake_telegram.py
+import asyncio
+import random
+import time
+from collections import defaultdict
+
+from telethon import errors, events
+
+
+class FakeMessage:
+    def __init__(self, id, chat_id, text, grouped_id=None):
+        self.id = id
+        self.chat_id = chat_id
+        self.text = text
+        self.grouped_id = grouped_id
+        # perf_counter timestamp of the moment the message "reached Telegram"
+        self.arrived_at = time.perf_counter()
+
+
+class FakeEvent:
+    def __init__(self, message):
+        self.message = message
+        self.chat_id = message.chat_id
+
+    async def get_chat(self):
+        return None
+
+
+class FakeEntity:
+    def __init__(self, title, username=None):
+        self.title = title
+        self.username = username
+
+
+class FakeDialog:
+    def __init__(self, id, title, username=None):
+        self.id = id
+        self.title = title
+        self.entity = FakeEntity(title, username)
+
+
+class FakeClient:
+    """In-memory stand-in for TelegramClient that replays recorded messages."""
+
+    def __init__(self, latency=0.0, send_flood_wait_rate=0.0, flood_wait_seconds=1, seed=0):
+        self.history = defaultdict(list)
+        self.handlers = []
+        self.dialogs = []
+        self.connected = False
+        self.sent = []
+        self.forwarded = []
+        # Simulated round-trip time of every API call
+        self.latency = latency
+        # chat_id -> seconds, raised once as FloodWaitError by the next get_messages
+        self.flood_waits = {}
+        # destination -> seconds, raised once as FloodWaitError by the next send_message
+        self.send_flood_waits = {}
+        # Share of sends and forwards answered with a FloodWait of flood_wait_seconds
+        self.send_flood_wait_rate = send_flood_wait_rate
+        self.flood_wait_seconds = flood_wait_seconds
+        self.injected_flood_waits = 0
+        self._rng = random.Random(seed)
+        self._next_id = 1
+
+    async def connect(self):
+        self.connected = True
+
+    async def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    async def is_user_authorized(self):
+        return True
+
+    def add_event_handler(self, callback, event=None):
+        # Only NewMessage updates are simulated
+        if event is None or isinstance(event, events.NewMessage):
+            self.handlers.append(callback)
+
+    def remove_event_handler(self, callback, event=None):
+        if callback in self.handlers:
+            self.handlers.remove(callback)
+
+    def add_dialog(self, id, title, username=None):
+        self.dialogs.append(FakeDialog(id, title, username))
+
+    async def get_dialogs(self):
+        await asyncio.sleep(self.latency)
+        return list(self.dialogs)
+
+    async def get_input_entity(self, peer):
+        return peer
+
+    async def __call__(self, request):
+        # Raw requests; only PingRequest is sent, by the connection supervisor
+        await asyncio.sleep(self.latency)
+        if not self.connected:
+            raise ConnectionError("Not connected")
+
+    async def get_messages(self, entity, limit=None, min_id=0, offset_id=0):
+        await asyncio.sleep(self.latency)
+        if not self.connected:
+            raise ConnectionError("Not connected")
+        if entity in self.flood_waits:
+            raise errors.FloodWaitError(request=None, capture=self.flood_waits.pop(entity))
+        messages = [message for message in reversed(self.history[entity])
+                    if message.id > min_id and (not offset_id or message.id < offset_id)]
+        return messages[:limit] if limit is not None else messages
+
+    async def send_message(self, entity, message):
+        await asyncio.sleep(self.latency)
+        self._maybe_flood_wait(entity)
+        self.sent.append((entity, message, time.perf_counter()))
+
+    async def forward_messages(self, entity, messages, from_peer=None):
+        await asyncio.sleep(self.latency)
+        self._maybe_flood_wait(entity)
+        self.forwarded.append((entity, list(messages), from_peer, time.perf_counter()))
+
+    def _maybe_flood_wait(self, entity):
+        if entity in self.send_flood_waits:
+            raise errors.FloodWaitError(request=None, capture=self.send_flood_waits.pop(entity))
+        if self.send_flood_wait_rate and self._rng.random() < self.send_flood_wait_rate:
+            self.injected_flood_waits += 1
+            raise errors.FloodWaitError(request=None, capture=self.flood_wait_seconds)
+
+    async def push(self, chat_id, text, grouped_id=None):
+        message = FakeMessage(self._next_id, chat_id, text, grouped_id)
+        self._next_id += 1
+        self.history[chat_id].append(message)
+        # Updates are only delivered while connected, exactly like the real stream
+        if self.connected:
+            for handler in list(self.handlers):
+                await handler(FakeEvent(message))
+        return message
+
+    async def replay(self, trace):
+        # trace: iterable of (delay_seconds, chat_id, text)
+        for delay, chat_id, text in trace:
+            await asyncio.sleep(delay)
+            await self.push(chat_id, text)
@@ -0,0 +1,66 @@
+# benchmarks/ingest_latency.py
+#
+# Compares arrival-to-handler latency of the polling and event ingest modes
+# against a fake client replaying the same message trace.
+#
+#   python -m benchmarks.ingest_latency --messages 40 --rate 4 --poll-interval 5
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from benchmarks.fake_telegram import FakeClient
+from ingest import EventIngest, PollingFeed, open_feed
+
+CHAT_ID = -1001
+
+
+def build_trace(count, rate, seed=0):
+    rng = random.Random(seed)
+    return [(rng.expovariate(rate), CHAT_ID, f"message {i}") for i in range(count)]
+
+
+async def measure(ingest_mode, trace, poll_interval):
+    client = FakeClient()
+    await client.connect()
+    feed = await open_feed(client, EventIngest(client), CHAT_ID, ingest_mode)
+    if isinstance(feed, PollingFeed):
+        feed.interval = poll_interval
+
+    latencies = []
+
+    async def consume():
+        async for message in feed.messages():
+            latencies.append(time.perf_counter() - message.arrived_at)
+            if len(latencies) == len(trace):
+                return
+
+    consumer = asyncio.create_task(consume())
+    await client.replay(trace)
+    await consumer
+    feed.close()
+    return latencies
+
+
+def report(name, latencies):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{name:>7}: mean {statistics.mean(ordered) * 1000:9.2f} ms  "
+          f"p50 {statistics.median(ordered) * 1000:9.2f} ms  p99 {p99 * 1000:9.2f} ms")
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=40)
+    parser.add_argument('--rate', type=float, default=4.0, help="messages per second")
+    parser.add_argument('--poll-interval', type=float, default=5.0)
+    args = parser.parse_args()
+
+    trace = build_trace(args.messages, args.rate)
+    for mode in ('poll', 'events'):
+        report(mode, await measure(mode, trace, args.poll_interval))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,95 @@
+# benchmarks/matcher_bench.py
+#
+# Micro-benchmark of MessageMatcher against the previous per-rule scans
+# (`any(keyword in text.lower() ...)` plus one re.findall per extractor,
+# recompiled on every call) for keyword lists of 10 to 100k entries. The
+# matcher column is a chat read by one keyword rule, which stops at the first
+# keyword found; "all keywords" is a chat shared by several keyword rules,
+# where every keyword contained in the message is looked up.
+#
+#   python -m benchmarks.matcher_bench --keywords 10 100 1000 10000 100000
+import argparse
+import random
+import re
+import string
+import time
+
+import matcher
+from matcher import MessageMatcher
+
+WORDS = ['moon', 'pump', 'launch', 'presale', 'airdrop', 'gem', 'stealth', 'fair', 'listing', 'chart',
+         'holders', 'liquidity', 'locked', 'renounced', 'dev', 'based', 'send', 'ape', 'early', 'call']
+SOLANA_ADDRESS = '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU'
+ETHEREUM_ADDRESS = '0x52908400098527886E0F7030069857D2E4169EE7'
+
+
+def build_keywords(count, rng):
+    keywords = set(WORDS[:count])
+    while len(keywords) < count:
+        keywords.add(''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(5, 12))))
+    return list(keywords)
+
+
+def build_messages(count, rng):
+    messages = []
+    for _ in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(10, 60))]
+        if rng.random() < 0.3:
+            words.append(SOLANA_ADDRESS)
+        if rng.random() < 0.3:
+            words.append(ETHEREUM_ADDRESS)
+        if rng.random() < 0.5:
+            words.append('$' + rng.choice(WORDS).upper())
+        messages.append(' '.join(words))
+    return messages
+
+
+def naive_scan(keywords, text):
+    found = any(keyword in text.lower() for keyword in keywords)
+    solana = re.findall(r'[1-9A-HJ-NP-Za-km-z]{32,44}', text)
+    ethereum = re.findall(r'0x[a-fA-F0-9]{40}', text)
+    cashtags = re.findall(r'\$[A-Z]+', text)
+    return found, solana, ethereum, cashtags
+
+
+def per_message(function, messages, repeat=1):
+    # Best of `repeat` runs, the others mostly measure noise from the rest of the machine
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for text in messages:
+            function(text)
+        best = min(best, time.perf_counter() - started)
+    return best / len(messages) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--keywords', type=int, nargs='+', default=[10, 100, 1000, 10000, 100000])
+    parser.add_argument('--messages', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    messages = build_messages(args.messages, rng)
+    backend = 'pyahocorasick' if matcher.ahocorasick is not None else 'pure python'
+    print(f"automaton backend: {backend}")
+    print(f"{'keywords':>9} {'build ms':>9} {'naive us/msg':>13} {'matcher us/msg':>15} {'speedup':>8} "
+          f"{'all keywords us/msg':>20}")
+
+    for count in args.keywords:
+        keywords = build_keywords(count, rng)
+        started = time.perf_counter()
+        compiled = MessageMatcher(keywords, solana=True, ethereum=True, cashtags=True, any_keyword=True)
+        build_ms = (time.perf_counter() - started) * 1000
+        every_keyword = MessageMatcher(keywords, solana=True, ethereum=True, cashtags=True)
+
+        naive = per_message(lambda text: naive_scan(keywords, text), messages, args.repeat)
+        fast = per_message(compiled.find, messages, args.repeat)
+        full = per_message(every_keyword.find, messages, args.repeat)
+        print(f"{count:>9} {build_ms:>9.1f} {naive:>13.1f} {fast:>15.1f} {naive / fast:>7.1f}x {full:>20.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# benchmarks/pipeline_bench.py
+#
+# Runs N jobs of the four job types over the same source chats, once with
+# one WatcherEngine and matcher per job (how jobs ran before the rule
+# pipeline) and once through TelegramForwarder's pipeline. Reports the
+# get_messages requests and the CPU time spent on the same trace.
+#
+#   python -m benchmarks.pipeline_bench --jobs 1 4 16 64 --mode poll
+import argparse
+import asyncio
+import logging
+import time
+from collections import Counter
+
+import ingest
+from benchmarks.fake_telegram import FakeClient
+from benchmarks.traces import KEYWORDS, synthetic_trace
+from forwarder import TelegramForwarder
+from ingest import EventIngest
+from jobs import JOB_TYPES, job_arguments
+from logs import configure_logging
+from matcher import MessageMatcher
+from watcher import WatcherEngine
+
+
+def counting_client():
+    client = FakeClient()
+    requests = Counter()
+    get_messages = client.get_messages
+
+    async def counted(entity, **kwargs):
+        requests['get_messages'] += 1
+        return await get_messages(entity, **kwargs)
+
+    client.get_messages = counted
+    return client, requests
+
+
+def specs(job_count, chat_ids, mode):
+    return [{'type': JOB_TYPES[i % len(JOB_TYPES)], 'source_chats': [str(chat_id) for chat_id in chat_ids],
+             'destinations': [f"-20{i}"], 'keywords': KEYWORDS, 'ingest_mode': mode}
+            for i in range(job_count)]
+
+
+async def per_job_engines(client, job_specs):
+    # One engine and one matcher per job, every job reads its chats itself
+    def handler_for(matcher):
+        async def handle(chat_id, message):
+            matcher.find(message.text)
+        return handle
+
+    runners = []
+    for spec in job_specs:
+        arguments = job_arguments(spec)
+        matcher = MessageMatcher(keywords=arguments['keywords'], solana=arguments.get('solana_enabled', False),
+                                 ethereum=arguments.get('eth_enabled', False),
+                                 cashtags=arguments.get('cashtag_enabled', False))
+        engine = WatcherEngine(client, EventIngest(client), handler_for(matcher), spec['ingest_mode'])
+        runners.append(asyncio.create_task(engine.run([int(chat) for chat in spec['source_chats']])))
+    return runners
+
+
+async def pipeline(client, job_specs):
+    forwarder = TelegramForwarder(0, '', '+0', client=client)
+    return [asyncio.create_task(forwarder.forward_messages_to_channel(None, job_id=f"job{i}", **job_arguments(spec)))
+            for i, spec in enumerate(job_specs)]
+
+
+async def measure(setup, job_count, args):
+    client, requests = counting_client()
+    await client.connect()
+    chat_ids = [-1000 - i for i in range(args.chats)]
+    runners = await setup(client, specs(job_count, chat_ids, args.mode))
+    await asyncio.sleep(0.2)
+
+    cpu_started = time.process_time()
+    await client.replay(synthetic_trace(args.messages, chat_ids, args.rate))
+    await asyncio.sleep(args.poll_interval * 2)
+    cpu = time.process_time() - cpu_started
+
+    for runner in runners:
+        runner.cancel()
+    await asyncio.gather(*runners, return_exceptions=True)
+    return requests['get_messages'], cpu
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--jobs', type=int, nargs='+', default=[1, 4, 16, 64])
+    parser.add_argument('--chats', type=int, default=10)
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=1000.0)
+    parser.add_argument('--mode', choices=ingest.INGEST_MODES, default='poll')
+    parser.add_argument('--poll-interval', type=float, default=0.2)
+    args = parser.parse_args()
+    ingest.POLL_INTERVAL = args.poll_interval
+    configure_logging(logging.ERROR)
+
+    print(f"{'jobs':>5} {'per-job requests':>17} {'pipeline requests':>18} {'per-job cpu':>12} {'pipeline cpu':>13}")
+    for job_count in args.jobs:
+        old_requests, old_cpu = await measure(per_job_engines, job_count, args)
+        new_requests, new_cpu = await measure(pipeline, job_count, args)
+        print(f"{job_count:>5} {old_requests:>17} {new_requests:>18} {old_cpu:>11.2f}s {new_cpu:>12.2f}s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
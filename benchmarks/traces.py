@@ -0,0 +1,124 @@
+# benchmarks/traces.py
+#
+# Message traces for the benchmarks: lists of (delay_seconds, chat_id, text)
+# that FakeClient.replay() pushes into its chats.
+#
+# synthetic_trace() builds a reproducible trace from a seed. load_trace()
+# reads a trace saved with save_trace() (one JSON object per line) or a
+# Telegram Desktop chat export (result.json), so real chat traffic can be
+# replayed at its recorded pace or sped up.
+#
+#   python -m benchmarks.traces --messages 10000 --chats 20 --rate 200 --out trace.jsonl
+import argparse
+import json
+import random
+import string
+
+from contracts import BASE58_ALPHABET as BASE58, checksum_digits
+
+WORDS = ['moon', 'pump', 'launch', 'presale', 'airdrop', 'gem', 'stealth', 'fair', 'listing', 'chart',
+         'holders', 'liquidity', 'locked', 'renounced', 'dev', 'based', 'send', 'ape', 'early', 'call']
+# Never among WORDS, so keyword_ratio alone decides how many messages match
+KEYWORDS = ['whitelist', 'mint', 'bridge']
+
+
+def solana_address(rng):
+    # Base58 of a random 32-byte key, so it passes contracts.is_solana_address
+    key = rng.randbytes(32)
+    number = int.from_bytes(key, 'big')
+    chars = []
+    while number:
+        number, digit = divmod(number, 58)
+        chars.append(BASE58[digit])
+    return '1' * (len(key) - len(key.lstrip(b'\0'))) + ''.join(reversed(chars))
+
+
+def ethereum_address(rng):
+    return '0x' + checksum_digits(rng.randbytes(20).hex())
+
+
+def cashtag(rng):
+    return '$' + ''.join(rng.choice(string.ascii_uppercase) for _ in range(rng.randint(3, 5)))
+
+
+def synthetic_trace(count, chat_ids, rate=0.0, seed=0, keyword_ratio=0.2, contract_ratio=0.1, cashtag_ratio=0.1):
+    # rate is the average messages per second across all chats (Poisson
+    # arrivals); 0 pushes everything as one burst. Every text is unique, so
+    # cooldowns only suppress what the trace repeats on purpose.
+    rng = random.Random(seed)
+    trace = []
+    for i in range(count):
+        words = [rng.choice(WORDS) for _ in range(rng.randint(5, 40))]
+        words.append(f"#{i}")
+        if rng.random() < keyword_ratio:
+            words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+        if rng.random() < contract_ratio:
+            words.append(solana_address(rng) if rng.random() < 0.5 else ethereum_address(rng))
+        if rng.random() < cashtag_ratio:
+            words.append(cashtag(rng))
+        delay = rng.expovariate(rate) if rate > 0 else 0
+        trace.append((delay, rng.choice(chat_ids), ' '.join(words)))
+    return trace
+
+
+def save_trace(path, trace):
+    with open(path, 'w', encoding='utf-8') as file:
+        for delay, chat_id, text in trace:
+            file.write(json.dumps({'delay': delay, 'chat_id': chat_id, 'text': text}) + '\n')
+
+
+def load_trace(path, speed=1.0, chat_id=None):
+    # speed divides the recorded delays; chat_id overrides the chat of an
+    # export, which is otherwise taken from the file
+    with open(path, 'r', encoding='utf-8') as file:
+        content = file.read()
+    try:
+        export = json.loads(content)
+    except ValueError:
+        # More than one line of JSON
+        export = None
+    if isinstance(export, dict) and 'messages' in export:
+        trace = _from_export(export, chat_id)
+    else:
+        trace = [(entry['delay'], chat_id or entry['chat_id'], entry['text'])
+                 for entry in map(json.loads, filter(None, content.splitlines()))]
+    return [(delay / speed, chat, text) for delay, chat, text in trace]
+
+
+def _from_export(export, chat_id):
+    # Telegram Desktop exports keep the text as a string or as a list of
+    # plain strings and entity objects
+    chat_id = chat_id or -1000000000000 - export.get('id', 0)
+    trace = []
+    previous = None
+    for message in export['messages']:
+        if message.get('type') != 'message':
+            continue
+        text = message.get('text', '')
+        if isinstance(text, list):
+            text = ''.join(part if isinstance(part, str) else part.get('text', '') for part in text)
+        if not text:
+            continue
+        sent_at = int(message.get('date_unixtime', 0))
+        delay = 0 if previous is None else max(0, sent_at - previous)
+        previous = sent_at
+        trace.append((delay, chat_id, text))
+    return trace
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--messages', type=int, default=10000)
+    parser.add_argument('--chats', type=int, default=20)
+    parser.add_argument('--rate', type=float, default=0.0, help="messages per second, 0 for one burst")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', required=True)
+    args = parser.parse_args()
+
+    chat_ids = [-1000 - i for i in range(args.chats)]
+    save_trace(args.out, synthetic_trace(args.messages, chat_ids, args.rate, args.seed))
+    print(f"Wrote {args.messages} messages for {args.chats} chats to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
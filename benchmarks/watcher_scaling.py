@@ -0,0 +1,70 @@
+# benchmarks/watcher_scaling.py
+#
+# Measures how WatcherEngine throughput scales with the number of source
+# chats. Every chat receives messages at the same rate from a simulated
+# client whose API calls take --latency seconds. One extra chat is hit by
+# a FloodWait to show that it does not hold back the others.
+#
+#   python -m benchmarks.watcher_scaling --chats 1 10 100 500 --mode poll
+import argparse
+import asyncio
+import time
+
+import ingest
+from benchmarks.fake_telegram import FakeClient
+from ingest import EventIngest
+from watcher import WatcherEngine
+
+
+async def measure(chat_count, mode, duration, rate, latency):
+    client = FakeClient(latency=latency)
+    await client.connect()
+    chat_ids = [-1000 - i for i in range(chat_count + 1)]
+    client.flood_waits[chat_ids[0]] = duration * 2
+
+    handled = 0
+
+    async def handler(chat_id, message):
+        nonlocal handled
+        handled += 1
+
+    engine = WatcherEngine(client, EventIngest(client), handler, mode)
+    runner = asyncio.create_task(engine.run(chat_ids))
+    await asyncio.sleep(latency * 2 + 0.1)
+
+    async def produce(chat_id):
+        deadline = time.perf_counter() + duration
+        while time.perf_counter() < deadline:
+            await client.push(chat_id, "signal")
+            await asyncio.sleep(1 / rate)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(produce(chat_id) for chat_id in chat_ids))
+    # Let the last poll interval drain before stopping the clock
+    await asyncio.sleep(ingest.POLL_INTERVAL if mode == 'poll' else 0.05)
+    elapsed = time.perf_counter() - started
+    runner.cancel()
+
+    produced = sum(len(client.history[chat_id]) for chat_id in chat_ids[1:])
+    return handled, produced, elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--chats', type=int, nargs='+', default=[1, 10, 100, 500])
+    parser.add_argument('--mode', choices=ingest.INGEST_MODES, default='events')
+    parser.add_argument('--duration', type=float, default=3.0)
+    parser.add_argument('--rate', type=float, default=5.0, help="messages per second per chat")
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--poll-interval', type=float, default=0.5)
+    args = parser.parse_args()
+    ingest.POLL_INTERVAL = args.poll_interval
+
+    print(f"{'chats':>6} {'handled':>9} {'expected':>9} {'msg/s':>10}")
+    for chat_count in args.chats:
+        handled, produced, elapsed = await measure(chat_count, args.mode, args.duration, args.rate, args.latency)
+        print(f"{chat_count:>6} {handled:>9} {produced:>9} {handled / elapsed:>10.1f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
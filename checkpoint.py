@@ -0,0 +1,102 @@
+# checkpoint.py
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checkpoint writes while jobs are running
+CHECKPOINT_INTERVAL = 2
+
+
+class CursorStore:
+    """Last handled message ID per (job, chat), persisted across restarts.
+
+    Changes are tracked between checkpoints, so only cursors that moved are
+    written.
+    """
+
+    def __init__(self):
+        self._cursors = {}
+        self._changed = {}
+        self._discarded = set()
+
+    @property
+    def dirty(self):
+        return bool(self._changed or self._discarded)
+
+    def load(self, cursors):
+        self._cursors = {job_id: dict(chats) for job_id, chats in cursors.items()}
+
+    def get(self, job_id):
+        return dict(self._cursors.get(job_id, {}))
+
+    def set(self, job_id, chat_id, message_id):
+        chats = self._cursors.setdefault(job_id, {})
+        if message_id > chats.get(chat_id, 0):
+            chats[chat_id] = self._changed[(job_id, chat_id)] = message_id
+
+    def discard(self, job_id, chat_id=None):
+        if chat_id is None:
+            self._cursors.pop(job_id, None)
+            self._changed = {key: value for key, value in self._changed.items() if key[0] != job_id}
+        else:
+            self._cursors.get(job_id, {}).pop(chat_id, None)
+            self._changed.pop((job_id, chat_id), None)
+        self._discarded.add((job_id, chat_id))
+
+    def changes(self):
+        # ([(job_id, chat_id, message_id)], [(job_id, chat_id or None)]) since the last call
+        changed, self._changed = self._changed, {}
+        discarded, self._discarded = self._discarded, set()
+        return [(job_id, chat_id, message_id) for (job_id, chat_id), message_id in changed.items()], list(discarded)
+
+    def requeue(self, updates, discards):
+        # Puts back changes whose write failed; newer values win over them
+        for job_id, chat_id, message_id in updates:
+            self._changed.setdefault((job_id, chat_id), message_id)
+        self._discarded.update(discards)
+
+
+class Checkpointer:
+    """Writes cursor and cooldown changes to the state store, off the event loop.
+
+    Both are collected in the same loop iteration and saved in one
+    transaction, so after a restart the cooldowns always cover every message
+    before the saved cursors.
+    """
+
+    def __init__(self, store, phone_number, cursors, cooldowns, interval=CHECKPOINT_INTERVAL):
+        self.store = store
+        self.phone_number = phone_number
+        self.cursors = cursors
+        self.cooldowns = cooldowns
+        self.interval = interval
+        self._task = None
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            if self.cursors.dirty or self.cooldowns.dirty:
+                await self.flush()
+
+    async def flush(self):
+        cursor_updates, cursor_discards = self.cursors.changes()
+        cooldown_updates = self.cooldowns.changes()
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.store.save_checkpoint, self.phone_number,
+                                       cursor_updates, cursor_discards, cooldown_updates)
+        except Exception as e:
+            # Retried with the next checkpoint
+            self.cursors.requeue(cursor_updates, cursor_discards)
+            self.cooldowns.requeue(cooldown_updates)
+            logger.error(f"Failed to write checkpoint: {e}")
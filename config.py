@@ -3,3 +3,11 @@ import os
 
 class Config:
     SECRET_KEY = os.environ.get('FLASK_SECRET_KEY', '60c42768b3650591581be13fea5f5922')
+    # How forwarded message texts appear in the logs: 'full', 'truncate' or 'hash'
+    LOG_MESSAGE_BODIES = os.environ.get('LOG_MESSAGE_BODIES', 'truncate')
+    # SQLite database holding accounts, jobs, cursors and cooldowns
+    STATE_DB = os.environ.get('STATE_DB', 'forwarder.db')
+    # Worker processes the accounts are sharded across; 0 runs them inside the web process
+    WORKER_PROCESSES = int(os.environ.get('WORKER_PROCESSES', '0'))
+    # Chats shown per /list_chats page unless ?per_page= asks for another size
+    CHATS_PER_PAGE = int(os.environ.get('CHATS_PER_PAGE', '100'))
@@ -0,0 +1,105 @@
+# contracts.py
+from functools import lru_cache
+
+try:
+    from Crypto.Hash import keccak as _keccak  # pycryptodome, optional C implementation of keccak-256
+except ImportError:
+    _keccak = None
+
+BASE58_ALPHABET = '123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz'
+# Solana addresses are ed25519 public keys or program derived addresses
+SOLANA_ADDRESS_BYTES = 32
+# Distinct addresses whose validation result is remembered
+VALIDATION_CACHE_SIZE = 4096
+
+_BASE58_INDEX = {char: index for index, char in enumerate(BASE58_ALPHABET)}
+_HEX_DIGITS = frozenset('0123456789abcdefABCDEF')
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def is_solana_address(candidate):
+    # Base58 text that decodes to exactly 32 bytes; every leading '1' is a zero byte
+    number = 0
+    for char in candidate:
+        digit = _BASE58_INDEX.get(char)
+        if digit is None:
+            return False
+        number = number * 58 + digit
+    zero_bytes = len(candidate) - len(candidate.lstrip('1'))
+    return zero_bytes + (number.bit_length() + 7) // 8 == SOLANA_ADDRESS_BYTES
+
+
+@lru_cache(maxsize=VALIDATION_CACHE_SIZE)
+def is_ethereum_address(candidate):
+    # 0x and 40 hex digits. Addresses in a single case carry no checksum;
+    # mixed case ones must match their EIP-55 checksum, so typos are rejected
+    digits = candidate[2:]
+    if candidate[:2] != '0x' or len(digits) != 40 or not _HEX_DIGITS.issuperset(digits):
+        return False
+    if digits == digits.lower() or digits == digits.upper():
+        return True
+    return digits == checksum_digits(digits)
+
+
+def checksum_digits(digits):
+    # EIP-55: a letter is upper case when its nibble of keccak-256(lowercase hex) is 8 or more
+    digits = digits.lower()
+    digest = keccak_256(digits.encode('ascii')).hex()
+    return ''.join(char.upper() if int(nibble, 16) >= 8 else char for char, nibble in zip(digits, digest))
+
+
+def keccak_256(data):
+    # Ethereum's keccak-256, which pads differently from hashlib.sha3_256
+    if _keccak is not None:
+        return _keccak.new(digest_bits=256, data=data).digest()
+
+    padded = bytearray(data)
+    padded.append(0x01)
+    padded.extend(bytes(-len(padded) % _RATE))
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for offset in range(0, len(padded), _RATE):
+        for lane in range(_RATE // 8):
+            state[lane] ^= int.from_bytes(padded[offset + lane * 8:offset + lane * 8 + 8], 'little')
+        state = _keccak_f(state)
+    return b''.join(lane.to_bytes(8, 'little') for lane in state[:4])
+
+
+# Keccak-f[1600] with the 1088 bit rate of keccak-256; lanes are indexed x + 5 * y
+_RATE = 136
+_MASK = (1 << 64) - 1
+_ROTATIONS = (0, 1, 62, 28, 27,
+              36, 44, 6, 55, 20,
+              3, 10, 43, 25, 39,
+              41, 45, 15, 21, 8,
+              18, 2, 61, 56, 14)
+_ROUND_CONSTANTS = (
+    0x0000000000000001, 0x0000000000008082, 0x800000000000808A, 0x8000000080008000,
+    0x000000000000808B, 0x0000000080000001, 0x8000000080008081, 0x8000000000008009,
+    0x000000000000008A, 0x0000000000000088, 0x0000000080008009, 0x000000008000000A,
+    0x000000008000808B, 0x800000000000008B, 0x8000000000008089, 0x8000000000008003,
+    0x8000000000008002, 0x8000000000000080, 0x000000000000800A, 0x800000008000000A,
+    0x8000000080008081, 0x8000000000008080, 0x0000000080000001, 0x8000000080008008,
+)
+# Target lane of every lane in the rho and pi steps: (x, y) moves to (y, 2x + 3y)
+_PI = tuple(y + 5 * ((2 * x + 3 * y) % 5) for y in range(5) for x in range(5))
+
+
+def _rotate(lane, shift):
+    return ((lane << shift) | (lane >> (64 - shift))) & _MASK
+
+
+def _keccak_f(state):
+    for round_constant in _ROUND_CONSTANTS:
+        # theta
+        columns = [state[x] ^ state[x + 5] ^ state[x + 10] ^ state[x + 15] ^ state[x + 20] for x in range(5)]
+        mixes = [columns[(x - 1) % 5] ^ _rotate(columns[(x + 1) % 5], 1) for x in range(5)]
+        # rho and pi
+        moved = [0] * 25
+        for index in range(25):
+            moved[_PI[index]] = _rotate(state[index] ^ mixes[index % 5], _ROTATIONS[index])
+        # chi and iota
+        state = [moved[index] ^ (~moved[index - index % 5 + (index + 1) % 5] & moved[index - index % 5 + (index + 2) % 5])
+                 for index in range(25)]
+        state[0] ^= round_constant
+    return state
@@ -0,0 +1,103 @@
+# cooldown.py
+import logging
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Hard cap on remembered (job_id, forward_type, content) keys per store
+MAX_ENTRIES = 100000
+# Expired entries dropped from the cold end on each call, keeps sweeps O(1)
+SWEEP_BATCH = 8
+
+
+class CooldownStore:
+    """Bounded store of forward cooldowns keyed by (job_id, forward_type, content).
+
+    Every job of an account has its own cooldowns, so two jobs matching the
+    same content both forward it. Jobs without an ID keep theirs in memory
+    only. Each entry keeps the time its cooldown ends. Entries are kept in
+    least-recently-used order: expired ones are swept from the cold end a
+    few at a time, and once `max_size` is reached the least recently used
+    entry is evicted even if its cooldown is still running.
+    """
+
+    def __init__(self, max_size=MAX_ENTRIES, clock=time.time):
+        self.max_size = max_size
+        self.clock = clock
+        self._entries = OrderedDict()
+        # Cooldowns started since the last call to changes()
+        self._changed = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def check_and_set(self, key, ttl):
+        # True when `key` is not cooling down; the new cooldown starts immediately
+        # so concurrent workers cannot both forward the same content.
+        now = self.clock()
+        self._sweep(now)
+
+        expires_at = self._entries.get(key)
+        if expires_at is not None and expires_at > now:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return False
+
+        self.misses += 1
+        if ttl > 0:
+            self._entries[key] = self._changed[key] = now + ttl
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        elif expires_at is not None:
+            del self._entries[key]
+        return True
+
+    def _sweep(self, now):
+        for _ in range(SWEEP_BATCH):
+            if not self._entries:
+                return
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                return
+            del self._entries[key]
+            self.expirations += 1
+
+    def stats(self):
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+    @property
+    def dirty(self):
+        return bool(self._changed)
+
+    def changes(self):
+        # [job_id, forward_type, content, expires_at] of every cooldown started since the last call
+        changed, self._changed = self._changed, {}
+        return [[job_id, forward_type, content, expires_at]
+                for (job_id, forward_type, content), expires_at in changed.items() if job_id is not None]
+
+    def requeue(self, entries):
+        # Puts back changes whose write failed; newer values win over them
+        for job_id, forward_type, content, expires_at in entries:
+            self._changed.setdefault((job_id, forward_type, content), expires_at)
+
+    def load(self, entries):
+        now = self.clock()
+        for job_id, forward_type, content, expires_at in entries:
+            if expires_at > now:
+                self._entries[(job_id, forward_type, content)] = expires_at
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
@@ -0,0 +1,135 @@
+# dialogs.py
+import asyncio
+import logging
+import time
+from collections import namedtuple
+
+from telethon import events
+
+logger = logging.getLogger(__name__)
+
+# Seconds a full dialog listing is trusted before the next lookup refreshes it
+DIALOG_TTL = 300
+# Minimum seconds between refreshes forced by lookups that missed
+MISS_REFRESH_INTERVAL = 30
+
+ChatEntry = namedtuple('ChatEntry', ['id', 'title', 'username'])
+
+
+class DialogIndex:
+    """Per-account index of dialogs keyed by ID, title and username.
+
+    The full dialog list is fetched at most once per `ttl`; in between, the
+    index is kept current from the update stream (new chats, title changes,
+    joins and leaves). Resolved input entities are cached as well, so sends
+    never trigger an entity lookup.
+    """
+
+    def __init__(self, client, ttl=DIALOG_TTL):
+        self.client = client
+        self.ttl = ttl
+        self.by_id = {}
+        self.by_title = {}
+        self.by_username = {}
+        self._input_entities = {}
+        self._loaded_at = None
+        self._missed_at = None
+        self._refresh_lock = asyncio.Lock()
+        self._watching = False
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    async def refresh(self, force=False):
+        async with self._refresh_lock:
+            if not force and not self._stale():
+                return
+            dialogs = await self.client.get_dialogs()
+            self.by_id, self.by_title, self.by_username = {}, {}, {}
+            for dialog in dialogs:
+                self._add(dialog.id, dialog.title, getattr(dialog.entity, 'username', 'N/A'))
+            self._loaded_at = time.monotonic()
+            logger.info(f"Indexed {len(self.by_id)} dialogs")
+            self._watch_updates()
+
+    def _add(self, chat_id, title, username):
+        previous = self.by_id.get(chat_id)
+        if previous is not None:
+            self._remove(chat_id)
+        entry = self.by_id[chat_id] = ChatEntry(chat_id, title, username)
+        # Keep the first dialog for duplicate titles, like the old linear scan
+        self.by_title.setdefault(title, entry)
+        if username:
+            self.by_username.setdefault(username.lower(), entry)
+
+    def _remove(self, chat_id):
+        entry = self.by_id.pop(chat_id, None)
+        if entry is None:
+            return
+        if self.by_title.get(entry.title) is entry:
+            del self.by_title[entry.title]
+        if entry.username and self.by_username.get(entry.username.lower()) is entry:
+            del self.by_username[entry.username.lower()]
+
+    def _watch_updates(self):
+        if self._watching:
+            return
+        self.client.add_event_handler(self._on_new_message, events.NewMessage())
+        self.client.add_event_handler(self._on_chat_action, events.ChatAction())
+        self._watching = True
+
+    async def _on_new_message(self, event):
+        if event.chat_id in self.by_id:
+            return
+        chat = await event.get_chat()
+        if chat is not None:
+            title = getattr(chat, 'title', None) or getattr(chat, 'first_name', None) or ''
+            self._add(event.chat_id, title, getattr(chat, 'username', 'N/A'))
+
+    async def _on_chat_action(self, event):
+        entry = self.by_id.get(event.chat_id)
+        if event.new_title and entry is not None:
+            self._add(entry.id, event.new_title, entry.username)
+        elif event.user_joined or event.user_added or event.user_left or event.user_kicked:
+            # Membership changes may add or drop dialogs, the next lookup re-lists them
+            self._loaded_at = None
+
+    async def chats(self):
+        await self.refresh()
+        return list(self.by_id.values())
+
+    async def resolve(self, chat):
+        # Accepts an ID, a numeric string, an @username or a chat title
+        if isinstance(chat, int):
+            return chat
+        if chat.lstrip('-').isdigit():
+            return int(chat)
+
+        await self.refresh()
+        entry = self._lookup(chat)
+        if entry is None and self._may_refresh_on_miss():
+            await self.refresh(force=True)
+            entry = self._lookup(chat)
+        if entry is None:
+            raise ValueError(f"Chat with title '{chat}' not found")
+        return entry.id
+
+    def _lookup(self, chat):
+        if chat.startswith('@'):
+            return self.by_username.get(chat[1:].lower())
+        return self.by_title.get(chat)
+
+    def _may_refresh_on_miss(self):
+        now = time.monotonic()
+        if self._missed_at is not None and now - self._missed_at < MISS_REFRESH_INTERVAL:
+            return False
+        self._missed_at = now
+        return True
+
+    async def input_entity(self, peer):
+        if isinstance(peer, str) and peer.lstrip('-').isdigit():
+            peer = int(peer)
+        entity = self._input_entities.get(peer)
+        if entity is None:
+            entity = self._input_entities[peer] = await self.client.get_input_entity(peer)
+        return entity
@@ -0,0 +1,245 @@
+# dispatcher.py
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+
+from telethon import errors
+
+from metrics import (FLOOD_WAIT_SECONDS, FLOOD_WAITS, SEND_DROPPED, SEND_FAILED, SEND_LATENCY_SECONDS,
+                     SEND_QUEUE_DEPTH, SEND_SECONDS, SENT, percentile)
+
+logger = logging.getLogger(__name__)
+
+# Telegram allows roughly one message per second to the same chat (short
+# bursts are tolerated) and around 30 messages per second per account.
+DESTINATION_RATE = 1.0
+DESTINATION_BURST = 3
+GLOBAL_RATE = 30.0
+GLOBAL_BURST = 30
+# Messages waiting per destination before new ones are dropped
+QUEUE_SIZE = 1000
+# FloodWaits tolerated for one message before it is given up
+MAX_RETRIES = 5
+# Send latencies kept for the percentiles reported by stats()
+LATENCY_SAMPLES = 1024
+# Seconds a forward waits for more matches from the same chat to share its request
+FORWARD_WINDOW = 0.5
+# Telegram accepts at most 100 message IDs per forward request
+MAX_FORWARD_BATCH = 100
+# Albums remembered per account to keep grouped media together
+ALBUM_CACHE_SIZE = 1000
+
+SEND_MODES = ('text', 'forward')
+
+
+class TokenBucket:
+    def __init__(self, rate, burst, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self._updated = clock()
+        self._paused_until = 0
+
+    async def acquire(self):
+        while True:
+            now = self.clock()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def pause(self, seconds):
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        self.tokens = 0
+
+
+class AlbumIndex:
+    """Remembers the message IDs of recent albums (messages sharing a grouped_id)."""
+
+    def __init__(self, max_size=ALBUM_CACHE_SIZE):
+        self.max_size = max_size
+        self._albums = OrderedDict()
+
+    def record(self, chat_id, message):
+        grouped_id = getattr(message, 'grouped_id', None)
+        if grouped_id is None:
+            return
+        ids = self._albums.get((chat_id, grouped_id))
+        if ids is None:
+            ids = self._albums[(chat_id, grouped_id)] = []
+            if len(self._albums) > self.max_size:
+                self._albums.popitem(last=False)
+        ids.append(message.id)
+
+    def message_ids(self, chat_id, grouped_id):
+        return self._albums.get((chat_id, grouped_id), ())
+
+
+class SendDispatcher:
+    """Paces outbound messages per destination.
+
+    Every destination has its own queue, worker task and token bucket, so a
+    destination in FloodWait only delays its own messages. Those are retried
+    after the wait instead of being dropped. `submit` never blocks the caller.
+
+    Native forwards are coalesced: matches from the same source chat queued
+    within FORWARD_WINDOW go out as one forward_messages request, and a
+    message that belongs to an album is forwarded with the whole album.
+    """
+
+    def __init__(self, client, resolve_entity, rate=DESTINATION_RATE, burst=DESTINATION_BURST,
+                 global_rate=GLOBAL_RATE, global_burst=GLOBAL_BURST):
+        self.client = client
+        self.resolve_entity = resolve_entity
+        self.rate = rate
+        self.burst = burst
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.albums = AlbumIndex()
+        self._queues = {}
+        self._buckets = {}
+        self._workers = {}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.requests = 0
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+        self.flood_waits = 0
+
+    def submit(self, destination, text):
+        self._enqueue(destination, ('text', text, time.perf_counter()))
+
+    def submit_forward(self, destination, message):
+        grouped_id = getattr(message, 'grouped_id', None)
+        self._enqueue(destination, ('forward', message.chat_id, message.id, grouped_id, time.perf_counter()))
+
+    def _enqueue(self, destination, item):
+        queue = self._queues.get(destination)
+        if queue is None:
+            queue = self._queues[destination] = asyncio.Queue(QUEUE_SIZE)
+            self._buckets[destination] = TokenBucket(self.rate, self.burst)
+            self._workers[destination] = asyncio.create_task(self._work(destination, queue))
+        try:
+            queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            SEND_DROPPED.labels(destination).inc()
+            logger.warning(f"Send queue for {destination} is full, dropping message")
+        SEND_QUEUE_DEPTH.labels(destination).set(queue.qsize())
+
+    async def _work(self, destination, queue):
+        carried = None
+        while True:
+            item = carried or await queue.get()
+            carried = None
+            SEND_QUEUE_DEPTH.labels(destination).set(queue.qsize())
+            batch = [item]
+            try:
+                if item[0] == 'forward':
+                    carried = await self._collect_forwards(queue, batch)
+                    await self._deliver(destination, self._forward_request(batch), item[-1])
+                else:
+                    await self._deliver(destination, self._text_request(item[1]), item[2])
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _collect_forwards(self, queue, batch):
+        # Gathers forwards from the same chat until the window closes; returns
+        # the first item that could not join the batch so it is handled next.
+        chat_id = batch[0][1]
+        deadline = time.monotonic() + FORWARD_WINDOW
+        while len(batch) < MAX_FORWARD_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            try:
+                item = await asyncio.wait_for(queue.get(), remaining)
+            except asyncio.TimeoutError:
+                return None
+            if item[0] != 'forward' or item[1] != chat_id:
+                return item
+            batch.append(item)
+        return None
+
+    def _text_request(self, text):
+        async def send(entity):
+            await self.client.send_message(entity, text)
+        return send
+
+    def _forward_request(self, batch):
+        chat_id = batch[0][1]
+        message_ids = set()
+        for _, _, message_id, grouped_id, _ in batch:
+            message_ids.add(message_id)
+            if grouped_id is not None:
+                message_ids.update(self.albums.message_ids(chat_id, grouped_id))
+        message_ids = sorted(message_ids)[:MAX_FORWARD_BATCH]
+
+        async def send(entity):
+            from_peer = await self.resolve_entity(chat_id)
+            await self.client.forward_messages(entity, message_ids, from_peer=from_peer)
+        return send
+
+    async def _deliver(self, destination, send, queued_at):
+        bucket = self._buckets[destination]
+        for _ in range(MAX_RETRIES + 1):
+            await bucket.acquire()
+            await self.global_bucket.acquire()
+            try:
+                entity = await self.resolve_entity(destination)
+                self.requests += 1
+                started = time.perf_counter()
+                await send(entity)
+                SEND_SECONDS.labels(destination).observe(time.perf_counter() - started)
+            except errors.FloodWaitError as e:
+                self.flood_waits += 1
+                FLOOD_WAITS.labels(destination).inc()
+                FLOOD_WAIT_SECONDS.labels(destination).inc(e.seconds)
+                logger.warning(f"FloodWait of {e.seconds}s for {destination}, retrying afterwards")
+                bucket.pause(e.seconds)
+                continue
+            except Exception as e:
+                self.failed += 1
+                SEND_FAILED.labels(destination).inc()
+                logger.error(f"An error occurred while forwarding the message: {e}")
+                return
+            self.sent += 1
+            SENT.labels(destination).inc()
+            latency = time.perf_counter() - queued_at
+            self.latencies.append(latency)
+            SEND_LATENCY_SECONDS.labels(destination).observe(latency)
+            return
+
+        self.failed += 1
+        SEND_FAILED.labels(destination).inc()
+        logger.error(f"Giving up on a message for {destination} after {MAX_RETRIES} FloodWaits")
+
+    async def join(self):
+        # Waits until every queued message was sent or given up
+        for queue in list(self._queues.values()):
+            await queue.join()
+
+    def close(self):
+        for worker in self._workers.values():
+            worker.cancel()
+        self._queues, self._buckets, self._workers = {}, {}, {}
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        return {
+            'requests': self.requests,
+            'sent': self.sent,
+            'failed': self.failed,
+            'dropped': self.dropped,
+            'flood_waits': self.flood_waits,
+            'queue_depth': {destination: queue.qsize() for destination, queue in self._queues.items()},
+            'latency_p50': percentile(latencies, 0.50),
+            'latency_p99': percentile(latencies, 0.99),
+        }
@@ -0,0 +1,304 @@
+# forwarder.py
+import asyncio
+import logging
+import time
+from functools import partial
+
+from telethon import TelegramClient
+
+from aggregator import DIGEST_SIZE, DigestAggregator
+from checkpoint import Checkpointer, CursorStore
+from cooldown import CooldownStore
+from dialogs import DialogIndex
+from health import ConnectionSupervisor
+from dispatcher import SendDispatcher
+from ingest import EventIngest
+from logs import message_body
+from matcher import CASHTAG, ETHEREUM, KEYWORD, SOLANA
+from metrics import COOLDOWN_CHECKS, COOLDOWN_SECONDS
+from pipeline import Pipeline, Rule
+from store import StateStore
+
+logger = logging.getLogger(__name__)
+
+
+class NotAuthorizedError(Exception):
+    pass
+
+
+class TelegramForwarder:
+    def __init__(self, api_id, api_hash, phone_number, client=None, store=None):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.phone_number = phone_number
+        self.client = client or TelegramClient('session_' + phone_number, api_id, api_hash)
+        self.event_ingest = EventIngest(self.client)
+        self.dialogs = DialogIndex(self.client)
+        self.dispatcher = SendDispatcher(self.client, self.dialogs.input_entity)
+        # Text matches of jobs in digest mode are combined per destination before they reach the dispatcher
+        self.digests = DigestAggregator(lambda destination, text: self.dispatcher.submit(destination, text),
+                                        self._chat_name)
+        # Without a store nothing outlives the process
+        self.store = store if store is not None else StateStore(':memory:')
+        # Cooldowns and the last handled message per job and chat survive restarts,
+        # so a restarted job resumes where it stopped without forwarding twice
+        self.cooldowns = CooldownStore()
+        self.cooldowns.load(self.store.cooldowns(phone_number))
+        self.cursors = CursorStore()
+        self.cursors.load(self.store.cursors(phone_number))
+        self.checkpointer = Checkpointer(self.store, phone_number, self.cursors, self.cooldowns)
+        self.pipeline = Pipeline(self.client, self.event_ingest, self.dispatcher.albums, self.cursors)
+        self.rules = {}  # Pipeline rules of each running job, by job ID
+        # Reconnects and replays missed messages while jobs are running
+        self.health = ConnectionSupervisor(self.client, self.connect, self.event_ingest,
+                                           lambda: list(self.pipeline.engines.values()), phone_number)
+        self._connect_lock = asyncio.Lock()
+        self._update_lock = asyncio.Lock()
+        self._exiting = 0  # Jobs still running their cleanup, waited for by shutdown
+
+    async def connect(self):
+        # Jobs and web requests share the client, only the first caller connects it
+        async with self._connect_lock:
+            if not self.client.is_connected():
+                await self.client.connect()
+
+    async def ensure_authorized(self):
+        await self.connect()
+        if not await self.client.is_user_authorized():
+            raise NotAuthorizedError(f"Account {self.phone_number} is not authorized, please authenticate first")
+
+    async def send_code(self):
+        # Returns the phone_code_hash to verify, or None when already authorized
+        await self.connect()
+        if await self.client.is_user_authorized():
+            return None
+        result = await self.client.send_code_request(self.phone_number)
+        return result.phone_code_hash
+
+    async def sign_in(self, code, phone_code_hash):
+        await self.connect()
+        await self.client.sign_in(self.phone_number, code, phone_code_hash=phone_code_hash)
+
+    async def list_chats(self, offset=0, limit=None):
+        # One page of the account's chats and the number of chats. Pages come
+        # from the dialog index, so only the first one may wait for Telegram
+        await self.ensure_authorized()
+
+        chats = await self.dialogs.chats()
+        end = None if limit is None else offset + limit
+        chats_list = []
+        for chat in chats[offset:end]:
+            chats_list.append(f"Chat ID: {chat.id}, Title: {chat.title}, Username: {chat.username}")
+
+        logger.info("List of groups printed successfully!")
+        return chats_list, len(chats)
+
+    async def forward_messages_to_channel(self, user_id, source_chats, destinations, keywords, job_id=None, **options):
+        # options are the other sections and modes of the job, see _job_rules
+        await self.ensure_authorized()
+        rules = await self._job_rules(job_id, source_chats, destinations, keywords, **options)
+
+        # Without a job_id the job starts from the latest messages and keeps no cursors
+        resume_from = {}
+        if job_id is not None:
+            resume_from = self.cursors.get(job_id)
+            self._discard_unwatched(job_id, rules, resume_from)
+            if resume_from:
+                logger.info(f"Resuming job {job_id} from saved cursors for {len(resume_from)} chats")
+            self.rules[job_id] = rules
+        self.checkpointer.start()
+        self.health.start()
+        try:
+            for rule in rules:
+                await self.pipeline.subscribe(rule, resume_from)
+            # Runs until the job is paused or stopped
+            await asyncio.Event().wait()
+        finally:
+            self._exiting += 1
+            try:
+                # Rules an update applied meanwhile are in the same list
+                for rule in rules:
+                    self.pipeline.unsubscribe(rule)
+                # A paused job may already run again under the same ID
+                if self.rules.get(job_id) is rules:
+                    del self.rules[job_id]
+                if not self.rules:
+                    self.health.stop()
+                # Pending digests go out now rather than when their window closes;
+                # this may send other jobs' digests a little early as well
+                self.digests.flush()
+                await self.checkpointer.flush()
+                logger.info(f"Cooldown store stats: {self.cooldowns.stats()}")
+                logger.info(f"Send dispatcher stats: {self.dispatcher.stats()}")
+                logger.info(f"Connection health stats: {self.health.stats()}")
+            finally:
+                self._exiting -= 1
+
+    async def update_job(self, job_id, arguments):
+        # Applies changed job arguments to a running job. Only what differs is
+        # touched: sections keep their pipeline rule, whose handler and matcher
+        # are swapped in place, and only added or removed chats are subscribed
+        # or unsubscribed. Cursors and cooldowns stay as they are.
+        # False when the job is not running on this account.
+        async with self._update_lock:
+            rules = self.rules.get(job_id)
+            if rules is None:
+                return False
+            wanted = {frozenset(rule.kinds): rule for rule in await self._job_rules(job_id, **arguments)}
+            if self.rules.get(job_id) is not rules:
+                # Stopped while the new chats were resolved
+                return False
+
+            resume_from = self.cursors.get(job_id)
+            updated = []
+            for rule in list(rules):
+                new_rule = wanted.pop(frozenset(rule.kinds), None)
+                if new_rule is None or new_rule.ingest_mode != rule.ingest_mode:
+                    # Dropped section, or one that moves to another ingest mode and is
+                    # subscribed again below, from where the old feed stood when nothing
+                    # was handled yet
+                    if new_rule is not None:
+                        for chat_id in rule.chats:
+                            position = self.pipeline.position(rule.ingest_mode, chat_id)
+                            if position is not None:
+                                resume_from.setdefault(chat_id, position)
+                        wanted[frozenset(new_rule.kinds)] = new_rule
+                    self.pipeline.unsubscribe(rule)
+                    continue
+                self.pipeline.update(rule, new_rule)
+                removed, added = rule.chats - new_rule.chats, new_rule.chats - rule.chats
+                if removed:
+                    self.pipeline.unsubscribe(rule, removed)
+                    rule.chats -= removed
+                if added:
+                    rule.chats |= added
+                    await self.pipeline.subscribe(rule, resume_from, added)
+                updated.append(rule)
+            for rule in wanted.values():
+                await self.pipeline.subscribe(rule, resume_from)
+                updated.append(rule)
+            rules[:] = updated
+            self._discard_unwatched(job_id, rules, resume_from)
+            logger.info(f"Updated job {job_id}: {len(rules)} rules over "
+                        f"{len(set().union(*(rule.chats for rule in rules)))} chats")
+            return True
+
+    async def _job_rules(self, job_id, source_chats, destinations, keywords,
+                         solana_enabled=False, solana_source_chats=None, solana_destinations=None, solana_timer=None,
+                         eth_enabled=False, eth_source_chats=None, eth_destinations=None, eth_timer=None,
+                         cashtag_enabled=False, cashtag_source_chats=None, cashtag_destinations=None, cashtag_timer=None,
+                         keyword_timer=None, ingest_mode='events', send_mode='text', digest_window=None, digest_size=None):
+        # Digest mode: (window in seconds, distinct matches per digest), None sends every match on its own
+        digest = (float(digest_window), int(digest_size or DIGEST_SIZE)) if digest_window else None
+        sections = [(source_chats, {'keywords': keywords}, partial(self._forward_keywords, job_id, destinations, keyword_timer, send_mode, digest))]
+        # Forward Solana contract messages
+        if solana_enabled:
+            sections.append((solana_source_chats, {'solana': True}, partial(self._forward_solana, job_id, solana_destinations, solana_timer, send_mode, digest)))
+        # Forward Ethereum contract messages
+        if eth_enabled:
+            sections.append((eth_source_chats, {'ethereum': True}, partial(self._forward_ethereum, job_id, eth_destinations, eth_timer, send_mode, digest)))
+        # Forward Cashtag messages
+        if cashtag_enabled:
+            sections.append((cashtag_source_chats, {'cashtags': True}, partial(self._forward_cashtags, job_id, cashtag_destinations, cashtag_timer, send_mode, digest)))
+
+        # Every section becomes a rule of the account's pipeline, which
+        # ingests and scans each chat once however many jobs read it
+        rules = []
+        for chats, options, handler in sections:
+            chat_ids = set()
+            for source_chat in chats or []:
+                source_chat_id = await self._resolve_chat(source_chat)
+                if source_chat_id is not None:
+                    chat_ids.add(source_chat_id)
+            rule = Rule(job_id, chat_ids, handler, ingest_mode, **options)
+            if chat_ids and rule.kinds:
+                rules.append(rule)
+        return rules
+
+    def _discard_unwatched(self, job_id, rules, resume_from):
+        watched = set().union(*(rule.chats for rule in rules))
+        for chat_id in resume_from:
+            if chat_id not in watched:
+                self.cursors.discard(job_id, chat_id)
+
+    def backing_off(self, job_id):
+        # Source chats of a running job that are waiting out a FloodWait or an error
+        return self.pipeline.backing_off(self.rules.get(job_id, ()))
+
+    async def shutdown(self):
+        # Lets cancelled jobs finish their cleanup, then saves the last checkpoint
+        while self.rules or self._exiting:
+            await asyncio.sleep(0.05)
+        self.health.stop()
+        self.checkpointer.stop()
+        self.digests.flush()
+        await self.checkpointer.flush()
+
+    async def _resolve_chat(self, source_chat):
+        if isinstance(source_chat, str) and source_chat.lstrip('-').isdigit():
+            return int(source_chat)
+        if isinstance(source_chat, str):
+            try:
+                source_chat_id = await self.dialogs.resolve(source_chat)
+                logger.info(f"Found chat ID for '{source_chat}': {source_chat_id}")
+                return source_chat_id
+            except ValueError as e:
+                logger.error(str(e))
+                return None
+        return source_chat
+
+    def _chat_name(self, chat_id):
+        entry = self.dialogs.by_id.get(chat_id)
+        return entry.title if entry is not None else str(chat_id)
+
+    async def _forward_keywords(self, job_id, destinations, keyword_timer, send_mode, digest, message, matches):
+        if any(match.kind == KEYWORD for match in matches):
+            if self._can_forward(job_id, message.text, "keywords", keyword_timer):
+                for destination in destinations:
+                    self._send_message(destination, message, message.text, send_mode, digest, "keywords")
+                    logger.info(f"Message forwarded to channel/chat ID {destination}: {message_body(message.text)}")
+
+    async def _forward_solana(self, job_id, solana_destinations, solana_timer, send_mode, digest, message, matches):
+        # Every distinct address of the message, each with its own cooldown
+        for solana_contract in dict.fromkeys(match.value for match in matches if match.kind == SOLANA):
+            if self._can_forward(job_id, solana_contract, "solana", solana_timer):
+                for solana_destination in solana_destinations:
+                    self._send_message(solana_destination, message, solana_contract, send_mode, digest, "solana")
+                    logger.info(f"Solana contract forwarded to {solana_destination}: {solana_contract}")
+
+    async def _forward_ethereum(self, job_id, eth_destinations, eth_timer, send_mode, digest, message, matches):
+        for eth_contract in dict.fromkeys(match.value for match in matches if match.kind == ETHEREUM):
+            if self._can_forward(job_id, eth_contract, "ethereum", eth_timer):
+                for eth_destination in eth_destinations:
+                    self._send_message(eth_destination, message, eth_contract, send_mode, digest, "ethereum")
+                    logger.info(f"Ethereum contract forwarded to {eth_destination}: {eth_contract}")
+
+    async def _forward_cashtags(self, job_id, cashtag_destinations, cashtag_timer, send_mode, digest, message, matches):
+        # Every distinct cashtag of the message once, like contract addresses
+        for cashtag in dict.fromkeys(match.value for match in matches if match.kind == CASHTAG):
+            if self._can_forward(job_id, cashtag, "cashtags", cashtag_timer):
+                for cashtag_destination in cashtag_destinations:
+                    self._send_message(cashtag_destination, message, cashtag, send_mode, digest, "cashtags")
+                    logger.info(f"Cashtag forwarded to {cashtag_destination}: {cashtag}")
+
+    def _send_message(self, destination, message, message_text, send_mode='text', digest=None, kind=None):
+        # Queued on the dispatcher, which paces, retries and sends in the background.
+        # 'text' sends only the matched text, 'forward' forwards the original
+        # message with its media and entities. In digest mode matched texts are
+        # collected into one message per destination; forwards are already
+        # batched per source chat by the dispatcher and are never digested.
+        if send_mode == 'forward':
+            self.dispatcher.submit_forward(destination, message)
+        elif digest is not None:
+            self.digests.add(destination, kind, message_text, message.chat_id, *digest)
+        else:
+            self.dispatcher.submit(destination, message_text)
+
+    def _can_forward(self, job_id, content, forward_type, timer):
+        # Checks and starts the job's cooldown in one step; other jobs of the
+        # account matching the same content have cooldowns of their own
+        started = time.perf_counter()
+        allowed = self.cooldowns.check_and_set((job_id, forward_type, content), float(timer or 0))
+        COOLDOWN_SECONDS.labels(forward_type).observe(time.perf_counter() - started)
+        COOLDOWN_CHECKS.labels(forward_type, 'allowed' if allowed else 'suppressed').inc()
+        return allowed
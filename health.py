@@ -0,0 +1,174 @@
+# health.py
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+
+from telethon.tl.functions import PingRequest
+
+from metrics import (CONNECTED, LOOP_LAG_SECONDS, RECONNECTS, RECOVERY_SECONDS, WATCHER_RESTARTS, account_label,
+                     percentile)
+
+logger = logging.getLogger(__name__)
+
+# Seconds between heartbeats, and how long a ping may take before it counts as missed
+HEARTBEAT_INTERVAL = 10
+HEARTBEAT_TIMEOUT = 10
+# Missed pings in a row after which a client that still looks connected is reconnected
+MAX_MISSED_HEARTBEATS = 2
+# Reconnect backoff: doubles from the base delay up to the maximum, with jitter
+RECONNECT_BASE_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+# Seconds the missed messages may take to be replayed before recovery is reported anyway
+RECOVERY_TIMEOUT = 300
+# Seconds without a heartbeat after which a watcher counts as stalled. Above
+# the gap check interval plus the FloodWaits Telethon sleeps through itself.
+STALL_TIMEOUT = 300
+# Heartbeats waking up this many seconds late mean something blocks the event loop
+LOOP_LAG_WARNING = 1.0
+# Recovery times kept for the percentiles reported by stats()
+RECOVERY_SAMPLES = 100
+
+
+class ConnectionSupervisor:
+    """Keeps an account's client connected and its watchers moving.
+
+    Every HEARTBEAT_INTERVAL the client is pinged. A client that dropped, or
+    stopped answering pings, is reconnected with jittered exponential
+    backoff, after which every event feed replays the messages it missed
+    (at most CATCH_UP_CONCURRENCY chats at a time, see EventIngest). The
+    time from noticing the drop to having replayed the gap is the recovery
+    time, exported as forwarder_recovery_seconds.
+
+    Watchers that stopped sending heartbeats are restarted from their
+    cursor, and heartbeats that wake up late are reported as event loop lag.
+    """
+
+    def __init__(self, client, connect, ingest, engines, account, interval=HEARTBEAT_INTERVAL,
+                 timeout=HEARTBEAT_TIMEOUT):
+        self.client = client
+        self.connect = connect  # Coroutine function connecting the client, shared with the web requests
+        self.ingest = ingest
+        self.engines = engines  # Callable returning the WatcherEngines to check for stalls
+        self.account = account  # Phone number, in the logs only
+        self.label = account_label(account)
+        self.interval = interval
+        self.timeout = timeout
+        self.recoveries = deque(maxlen=RECOVERY_SAMPLES)
+        self.reconnects = 0
+        self.watcher_restarts = 0
+        self._missed = 0
+        self._task = None
+        self._connected = CONNECTED.labels(self.label)
+        self._loop_lag = LOOP_LAG_SECONDS.labels(self.label)
+        logger.info(f"Health metrics of {account} are labelled account=\"{self.label}\"")
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            self._loop_lag.set(lag)
+            if lag > LOOP_LAG_WARNING:
+                logger.warning(f"Event loop of {self.account} was blocked for {lag:.1f}s")
+
+            try:
+                if not await self._healthy():
+                    await self._recover()
+                self._restart_stalled()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Health check of {self.account} failed: {e}")
+
+    async def _healthy(self):
+        if not self.client.is_connected():
+            logger.warning(f"Client of {self.account} is disconnected")
+            return False
+        try:
+            await asyncio.wait_for(self._ping(), self.timeout)
+        except Exception as e:
+            self._missed += 1
+            logger.warning(f"Heartbeat {self._missed} of {self.account} missed: {str(e) or type(e).__name__}")
+            return self._missed < MAX_MISSED_HEARTBEATS
+        self._missed = 0
+        self._connected.set(1)
+        return True
+
+    async def _ping(self):
+        await self.client(PingRequest(ping_id=random.getrandbits(63)))
+
+    async def _recover(self):
+        detected = time.monotonic()
+        self._connected.set(0)
+        attempts = 0
+        while True:
+            try:
+                if self.client.is_connected():
+                    # Connected but not answering, start over on a new connection
+                    await self.client.disconnect()
+                await self.connect()
+                await asyncio.wait_for(self._ping(), self.timeout)
+                break
+            except Exception as e:
+                attempts += 1
+                RECONNECTS.labels(self.label, 'failed').inc()
+                delay = backoff_delay(attempts)
+                logger.warning(f"Reconnect {attempts} of {self.account} failed: {str(e) or type(e).__name__}, "
+                               f"retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+
+        self._missed = 0
+        self.reconnects += 1
+        self._connected.set(1)
+        RECONNECTS.labels(self.label, 'succeeded').inc()
+        reconnected_after = time.monotonic() - detected
+
+        self.ingest.resync()
+        replayed = await self.ingest.wait_resynced(RECOVERY_TIMEOUT)
+        recovery = time.monotonic() - detected
+        self.recoveries.append(recovery)
+        RECOVERY_SECONDS.labels(self.label).observe(recovery)
+        if replayed:
+            logger.info(f"Connection of {self.account} recovered in {recovery:.1f}s "
+                        f"(reconnected after {reconnected_after:.1f}s and {attempts} failed attempts)")
+        else:
+            logger.warning(f"Connection of {self.account} is back after {reconnected_after:.1f}s, "
+                           f"but missed messages were still being replayed after {RECOVERY_TIMEOUT}s")
+
+    def _restart_stalled(self):
+        for engine in self.engines():
+            for chat_id in engine.stalled(STALL_TIMEOUT):
+                logger.warning(f"Watcher for chat {chat_id} stalled, restarting it from message "
+                               f"{engine.cursors.get(chat_id)}")
+                self.watcher_restarts += 1
+                WATCHER_RESTARTS.labels(engine.job).inc()
+                engine.restart_chat(chat_id)
+
+    def stats(self):
+        recoveries = sorted(self.recoveries)
+        return {
+            'connected': self.client.is_connected(),
+            'reconnects': self.reconnects,
+            'watcher_restarts': self.watcher_restarts,
+            'recovery_p50': percentile(recoveries, 0.50),
+            'recovery_max': recoveries[-1] if recoveries else None,
+        }
+
+
+def backoff_delay(attempt, base=RECONNECT_BASE_DELAY, maximum=RECONNECT_MAX_DELAY):
+    # Somewhere in the upper half of the exponential delay, so accounts that
+    # lost their connection together do not reconnect in lockstep
+    delay = min(maximum, base * 2 ** (attempt - 1))
+    return random.uniform(delay / 2, delay)
@@ -0,0 +1,268 @@
+# ingest.py
+import asyncio
+import logging
+import time
+
+from telethon import events
+
+from metrics import FETCH_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Seconds between get_messages calls in polling mode
+POLL_INTERVAL = 5
+# Seconds an event feed may stay idle before it checks whether a catch-up is needed
+GAP_CHECK_INTERVAL = 30
+# Messages fetched per get_messages request while catching up
+CATCH_UP_PAGE = 100
+# Most messages replayed by one catch-up; older ones are skipped
+MAX_CATCH_UP = 500
+# Event feeds of one client catching up at the same time, so a reconnect
+# with many watched chats does not fire every catch-up at once
+CATCH_UP_CONCURRENCY = 4
+# Updates waiting per event feed; once full, new ones are dropped and the
+# feed refetches them from its cursor
+FEED_QUEUE_SIZE = 1000
+
+INGEST_MODES = ('events', 'poll')
+
+_fetch_latest_seconds = FETCH_SECONDS.labels('latest')
+_fetch_page_seconds = FETCH_SECONDS.labels('catch_up')
+
+
+async def fetch_latest_id(client, chat_id):
+    started = time.perf_counter()
+    messages = await client.get_messages(chat_id, limit=1)
+    _fetch_latest_seconds.observe(time.perf_counter() - started)
+    return messages[0].id if messages else 0
+
+
+async def fetch_new_messages(client, chat_id, last_message_id, max_messages=MAX_CATCH_UP, page_size=CATCH_UP_PAGE,
+                             before_id=0):
+    # Pages backwards from the newest message (or from before_id), so a long
+    # outage costs at most max_messages / page_size requests instead of one
+    # unbounded fetch
+    messages = []
+    offset_id = before_id
+    while len(messages) < max_messages:
+        limit = min(page_size, max_messages - len(messages))
+        started = time.perf_counter()
+        page = await client.get_messages(chat_id, min_id=last_message_id, offset_id=offset_id, limit=limit)
+        _fetch_page_seconds.observe(time.perf_counter() - started)
+        messages.extend(page)
+        if len(page) < limit:
+            break
+        offset_id = page[-1].id
+    else:
+        logger.warning(f"Catch-up for chat {chat_id} stopped at {max_messages} messages, "
+                       f"older ones after message {last_message_id} may be skipped")
+    # Oldest first, so cursors only ever move forward
+    return list(reversed(messages))
+
+
+class EventIngest:
+    """Routes NewMessage updates of one client to per-chat queues.
+
+    A single handler is registered no matter how many chats are watched,
+    so each update costs one dict lookup instead of one filter per chat.
+    Several jobs may watch the same chat, each gets its own bounded queue.
+    A feed that falls behind loses further updates and is asked to catch
+    up from its cursor instead, so a stalled job cannot grow memory.
+
+    After a reconnect, `resync()` wakes every feed to replay what it missed
+    and `wait_resynced()` returns once they all have.
+    """
+
+    def __init__(self, client, catch_up_concurrency=CATCH_UP_CONCURRENCY):
+        self.client = client
+        self.catch_up_slots = asyncio.Semaphore(catch_up_concurrency)
+        self.reconnects = 0
+        self._queues = {}
+        self._on_overflow = {}  # Queue -> callback asking its feed to catch up
+        self.dropped = 0
+        self._registered = False
+        self._resyncing = set()  # Queues of feeds that have not caught up since the last resync
+        self._resynced = asyncio.Event()
+        self._resynced.set()
+
+    def subscribe(self, chat_id, on_overflow):
+        queue = asyncio.Queue(FEED_QUEUE_SIZE)
+        self._queues.setdefault(chat_id, []).append(queue)
+        self._on_overflow[queue] = on_overflow
+        if not self._registered:
+            self.client.add_event_handler(self._on_new_message, events.NewMessage())
+            self._registered = True
+        return queue
+
+    def unsubscribe(self, chat_id, queue):
+        queues = self._queues.get(chat_id, [])
+        if queue in queues:
+            queues.remove(queue)
+        self._on_overflow.pop(queue, None)
+        if not queues:
+            self._queues.pop(chat_id, None)
+        if not self._queues and self._registered:
+            self.client.remove_event_handler(self._on_new_message)
+            self._registered = False
+        self.caught_up(queue)
+
+    def resync(self):
+        # The client reconnected: every feed checks for missed messages now
+        # instead of at its next update or gap check
+        self.reconnects += 1
+        self._resyncing = {queue for queues in self._queues.values() for queue in queues}
+        if self._resyncing:
+            self._resynced.clear()
+        for queue in self._resyncing:
+            # A full queue wakes its feed anyway
+            if not queue.full():
+                queue.put_nowait(None)
+
+    def caught_up(self, queue):
+        self._resyncing.discard(queue)
+        if not self._resyncing:
+            self._resynced.set()
+
+    async def wait_resynced(self, timeout):
+        # False when some feeds were still catching up after `timeout` seconds
+        try:
+            await asyncio.wait_for(self._resynced.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def _on_new_message(self, event):
+        for queue in self._queues.get(event.chat_id, ()):
+            try:
+                queue.put_nowait(event.message)
+            except asyncio.QueueFull:
+                self.dropped += 1
+                self._on_overflow[queue]()
+
+
+class PollingFeed:
+    """Yields new messages of one chat by calling get_messages on an interval."""
+
+    def __init__(self, client, chat_id, last_message_id, interval=None, heartbeat=None):
+        self.client = client
+        self.chat_id = chat_id
+        self.last_message_id = last_message_id
+        self.interval = interval or POLL_INTERVAL
+        self.heartbeat = heartbeat or _no_heartbeat
+
+    async def messages(self):
+        while True:
+            for message in await fetch_new_messages(self.client, self.chat_id, self.last_message_id):
+                self.last_message_id = max(self.last_message_id, message.id)
+                yield message
+            self.heartbeat()
+            await asyncio.sleep(self.interval)
+
+    def close(self):
+        pass
+
+
+class EventFeed:
+    """Yields new messages of one chat as they are pushed by the update stream.
+
+    Polling is only used to recover the gap left by a reconnect: while the
+    client is disconnected updates are lost, so once it is connected again
+    the chat is fetched from the last seen message ID. A reconnect is
+    noticed either by seeing the client disconnected or through the
+    ingest's reconnect count, which also catches drops shorter than a gap
+    check.
+    """
+
+    def __init__(self, client, ingest, chat_id, last_message_id, gap_check_interval=GAP_CHECK_INTERVAL,
+                 heartbeat=None):
+        self.client = client
+        self.ingest = ingest
+        self.chat_id = chat_id
+        self.last_message_id = last_message_id
+        self.gap_check_interval = gap_check_interval
+        self.heartbeat = heartbeat or _no_heartbeat
+        self.catch_up_pending = False
+        self._queue = ingest.subscribe(chat_id, self._overflowed)
+        self._disconnected = False
+        self._reconnects = ingest.reconnects
+
+    async def messages(self):
+        if self.catch_up_pending:
+            self.catch_up_pending = False
+            for missed in await self.catch_up():
+                yield missed
+
+        while True:
+            try:
+                message = await asyncio.wait_for(self._queue.get(), self.gap_check_interval)
+            except asyncio.TimeoutError:
+                message = None
+            self.heartbeat()
+
+            if self._reconnected() or self.catch_up_pending:
+                self.catch_up_pending = False
+                for missed in await self.catch_up():
+                    yield missed
+                self.ingest.caught_up(self._queue)
+
+            # Messages already delivered by a catch-up are skipped here
+            if message is not None and message.id > self.last_message_id:
+                self.last_message_id = message.id
+                yield message
+
+    async def catch_up(self):
+        async with self.ingest.catch_up_slots:
+            missed = await fetch_new_messages(self.client, self.chat_id, self.last_message_id)
+        if missed:
+            logger.info(f"Recovered {len(missed)} missed messages for chat {self.chat_id}")
+            self.last_message_id = max(self.last_message_id, missed[-1].id)
+        return missed
+
+    def _overflowed(self):
+        # The queue is full: the update is dropped and fetched again by the
+        # catch-up, which also replays whatever is still queued
+        if not self.catch_up_pending:
+            logger.warning(f"Update queue for chat {self.chat_id} is full, catching up from message "
+                           f"{self.last_message_id}")
+        self.catch_up_pending = True
+
+    def _reconnected(self):
+        if not self.client.is_connected():
+            self._disconnected = True
+            return False
+        if self._disconnected or self._reconnects != self.ingest.reconnects:
+            self._disconnected = False
+            self._reconnects = self.ingest.reconnects
+            return True
+        return False
+
+    def close(self):
+        self.ingest.unsubscribe(self.chat_id, self._queue)
+
+
+def _no_heartbeat():
+    pass
+
+
+async def open_feed(client, ingest, chat_id, ingest_mode='events', last_message_id=None, heartbeat=None):
+    # last_message_id resumes a feed from a known cursor instead of the latest
+    # message; heartbeat() is called every time the feed's loop comes around
+    if ingest_mode not in INGEST_MODES:
+        raise ValueError(f"Unknown ingest mode '{ingest_mode}'")
+    if ingest_mode == 'poll':
+        if last_message_id is None:
+            last_message_id = await fetch_latest_id(client, chat_id)
+        return PollingFeed(client, chat_id, last_message_id, heartbeat=heartbeat)
+
+    # Subscribe before reading the cursor so no update falls between the two
+    feed = EventFeed(client, ingest, chat_id, 0, heartbeat=heartbeat)
+    if last_message_id is not None:
+        feed.last_message_id = last_message_id
+        feed.catch_up_pending = True
+        return feed
+    try:
+        feed.last_message_id = await fetch_latest_id(client, chat_id)
+    except Exception:
+        feed.close()
+        raise
+    return feed
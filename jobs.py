@@ -0,0 +1,239 @@
+# jobs.py
+import logging
+import threading
+import uuid
+
+from dispatcher import SEND_MODES
+from ingest import INGEST_MODES
+
+logger = logging.getLogger(__name__)
+
+RUNNING = 'running'
+PAUSED = 'paused'
+BACKING_OFF = 'backing_off'
+STOPPED = 'stopped'
+
+JOB_TYPES = ('keywords', 'solana', 'ethereum', 'cashtags')
+# Spec fields a job can change while it exists; its type is fixed
+UPDATABLE_FIELDS = ('source_chats', 'destinations', 'keywords', 'keyword_timer', 'solana_timer', 'eth_timer',
+                    'cashtag_timer', 'send_mode', 'ingest_mode', 'digest_window', 'digest_size')
+LIST_FIELDS = ('source_chats', 'destinations', 'keywords')
+TIMER_FIELDS = ('keyword_timer', 'solana_timer', 'eth_timer', 'cashtag_timer')
+
+
+def validate_spec(spec):
+    # Checks the fields a spec or a spec update contains and raises ValueError
+    # on the first bad one. Numbers may be given as strings, as the forms send
+    # them, and an empty timer or digest field means it is off.
+    if 'type' in spec and spec['type'] not in JOB_TYPES:
+        raise ValueError(f"Unknown job type '{spec['type']}'")
+    for field in LIST_FIELDS:
+        if field in spec:
+            value = spec[field]
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                raise ValueError(f"'{field}' must be a list of strings")
+    for field in TIMER_FIELDS:
+        if field in spec and _number(spec[field], field, float) < 0:
+            raise ValueError(f"'{field}' must not be negative")
+    for field, kind in (('digest_window', float), ('digest_size', int)):
+        if field in spec and spec[field] not in (None, '') and _number(spec[field], field, kind) <= 0:
+            raise ValueError(f"'{field}' must be positive")
+    if 'send_mode' in spec and spec['send_mode'] not in SEND_MODES:
+        raise ValueError(f"'send_mode' must be one of {list(SEND_MODES)}")
+    if 'ingest_mode' in spec and spec['ingest_mode'] not in INGEST_MODES:
+        raise ValueError(f"'ingest_mode' must be one of {list(INGEST_MODES)}")
+
+
+def _number(value, field, kind):
+    if value is None or value == '':
+        return 0
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"'{field}' must be a number")
+    try:
+        return kind(value)
+    except ValueError:
+        raise ValueError(f"'{field}' must be a number") from None
+
+
+def job_arguments(spec):
+    # Maps a saved job spec to the keyword arguments of forward_messages_to_channel
+    job_type = spec['type']
+    common = {'send_mode': spec.get('send_mode', 'text'), 'ingest_mode': spec.get('ingest_mode', 'events'),
+              'digest_window': spec.get('digest_window'), 'digest_size': spec.get('digest_size')}
+    if job_type == 'keywords':
+        return dict(common, source_chats=spec['source_chats'], destinations=spec['destinations'],
+                    keywords=spec['keywords'], keyword_timer=spec.get('keyword_timer'))
+    if job_type == 'solana':
+        return dict(common, source_chats=[], destinations=[], keywords=[], solana_enabled=True,
+                    solana_source_chats=spec['source_chats'], solana_destinations=spec['destinations'],
+                    solana_timer=spec.get('solana_timer'))
+    if job_type == 'ethereum':
+        return dict(common, source_chats=[], destinations=[], keywords=[], eth_enabled=True,
+                    eth_source_chats=spec['source_chats'], eth_destinations=spec['destinations'],
+                    eth_timer=spec.get('eth_timer'))
+    if job_type == 'cashtags':
+        return dict(common, source_chats=[], destinations=[], keywords=[], cashtag_enabled=True,
+                    cashtag_source_chats=spec['source_chats'], cashtag_destinations=spec['destinations'],
+                    cashtag_timer=spec.get('cashtag_timer'))
+    raise ValueError(f"Unknown job type '{job_type}'")
+
+
+class Job:
+    def __init__(self, job_id, runtime, spec):
+        self.id = job_id
+        self.runtime = runtime
+        self.spec = spec
+        self.state = PAUSED
+        self.error = None
+        self.future = None
+
+    @property
+    def phone_number(self):
+        return self.runtime.phone_number
+
+    def current_state(self):
+        # A running job whose watchers are sleeping through FloodWaits or errors is backing off
+        if self.state == RUNNING:
+            if self.runtime.forwarder.backing_off(self.id):
+                return BACKING_OFF
+        return self.state
+
+
+class JobRegistry:
+    """Forwarding jobs of every account, keyed by a stable UUID.
+
+    Lookups, pauses and stops are dict operations on the job ID, and
+    stopping cancels the job's task on its account runtime directly.
+    Accessed from Flask request threads and runtime loops, so every
+    mutation holds a lock. With a `store`, jobs and their paused/running
+    state are saved so they can be restored at boot; stopped jobs are
+    deleted.
+    """
+
+    def __init__(self, store=None):
+        self.store = store
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, runtime, spec, job_id=None, start=True):
+        validate_spec(spec)
+        job_arguments(spec)
+        job = Job(job_id or uuid.uuid4().hex, runtime, spec)
+        with self._lock:
+            self._jobs[job.id] = job
+        if self.store is not None:
+            self.store.save_job(job.phone_number, job.id, spec, RUNNING if start else PAUSED)
+        if start:
+            self.resume(job.id)
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs(self, phone_number=None):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return [job for job in jobs if phone_number is None or job.phone_number == phone_number]
+
+    def resume(self, job_id):
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.state == RUNNING:
+                return job
+            job.state = RUNNING
+            job.error = None
+        if self.store is not None:
+            self.store.set_job_state(job.id, RUNNING)
+        coro = job.runtime.forwarder.forward_messages_to_channel(
+            job.phone_number, job_id=job.id, **job_arguments(job.spec))
+        job.future = job.runtime.start_job(coro, f"{job.spec['type']} {job.id}")
+        job.future.add_done_callback(lambda done: self._on_exit(job, done))
+        logger.info(f"Started {job.spec['type']} job {job.id} for {job.phone_number}")
+        return job
+
+    def update(self, job_id, changes):
+        # Merges changes into the job's spec and applies them to the running
+        # job without restarting it; a paused job picks them up when resumed.
+        # Returns the fields that actually changed. The spec is only saved once
+        # it is valid and the running job took it.
+        unknown = set(changes) - set(UPDATABLE_FIELDS)
+        if unknown:
+            raise ValueError(f"Fields {sorted(unknown)} cannot be updated")
+        validate_spec(changes)
+        with self._lock:
+            job = self._jobs[job_id]
+            spec = dict(job.spec, **changes)
+            changed = [field for field in changes if job.spec.get(field) != changes[field]]
+            if not changed:
+                return []
+            arguments = job_arguments(spec)
+            running = job.state == RUNNING
+        applied = running and job.runtime.call(job.runtime.forwarder.update_job(job.id, arguments))
+        with self._lock:
+            job.spec = spec
+        if self.store is not None:
+            self.store.save_job(job.phone_number, job.id, spec, RUNNING if running else PAUSED)
+        if running and not applied:
+            # Still starting up, or exited meanwhile: a fresh run reads the new spec
+            self.pause(job.id)
+            self.resume(job.id)
+        logger.info(f"Updated {', '.join(changed)} of {job.spec['type']} job {job.id}")
+        return changed
+
+    def pause(self, job_id):
+        # Paused jobs keep their cursors and resume where they stopped
+        with self._lock:
+            job = self._jobs[job_id]
+            if job.state != RUNNING:
+                return job
+            job.state = PAUSED
+        if self.store is not None:
+            self.store.set_job_state(job.id, PAUSED)
+        job.future.cancel()
+        return job
+
+    def stop(self, job_id):
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return None
+            was_running = job.state == RUNNING
+            job.state = STOPPED
+        if self.store is not None:
+            self.store.delete_job(job.id)
+        if was_running:
+            job.future.cancel()
+        else:
+            self._forget(job)
+        return job
+
+    def release(self, job_id):
+        # Stops the job in this process but leaves its saved state and cursors
+        # alone, so another process can restore it
+        with self._lock:
+            job = self._jobs.pop(job_id, None)
+            if job is None:
+                return None
+            was_running = job.state == RUNNING
+            job.state = PAUSED
+        if was_running:
+            job.future.cancel()
+        return job
+
+    def _on_exit(self, job, future):
+        with self._lock:
+            if future is not job.future:
+                # A run that was paused and already resumed
+                return
+            if job.state == RUNNING:
+                # Exited on its own, e.g. the account is no longer authorized.
+                # It keeps its cursors and can be resumed from the stop page.
+                job.state = PAUSED
+                job.error = "cancelled" if future.cancelled() else future.exception()
+                logger.warning(f"Job {job.id} of {job.phone_number} exited and was paused: {job.error}")
+        if job.state == STOPPED:
+            self._forget(job)
+
+    def _forget(self, job):
+        # Runs on the account loop, after the job's own cleanup has finished
+        job.runtime.loop.call_soon_threadsafe(job.runtime.forwarder.cursors.discard, job.id)
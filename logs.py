@@ -0,0 +1,183 @@
+# logs.py
+import atexit
+import gzip
+import hashlib
+import logging
+import os
+import queue
+import shutil
+import threading
+from logging.handlers import QueueHandler, RotatingFileHandler
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_DIR = "user_logs"
+# Per-user log size before it is rotated into a gzip file, and how many are kept
+MAX_LOG_BYTES = 10 * 1024 * 1024
+LOG_BACKUPS = 5
+# Records waiting for the writer thread before new ones are dropped
+MAX_QUEUED_RECORDS = 10000
+# Most records written between two flushes
+BATCH_SIZE = 256
+# Characters of a message body kept in 'truncate' mode
+BODY_LENGTH = 80
+
+BODY_MODES = ('full', 'truncate', 'hash')
+
+_body_mode = 'full'
+_exception_formatter = logging.Formatter()
+
+
+class _BatchFlush:
+    # The writer thread flushes once per batch instead of once per record
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        super().flush()
+
+
+class BatchStreamHandler(_BatchFlush, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(_BatchFlush, RotatingFileHandler):
+    """Size-rotated log file whose rotated copies are gzip compressed."""
+
+    def __init__(self, filename, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backups)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = _gzip_rotator
+
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the writer thread without ever blocking the caller."""
+
+    def __init__(self, record_queue):
+        super().__init__(record_queue)
+        self.dropped = 0
+
+    def prepare(self, record):
+        # Renders the message in place instead of copying the record; the
+        # writer thread applies the full format
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exception_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogWriter:
+    """Writer thread that drains the log queue in batches.
+
+    Every record goes to the default handlers; records of a per-user logger
+    also go to that user's file. Formatting, disk writes and rotation all
+    happen here, never on an event loop thread.
+    """
+
+    def __init__(self, record_queue):
+        self.queue = record_queue
+        self.default_handlers = []
+        self.routes = {}
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self.queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = None in batch
+            self._write([record for record in batch if record is not None])
+            if stopping:
+                return
+
+    def _write(self, batch):
+        touched = set()
+        for record in batch:
+            handlers = list(self.default_handlers)
+            route = self.routes.get(record.name)
+            if route is not None:
+                handlers.append(route)
+            for handler in handlers:
+                if record.levelno >= handler.level:
+                    handler.handle(record)
+                    touched.add(handler)
+        for handler in touched:
+            try:
+                handler.flush_batch()
+            except Exception:
+                handler.handleError(None)
+
+
+_queue = queue.Queue(MAX_QUEUED_RECORDS)
+_writer = LogWriter(_queue)
+_routes_lock = threading.Lock()
+
+
+def configure_logging(level=logging.INFO, body_mode='full'):
+    # Replaces logging.basicConfig: the root logger only enqueues records
+    global _body_mode
+    if body_mode not in BODY_MODES:
+        raise ValueError(f"Unknown log body mode '{body_mode}'")
+    _body_mode = body_mode
+
+    console = BatchStreamHandler()
+    console.setFormatter(logging.Formatter(LOG_FORMAT))
+    _writer.default_handlers = [console]
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.handlers = [DroppingQueueHandler(_queue)]
+    _writer.start()
+    atexit.register(_writer.stop)
+
+
+def setup_user_logging(phone_number):
+    # Per-user logger writing to user_logs/log_<phone>.log; the file handler is
+    # created once per phone number and shared by later calls
+    logger = logging.getLogger(phone_number)
+    logger.setLevel(logging.INFO)
+    with _routes_lock:
+        if phone_number not in _writer.routes:
+            os.makedirs(LOG_DIR, exist_ok=True)
+            handler = BatchRotatingFileHandler(os.path.join(LOG_DIR, f"log_{phone_number}.log"))
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            _writer.routes[phone_number] = handler
+    return logger
+
+
+def message_body(text):
+    # How much of a message text goes into the logs, see Config.LOG_MESSAGE_BODIES
+    if text is None or _body_mode == 'full':
+        return text
+    if _body_mode == 'hash':
+        return f"sha256:{hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]}"
+    if len(text) > BODY_LENGTH:
+        return text[:BODY_LENGTH] + '...'
+    return text
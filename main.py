@@ -1,279 +1,51 @@
-import time
-import datetime
-import asyncio
-from telethon.sync import TelegramClient
-from telethon import errors
-from flask import Flask, request, render_template, redirect, url_for, session
-import json
+from flask import Flask, Response, jsonify, request, render_template, redirect, stream_with_context, url_for, session
 import os
 import logging
-from collections import defaultdict
 from config import Config
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from jobs import UPDATABLE_FIELDS, validate_spec
+from logs import configure_logging, setup_user_logging
+from metrics import render_collected
+from store import StateStore, migrate_json_files
+from supervisor import AccountService, WorkerPool
+
+# Configure logging; records are written by a background thread, never by the caller
+configure_logging(logging.INFO, body_mode=Config.LOG_MESSAGE_BODIES)
 logger = logging.getLogger(__name__)
 
-# Function to set up user-specific logging
-def setup_user_logging(phone_number):
-    # Create a directory for user logs if it doesn't exist
-    if not os.path.exists("user_logs"):
-        os.makedirs("user_logs")
-    
-    # Define the log file path for the specific user
-    log_file_path = f"user_logs/log_{phone_number}.log"
-    
-    # Set up logging for the user
-    logger = logging.getLogger(phone_number)
-    logger.setLevel(logging.INFO)
-
-    # Create file handler to write logs to user-specific file
-    file_handler = logging.FileHandler(log_file_path)
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    file_handler.setFormatter(formatter)
-    
-    # Remove any existing handlers for the user logger to avoid duplicate logs
-    if logger.hasHandlers():
-        logger.handlers.clear()
-    
-    logger.addHandler(file_handler)
-    return logger
-
-# Global dictionary to track user tasks
-user_tasks = defaultdict(list)  # Maps user IDs to their tasks
+# Accounts, jobs, cursors and cooldowns; JSON files of earlier versions are imported once
+state_store = StateStore(Config.STATE_DB)
+migrate_json_files(state_store)
+
+# Accounts run in this process, or sharded across worker processes that the
+# app only talks to over pipes
+if Config.WORKER_PROCESSES > 0:
+    accounts = WorkerPool(Config.WORKER_PROCESSES, state_store, Config.STATE_DB, Config.LOG_MESSAGE_BODIES)
+else:
+    accounts = AccountService(state_store)
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
 # Access the secret key if needed
 app.secret_key = app.config['SECRET_KEY']
-class TelegramForwarder:
-    def __init__(self, api_id, api_hash, phone_number):
-        self.api_id = api_id
-        self.api_hash = api_hash
-        self.phone_number = phone_number
-        self.client = TelegramClient('session_' + phone_number, api_id, api_hash)
-        self.active_tasks = []  # List to track active forwarding tasks
-        self.last_forwarded_keywords = {}
-        self.last_forwarded_solana = {}
-        self.last_forwarded_ethereum = {}
-        self.last_forwarded_cashtags = {}
-
-    async def list_chats(self):
-        await self.client.connect()
-
-        if not await self.client.is_user_authorized():
-            await self.client.send_code_request(self.phone_number)
-            await self.client.sign_in(self.phone_number, input('Enter the code: '))
-
-        dialogs = await self.client.get_dialogs()
-        chats_list = []
-        for dialog in dialogs:
-            username = getattr(dialog.entity, 'username', 'N/A')  # Safely check for username attribute
-            chats_list.append(f"Chat ID: {dialog.id}, Title: {dialog.title}, Username: {username}")
-        
-        logger.info("List of groups printed successfully!")
-        return chats_list
-
-    async def forward_messages_to_channel(self, user_id, source_chats, destinations, keywords,
-                                          solana_enabled=False, solana_source_chats=None, solana_destinations=None, solana_timer=None,
-                                          eth_enabled=False, eth_source_chats=None, eth_destinations=None, eth_timer=None,
-                                          cashtag_enabled=False, cashtag_source_chats=None, cashtag_destinations=None, cashtag_timer=None,
-                                          keyword_timer=None):
-        task = asyncio.current_task()
-        self.active_tasks.append(task)
-
-        await self.client.connect()
-
-        if not await self.client.is_user_authorized():
-            await self.client.send_code_request(self.phone_number)
-            await self.client.sign_in(self.phone_number, input('Enter the code: '))
-
-        for source_chat in source_chats:
-            if isinstance(source_chat, str) and source_chat.lstrip('-').isdigit():
-                source_chat_id = int(source_chat)
-            elif isinstance(source_chat, str):
-                try:
-                    source_chat_id = await self._get_chat_id_from_title(source_chat)
-                    logger.info(f"Found chat ID for '{source_chat}': {source_chat_id}")
-                except ValueError as e:
-                    continue
-            else:
-                source_chat_id = source_chat
-
-            last_message_id = (await self.client.get_messages(source_chat_id, limit=1))[0].id
-            while True:
-                if task.cancelled():
-                    break
-
-                messages = await self.client.get_messages(source_chat_id, min_id=last_message_id, limit=None)
-                for message in reversed(messages):
-                    if keywords and message.text and any(keyword in message.text.lower() for keyword in keywords):
-                        if self._can_forward(message.text, "keywords", keyword_timer):
-                            for destination in destinations:
-                                await self._send_message(destination, message.text, False)
-                                logger.info(f"Message forwarded to channel/chat ID {destination}: {message.text}")
-                            self._update_forward_time(message.text, "keywords")
-                    last_message_id = max(last_message_id, message.id)
-                await asyncio.sleep(5)
-
-        # Forward Solana contract messages
-        if solana_enabled:
-            for solana_source_chat in solana_source_chats:
-                if isinstance(solana_source_chat, str) and solana_source_chat.lstrip('-').isdigit():
-                    solana_source_chat_id = int(solana_source_chat)
-                elif isinstance(solana_source_chat, str):
-                    try:
-                        solana_source_chat_id = await self._get_chat_id_from_title(solana_source_chat)
-                    except ValueError as e:
-                        continue
-                else:
-                    solana_source_chat_id = solana_source_chat
-
-                last_message_id = (await self.client.get_messages(solana_source_chat_id, limit=1))[0].id
-                while True:
-                    if task.cancelled():
-                        break
-
-                    messages = await self.client.get_messages(solana_source_chat_id, min_id=last_message_id, limit=None)
-                    for message in reversed(messages):
-                        solana_contract = self._find_solana_contract(message.text)
-                        if solana_contract and self._can_forward(solana_contract, "solana", solana_timer):
-                            for solana_destination in solana_destinations:
-                                await self._send_message(solana_destination, solana_contract, False)
-                                logger.info(f"Solana contract forwarded to {solana_destination}: {solana_contract}")
-                            self._update_forward_time(solana_contract, "solana")
-                    last_message_id = max(last_message_id, message.id)
-                await asyncio.sleep(5)
-
-        # Forward Ethereum contract messages
-        if eth_enabled:
-            for eth_source_chat in eth_source_chats:
-                if isinstance(eth_source_chat, str) and eth_source_chat.lstrip('-').isdigit():
-                    eth_source_chat_id = int(eth_source_chat)
-                elif isinstance(eth_source_chat, str):
-                    try:
-                        eth_source_chat_id = await self._get_chat_id_from_title(eth_source_chat)
-                    except ValueError as e:
-                        continue
-                else:
-                    eth_source_chat_id = eth_source_chat
-
-                last_message_id = (await self.client.get_messages(eth_source_chat_id, limit=1))[0].id
-                while True:
-                    if task.cancelled():
-                        break
-
-                    messages = await self.client.get_messages(eth_source_chat_id, min_id=last_message_id, limit=None)
-                    for message in reversed(messages):
-                        eth_contract = self._find_ethereum_contract(message.text)
-                        if eth_contract and self._can_forward(eth_contract, "ethereum", eth_timer):
-                            for eth_destination in eth_destinations:
-                                await self._send_message(eth_destination, eth_contract, False)
-                                logger.info(f"Ethereum contract forwarded to {eth_destination}: {eth_contract}")
-                            self._update_forward_time(eth_contract, "ethereum")
-                    last_message_id = max(last_message_id, message.id)
-                await asyncio.sleep(5)
-
-        # Forward Cashtag messages
-        if cashtag_enabled:
-            for cashtag_source_chat in cashtag_source_chats:
-                if isinstance(cashtag_source_chat, str) and cashtag_source_chat.lstrip('-').isdigit():
-                    cashtag_source_chat_id = int(cashtag_source_chat)
-                elif isinstance(cashtag_source_chat, str):
-                    try:
-                        cashtag_source_chat_id = await self._get_chat_id_from_title(cashtag_source_chat)
-                    except ValueError as e:
-                        continue
-                else:
-                    cashtag_source_chat_id = cashtag_source_chat
-
-                last_message_id = (await self.client.get_messages(cashtag_source_chat_id, limit=1))[0].id
-                while True:
-                    if task.cancelled():
-                        break
-
-                    messages = await self.client.get_messages(cashtag_source_chat_id, min_id=last_message_id, limit=None)
-                    for message in reversed(messages):
-                        cashtags = self._find_cashtag(message.text)
-                        if cashtags:
-                            for cashtag in cashtags:
-                                if self._can_forward(cashtag, "cashtags", cashtag_timer):
-                                    for cashtag_destination in cashtag_destinations:
-                                        await self._send_message(cashtag_destination, cashtag, False)
-                                        logger.info(f"Cashtag forwarded to {cashtag_destination}: {cashtag}")
-                                    self._update_forward_time(cashtag, "cashtags")
-                    last_message_id = max(last_message_id, message.id)
-                await asyncio.sleep(5)
-
-        self.active_tasks.remove(task)
-
-    async def _send_message(self, destination, message_text, is_bot):
-        try:
-            if is_bot:
-                await self.client.send_message(destination, message_text)
-            else:
-                await self.client.send_message(destination, message_text)
-        except errors.FloodWaitError as e:
-            await asyncio.sleep(e.seconds)
-        except Exception as e:
-            logger.error(f"An error occurred while forwarding the message: {e}")
 
-    async def stop_forwarding_job(self, job_number):
-        try:
-            task = self.active_tasks[job_number]
-            task.cancel()
-            logger.info(f"Forwarding job {job_number + 1} has been stopped.")
-        except IndexError:
-            logger.error("Invalid job number. Please try again.")
-
-    def _find_solana_contract(self, text):
-        import re
-        solana_pattern = r'[1-9A-HJ-NP-Za-km-z]{32,44}'
-        matches = re.findall(solana_pattern, text)
-        return matches[0] if matches else None
-
-    def _find_ethereum_contract(self, text):
-        import re
-        eth_pattern = r'0x[a-fA-F0-9]{40}'
-        matches = re.findall(eth_pattern, text)
-        return matches[0] if matches else None
-
-    def _find_cashtag(self, text):
-        import re
-        cashtag_pattern = r'\$[A-Z]+'
-        return re.findall(cashtag_pattern, text)
-
-    def _can_forward(self, content, forward_type, timer):
-        current_time = time.time()
-        last_forwarded = getattr(self, f'last_forwarded_{forward_type}').get(content, 0)
-        if current_time - last_forwarded >= float(timer):
-            return True
-        return False
-
-    def _update_forward_time(self, content, forward_type):
-        getattr(self, f'last_forwarded_{forward_type}')[content] = time.time()
-
-    async def _get_chat_id_from_title(self, chat_title):
-        dialogs = await self.client.get_dialogs()
-        for dialog in dialogs:
-            if dialog.title == chat_title:
-                return dialog.id
-        raise ValueError(f"Chat with title '{chat_title}' not found")
+# Largest /list_chats page, and chats fetched from the account per streamed chunk
+MAX_CHATS_PER_PAGE = 1000
+CHAT_STREAM_CHUNK = 50
 
 def read_credentials(phone_number):
-    try:
-        filename = f"config_{phone_number}.json"
-        with open(filename, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        logger.error(f"Config file for {phone_number} not found.")
-        return None
-
-def save_config(data, phone_number):
-    filename = f"config_{phone_number}.json"
-    with open(filename, "w") as file:
-        json.dump(data, file)
+    config = state_store.get_account(phone_number)
+    if config is None:
+        logger.error(f"Config for {phone_number} not found.")
+    return config
+
+def stream_template(template_name, **context):
+    # render_template, but sent while it renders; generators in the context
+    # are consumed as the template reaches them
+    app.update_template_context(context)
+    template = app.jinja_env.get_template(template_name)
+    return Response(stream_with_context(template.stream(context)), mimetype='text/html')
+
 ########
 @app.route('/auth', methods=['GET', 'POST'])
 def auth():
@@ -289,40 +61,23 @@ def auth():
             'api_hash': api_hash,
             'phone_number': phone_number
         }
-        save_config(config, phone_number)
-
-        async def connect_and_auth():
-            client = TelegramClient('session_' + phone_number, api_id, api_hash)
-            await client.connect()
-            if not await client.is_user_authorized():
-                try:
-                    result = await client.send_code_request(phone_number)
-                    # Save phone_code_hash in the session for later use
-                    session['phone_code_hash'] = result.phone_code_hash
-                    print(f"Stored phone code hash: {session['phone_code_hash']}")  # Debug statement
-                    return False, "Authorization required"
-                except Exception as e:
-                    user_logger.error(f"Error sending code: {e}")
-                    return False, f"Error sending code: {e}"
-            return True, None
 
         try:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            is_authorized, message = loop.run_until_complete(connect_and_auth())
-
-            if not is_authorized:
-                return render_template('auth.html', error=message, phone_number=phone_number)
-
-            session['phone_number'] = phone_number
-            user_logger.info("User authenticated successfully.")
-            return redirect(url_for('verify_code'))  # Redirect to the verification page
-
+            phone_code_hash = accounts.send_code(config)
         except Exception as e:
             user_logger.error(f"Invalid credentials: {e}")
             return render_template('auth.html', error="Invalid credentials, please try again.")
-        finally:
-            loop.close()
+        # Saved once they work, so a typo is not restored on the next start
+        state_store.save_account(phone_number, api_id, api_hash)
+
+        if phone_code_hash:
+            # Save phone_code_hash in the session for later use
+            session['phone_code_hash'] = phone_code_hash
+            return render_template('auth.html', error="Authorization required", phone_number=phone_number)
+
+        session['phone_number'] = phone_number
+        user_logger.info("User authenticated successfully.")
+        return redirect(url_for('menu'))
 
     return render_template('auth.html')
 
@@ -330,38 +85,23 @@ def auth():
 def verify_code():
     phone_number = request.form['phone_number']
     code = request.form['code']
-    
+
     config = read_credentials(phone_number)
     if not config:
         return render_template('auth.html', error="Configuration not found. Please authenticate again.")
 
-    async def sign_in(phone, code, config):
-        client = TelegramClient('session_' + phone, config['api_id'], config['api_hash'])
-        await client.connect()
-        try:
-            # Retrieve the stored phone_code_hash
-            phone_code_hash = session.get('phone_code_hash')
-            if not phone_code_hash:
-                return False, "Phone code hash not found. Please restart the authentication process."
-
-            # Use phone, code, and phone_code_hash to sign in
-            await client.sign_in(phone, code, phone_code_hash)
-            return True, None
-        except Exception as e:
-            return False, str(e)
+    # Retrieve the stored phone_code_hash
+    phone_code_hash = session.get('phone_code_hash')
+    if not phone_code_hash:
+        return render_template('auth.html', error="Failed to verify: Phone code hash not found. Please restart the authentication process.", phone_number=phone_number)
 
     try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        success, error = loop.run_until_complete(sign_in(phone_number, code, config))
-
-        if success:
-            session['phone_number'] = phone_number
-            return redirect(url_for('menu'))
-        else:
-            return render_template('auth.html', error=f"Failed to verify: {error}", phone_number=phone_number)
-    finally:
-        loop.close()
+        accounts.sign_in(config, code, phone_code_hash)
+    except Exception as e:
+        return render_template('auth.html', error=f"Failed to verify: {e}", phone_number=phone_number)
+
+    session['phone_number'] = phone_number
+    return redirect(url_for('menu'))
 
 ########
 
@@ -381,19 +121,30 @@ def list_chats():
         logger.error(f"Configuration not found for phone number: {phone_number}")
         return "Configuration not found for this phone number.", 400
 
-    forwarder = TelegramForwarder(config['api_id'], config['api_hash'], config['phone_number'])
-
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        chats = loop.run_until_complete(forwarder.list_chats())
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', Config.CHATS_PER_PAGE, type=int), 1), MAX_CHATS_PER_PAGE)
+    offset = (page - 1) * per_page
+    # Filled in while the rows are streamed, read by the pagination below them
+    listing = {'total': None, 'error': None}
+
+    def chats():
+        fetched = 0
+        while fetched < per_page:
+            limit = min(CHAT_STREAM_CHUNK, per_page - fetched)
+            try:
+                chunk, listing['total'] = accounts.list_chats(config, offset + fetched, limit)
+            except Exception as e:
+                logger.error(f"Error listing chats: {e}")
+                listing['error'] = e
+                return
+            yield from chunk
+            fetched += len(chunk)
+            if len(chunk) < limit:
+                break
         logger.info("Chats retrieved successfully.")
-        return render_template('list_chats.html', chats=chats)
-    except Exception as e:
-        logger.error(f"Error listing chats: {e}")
-        return f"Error listing chats: {e}", 500
-    finally:
-        loop.close()
+
+    # The page head goes out before Telegram answers, rows follow chunk by chunk
+    return stream_template('list_chats.html', chats=chats(), listing=listing, page=page, per_page=per_page)
 
 @app.route('/start_forwarding', methods=['GET', 'POST'])
 def start_forwarding():
@@ -407,6 +158,10 @@ def start_forwarding():
         destinations = request.form.getlist('destinations')
         keywords = request.form['keywords'].split(',')
         keyword_timer = request.form['keyword_timer']
+        send_mode = request.form.get('send_mode', 'text')
+        # Digest mode is on when a window is given; the size falls back to the aggregator's default
+        digest_window = request.form.get('digest_window') or None
+        digest_size = request.form.get('digest_size') or None
 
         solana_enabled = 'solana_enabled' in request.form
         solana_source_chats = request.form.getlist('solana_source_chats') if solana_enabled else []
@@ -428,69 +183,62 @@ def start_forwarding():
             logger.error(f"Configuration not found for phone number: {phone_number}")
             return "Configuration not found for this phone number.", 400
 
-        forwarder = TelegramForwarder(config['api_id'], config['api_hash'], config['phone_number'])
-
-        def start_task(forward_function, *args):
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            loop.run_until_complete(forward_function(*args))
-
-        task_list = []
-
+        specs = []
         if keywords:
-            task_id = len(config.get('tasks', [])) + 1
-            import threading
-            threading.Thread(target=start_task, args=(forwarder.forward_messages_to_channel, phone_number, source_chats, destinations, keywords, keyword_timer), daemon=True).start()
-            task_list.append({
-                'task_id': task_id,
+            specs.append({
                 'type': 'keywords',
                 'source_chats': source_chats,
                 'destinations': destinations,
                 'keywords': keywords,
-                'keyword_timer': keyword_timer
+                'keyword_timer': keyword_timer,
+                'send_mode': send_mode,
+                'digest_window': digest_window,
+                'digest_size': digest_size
             })
-            logger.info(f"Started keyword forwarding task with ID: {task_id}")
-
         if solana_enabled:
-            task_id = len(config.get('tasks', [])) + 1
-            threading.Thread(target=start_task, args=(forwarder.forward_messages_to_channel, phone_number, solana_source_chats, solana_destinations, [], True, None, None, solana_timer), daemon=True).start()
-            task_list.append({
-                'task_id': task_id,
+            specs.append({
                 'type': 'solana',
                 'source_chats': solana_source_chats,
                 'destinations': solana_destinations,
-                'solana_timer': solana_timer
+                'solana_timer': solana_timer,
+                'send_mode': send_mode,
+                'digest_window': digest_window,
+                'digest_size': digest_size
             })
-            logger.info(f"Started Solana forwarding task with ID: {task_id}")
-
         if eth_enabled:
-            task_id = len(config.get('tasks', [])) + 1
-            threading.Thread(target=start_task, args=(forwarder.forward_messages_to_channel, phone_number, eth_source_chats, eth_destinations, [], False, None, None, None, True, None, None, eth_timer), daemon=True).start()
-            task_list.append({
-                'task_id': task_id,
+            specs.append({
                 'type': 'ethereum',
                 'source_chats': eth_source_chats,
                 'destinations': eth_destinations,
-                'eth_timer': eth_timer
+                'eth_timer': eth_timer,
+                'send_mode': send_mode,
+                'digest_window': digest_window,
+                'digest_size': digest_size
             })
-            logger.info(f"Started Ethereum forwarding task with ID: {task_id}")
-
         if cashtag_enabled:
-            task_id = len(config.get('tasks', [])) + 1
-            threading.Thread(target=start_task, args=(forwarder.forward_messages_to_channel, phone_number, cashtag_source_chats, cashtag_destinations, [], False, None, None, None, False, None, None, None, True, None, None, cashtag_timer), daemon=True).start()
-            task_list.append({
-                'task_id': task_id,
+            specs.append({
                 'type': 'cashtags',
                 'source_chats': cashtag_source_chats,
                 'destinations': cashtag_destinations,
-                'cashtag_timer': cashtag_timer
+                'cashtag_timer': cashtag_timer,
+                'send_mode': send_mode,
+                'digest_window': digest_window,
+                'digest_size': digest_size
             })
-            logger.info(f"Started Cashtag forwarding task with ID: {task_id}")
 
-        if 'tasks' not in config:
-            config['tasks'] = []
-        config['tasks'].extend(task_list)
-        save_config(config, phone_number)
+        for spec in specs:
+            try:
+                validate_spec(spec)
+            except ValueError as e:
+                logger.error(f"Invalid {spec['type']} forwarding job: {e}")
+                return f"Invalid forwarding job: {e}", 400
+        for spec in specs:
+            try:
+                job_id = accounts.create_job(config, spec)
+            except Exception as e:
+                logger.error(f"Error starting {spec['type']} forwarding job: {e}")
+                return f"Error starting forwarding: {e}", 500
+            logger.info(f"Started {spec['type']} forwarding job with ID: {job_id}")
 
         return redirect(url_for('menu'))
 
@@ -503,42 +251,88 @@ def stop_forwarding():
         logger.error("Phone number not found in session.")
         return "Phone number not found in session. Please authenticate first.", 400
 
-    config = read_credentials(phone_number)
-    if not config:
-        logger.error(f"Configuration not found for phone number: {phone_number}")
-        return "Configuration not found for this phone number.", 400
-
-    forwarder = TelegramForwarder(config['api_id'], config['api_hash'], config['phone_number'])
-
     if request.method == 'POST':
-        task_id = int(request.form['task_id'])
-        task_list = config.get('tasks', [])
+        job_id = request.form['job_id']
+        action = request.form.get('action', 'stop')
 
-        if task_id < 1 or task_id > len(task_list):
-            logger.error("Invalid task ID received during stop request.")
-            return "Invalid task ID, please try again."
+        if not accounts.control_job(phone_number, job_id, action):
+            logger.error("Invalid job ID received during stop request.")
+            return "Invalid job ID, please try again."
 
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(forwarder.stop_forwarding_job(task_id - 1))
-
-        task_list.pop(task_id - 1)
-        config['tasks'] = task_list
-        save_config(config, phone_number)
-
-        logger.info(f"Stopped forwarding task with ID: {task_id}")
+        logger.info(f"Applied '{action}' to forwarding job with ID: {job_id}")
         return redirect(url_for('menu'))
 
-    task_list = config.get('tasks', [])
-    if not task_list:
+    jobs = accounts.list_jobs(phone_number)
+    if not jobs:
         logger.warning("No active forwarding tasks to stop.")
         return "No active forwarding tasks to stop."
 
-    return render_template('stop_forwarding.html', tasks=task_list)
+    return render_template('stop_forwarding.html', jobs=jobs)
+
+@app.route('/jobs/<job_id>', methods=['GET', 'POST'])
+def job_config(job_id):
+    # GET returns the job's spec. POST takes a JSON object with the spec
+    # fields to change (the whole spec may be sent back, unchanged fields are
+    # skipped) and applies it to the running job without restarting it.
+    phone_number = session.get('phone_number')
+    if not phone_number:
+        logger.error("Phone number not found in session.")
+        return jsonify(error="Phone number not found in session. Please authenticate first."), 400
+
+    if request.method == 'GET':
+        for job in accounts.list_jobs(phone_number):
+            if job['id'] == job_id:
+                return jsonify(job['spec'])
+        return jsonify(error="Invalid job ID"), 404
+
+    changes = request.get_json(silent=True)
+    if not isinstance(changes, dict):
+        return jsonify(error="Expected a JSON object of spec fields"), 400
+    # A job keeps its type, the field is ignored when a whole spec is sent back
+    changes.pop('type', None)
+    unknown = sorted(set(changes) - set(UPDATABLE_FIELDS))
+    if unknown:
+        return jsonify(error=f"Fields {unknown} cannot be updated"), 400
+    try:
+        validate_spec(changes)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+
+    try:
+        changed = accounts.update_job(phone_number, job_id, changes)
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    except Exception as e:
+        logger.error(f"Error updating job {job_id}: {e}")
+        return jsonify(error=f"Error updating job: {e}"), 500
+    if changed is None:
+        logger.error("Invalid job ID received during update request.")
+        return jsonify(error="Invalid job ID"), 404
+
+    logger.info(f"Updated forwarding job {job_id}: {changed}")
+    return jsonify(job_id=job_id, changed=changed)
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_collected(accounts.metrics()), mimetype='text/plain; version=0.0.4')
+
+@app.route('/profile')
+def profile():
+    # /profile?action=start[&interval=0.01], /profile?action=stop, /profile for the collapsed stacks.
+    # Profiling slows down every account of the process, so it needs a logged-in session.
+    if not session.get('phone_number'):
+        logger.error("Phone number not found in session.")
+        return "Phone number not found in session. Please authenticate first.", 400
+    report = accounts.profile(request.args.get('action'), request.args.get('interval', type=float),
+                              request.args.get('limit', type=int))
+    return Response(report, mimetype='text/plain')
 
 @app.route('/exit')
 def exit():
     return render_template('goodbye.html')
 
 if __name__ == "__main__":
+    # The debug reloader serves from a child process, only that one runs the jobs
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        accounts.start()
     app.run(debug=True, host='0.0.0.0', port=5000)
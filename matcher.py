@@ -0,0 +1,234 @@
+# matcher.py
+import re
+from collections import deque, namedtuple
+from functools import partial
+
+from contracts import BASE58_ALPHABET, is_ethereum_address, is_solana_address
+
+try:
+    import ahocorasick  # pyahocorasick, optional C implementation of the automaton
+except ImportError:
+    ahocorasick = None
+
+KEYWORD = 'keyword'
+SOLANA = 'solana'
+ETHEREUM = 'ethereum'
+CASHTAG = 'cashtag'
+
+# Addresses must not be slices of longer tokens, or a 64-digit transaction hash
+# or an 88-character signature would give a valid-looking candidate. The
+# Ethereum lookbehind comes after the 0x, so the pattern still starts with a
+# literal that re searches for at C speed instead of trying every position.
+SOLANA_PATTERN = r'(?<![0-9A-Za-z])[1-9A-HJ-NP-Za-km-z]{32,44}(?![0-9A-Za-z])'
+ETHEREUM_PATTERN = r'0x(?<![0-9A-Za-z]0x)[a-fA-F0-9]{40}(?![0-9A-Za-z])'
+CASHTAG_PATTERN = r'\$[A-Z]+'
+
+# Shortest Solana candidate. Base58 characters map to 1 and everything else to
+# 0, so a candidate can only start where the mapped bytes have this many 1s in
+# a row, which bytes.translate and find locate at C speed
+MIN_SOLANA_LENGTH = 32
+_BASE58_CLASS = bytes(1 if chr(byte) in BASE58_ALPHABET else 0 for byte in range(256))
+_SOLANA_RUN = b'\x01' * MIN_SOLANA_LENGTH
+
+
+def _base58_run_start(text):
+    # Non-ASCII characters become bytes of class 0 and end a run, as they do
+    # for the pattern. They also shift byte offsets, so such texts are scanned
+    # from the start.
+    start = text.encode('utf-8', 'ignore').translate(_BASE58_CLASS).find(_SOLANA_RUN)
+    return start if start <= 0 or text.isascii() else 0
+
+
+# (kind, pattern, locate, validator): locate is a cheap scan returning where
+# the first candidate can start, or -1 when there is none, so most messages
+# skip the pattern and the others skip their head. The validator drops
+# candidates that are not real addresses.
+_EXTRACTORS = (
+    (ETHEREUM, re.compile(ETHEREUM_PATTERN), lambda text: text.find('0x'), is_ethereum_address),
+    (CASHTAG, re.compile(CASHTAG_PATTERN), lambda text: text.find('$'), None),
+    (SOLANA, re.compile(SOLANA_PATTERN), _base58_run_start, is_solana_address),
+)
+
+Match = namedtuple('Match', ['kind', 'value', 'start', 'end'])
+# Skips namedtuple's argument handling, which dominates the cost of busy messages
+_new_match = partial(tuple.__new__, Match)
+# Up to this many keywords, one str.find per keyword beats walking the
+# automaton, which hands every occurrence back to Python (measured with
+# benchmarks/matcher_bench.py; the pure-Python automaton also walks every character)
+SCAN_KEYWORDS = 32 if ahocorasick is not None else 150
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton finding the keywords contained in a text in one pass."""
+
+    def __init__(self, keywords):
+        self.keywords = list(dict.fromkeys(keywords))
+        # The empty keyword is contained in every text, as it is for `in`
+        self._match_empty = '' in self.keywords
+        words = self._words = [keyword for keyword in self.keywords if keyword]
+
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for word in words:
+                self._automaton.add_word(word, (word, len(word)))
+            if words:
+                self._automaton.make_automaton()
+            return
+
+        self._automaton = None
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for word in words:
+            self._add(word)
+        self._link()
+
+    def _add(self, word):
+        node = 0
+        for char in word:
+            following = self._goto[node].get(char)
+            if following is None:
+                following = len(self._goto)
+                self._goto[node][char] = following
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(())
+            node = following
+        self._output[node] = (word,)
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, following in self._goto[node].items():
+                queue.append(following)
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[following] = self._goto[fail].get(char, 0)
+                self._output[following] += self._output[self._fail[following]]
+
+    def find(self, text):
+        # [(start, end, keyword)] with the first occurrence of every keyword
+        # in the text, in text order. Later occurrences are not reported.
+        found = [(0, 0, '')] if self._match_empty else []
+        if len(self._words) <= SCAN_KEYWORDS:
+            for word in self._words:
+                start = text.find(word)
+                if start >= 0:
+                    found.append((start, start + len(word), word))
+            found.sort()
+            return found
+
+        seen = set()
+        remaining = len(self._words)
+        if self._automaton is not None:
+            for end, (word, length) in self._automaton.iter(text):
+                if word not in seen:
+                    seen.add(word)
+                    found.append((end + 1 - length, end + 1, word))
+                    remaining -= 1
+                    if not remaining:
+                        break
+            # Keywords ending at the same index do not come out in start order
+            found.sort()
+            return found
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for word in output[node]:
+                if word not in seen:
+                    seen.add(word)
+                    found.append((index + 1 - len(word), index + 1, word))
+                    remaining -= 1
+            if not remaining:
+                break
+        found.sort()
+        return found
+
+    def first(self, text):
+        # [(start, end, keyword)] of one keyword contained in the text, the
+        # first one found rather than the first in the text, or [] for none.
+        # Stops there, as `any(keyword in text ...)` did.
+        if self._match_empty:
+            return [(0, 0, '')]
+        if len(self._words) <= SCAN_KEYWORDS:
+            for word in self._words:
+                start = text.find(word)
+                if start >= 0:
+                    return [(start, start + len(word), word)]
+            return []
+
+        if self._automaton is not None:
+            for end, (word, length) in self._automaton.iter(text):
+                return [(end + 1 - length, end + 1, word)]
+            return []
+
+        goto, fail, output = self._goto, self._fail, self._output
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                word = output[node][0]
+                return [(index + 1 - len(word), index + 1, word)]
+        return []
+
+
+class MessageMatcher:
+    """Precompiled matcher for every rule type of a forwarding job.
+
+    Keywords are looked up in the lowercased text through a KeywordAutomaton,
+    with the same semantics as the old `keyword in text.lower()` check, so
+    past SCAN_KEYWORDS the cost per message no longer grows with the number
+    of keywords. Each keyword is reported once, at its first occurrence.
+    With `any_keyword` the lookup stops at the first keyword it finds, which
+    is all a chat read by a single keyword rule needs.
+    Address and cashtag extractors are compiled once at import time; each
+    runs as its own C-level scan, which measured faster than one combined
+    alternation that has to try every branch at every position. Every
+    address found is returned once it passes its chain's checks (base58
+    decoding to 32 bytes for Solana, the EIP-55 checksum for Ethereum), and
+    results are cached per address.
+    """
+
+    def __init__(self, keywords=(), solana=False, ethereum=False, cashtags=False, any_keyword=False):
+        self.automaton = KeywordAutomaton(keywords) if keywords else None
+        self.any_keyword = any_keyword
+        enabled = {SOLANA: solana, ETHEREUM: ethereum, CASHTAG: cashtags}
+        self.extractors = [extractor for extractor in _EXTRACTORS if enabled[extractor[0]]]
+
+    def find(self, text):
+        if not text:
+            return []
+
+        matches = []
+        kinds = 0
+        if self.automaton is not None:
+            lookup = self.automaton.first if self.any_keyword else self.automaton.find
+            matches = [_new_match((KEYWORD, word, start, end)) for start, end, word in lookup(text.lower())]
+            kinds = 1 if matches else 0
+        for kind, pattern, locate, validate in self.extractors:
+            start = locate(text)
+            if start < 0:
+                continue
+            found = [_new_match((kind, match.group(), match.start(), match.end()))
+                     for match in pattern.finditer(text, start)]
+            if validate is not None:
+                found = [match for match in found if validate(match.value)]
+            if found:
+                matches += found
+                kinds += 1
+        # Every kind is in text order already, only a mix of kinds needs sorting
+        if kinds > 1:
+            matches.sort(key=_start)
+        return matches
+
+
+def _start(match):
+    return match.start
@@ -0,0 +1,251 @@
+# metrics.py
+import bisect
+import hashlib
+import hmac
+import sys
+import threading
+from collections import Counter as _Tally
+
+from config import Config
+
+# Upper bounds in seconds, from sub-millisecond matching up to long FloodWaits
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Seconds between stack samples taken by SamplingProfiler
+PROFILE_INTERVAL = 0.005
+# Shorter intervals are raised to this, sampling every thread takes the GIL each time
+MIN_PROFILE_INTERVAL = 0.001
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames, new_child):
+        # new_child(lock) builds the value kept for each label combination
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._new_child = new_child
+        self._children = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def labels(self, *values):
+        # Children are cached, hot paths may also keep the child around
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child(self._lock))
+        return child
+
+    def _label_text(self, const_labels, values, extra=()):
+        pairs = list(const_labels) + list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ''
+        return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+    def collect(self, const_labels=()):
+        # (header lines, sample lines); const_labels tell apart worker processes
+        header = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        samples = [line for values, child in children for line in self._render_child(const_labels, values, child)]
+        return header, samples
+
+
+class _Value:
+    def __init__(self, lock):
+        self._lock = lock
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        self.value = value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames, _Value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def _render_child(self, const_labels, values, child):
+        yield f"{self.name}{self._label_text(const_labels, values)} {child.value}"
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value):
+        self.labels().set(value)
+
+
+class _Buckets:
+    def __init__(self, lock, bounds):
+        self._lock = lock
+        self.bounds = bounds
+        # One slot per bound plus +Inf; cumulated only when rendered
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, lambda lock: _Buckets(lock, self.buckets))
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def _render_child(self, const_labels, values, child):
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), child.counts):
+            cumulative += count
+            yield f"{self.name}_bucket{self._label_text(const_labels, values, [('le', bound)])} {cumulative}"
+        yield f"{self.name}_sum{self._label_text(const_labels, values)} {child.sum}"
+        yield f"{self.name}_count{self._label_text(const_labels, values)} {child.count}"
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+
+    def collect(self, const_labels=()):
+        return [(metric.name, *metric.collect(const_labels)) for metric in self._metrics]
+
+    def render(self):
+        return render_collected([self.collect()])
+
+
+def render_collected(collections):
+    # Prometheus text exposition format; series of the same metric from
+    # several collections are grouped under one header
+    metrics = {}
+    for collection in collections:
+        for name, header, samples in collection:
+            metrics.setdefault(name, (header, []))[1].extend(samples)
+    lines = []
+    for header, samples in metrics.values():
+        lines.extend(header)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+REGISTRY = MetricsRegistry()
+
+# Ingestion
+FETCH_SECONDS = Histogram('forwarder_fetch_seconds', 'Duration of get_messages requests', ('kind',))
+MESSAGES_INGESTED = Counter('forwarder_messages_ingested_total', 'Messages read from source chats', ('job',))
+QUEUE_WAIT_SECONDS = Histogram('forwarder_queue_wait_seconds', 'Time between ingesting and handling a message', ('job',))
+BACKOFF_SECONDS = Counter('forwarder_watcher_backoff_seconds_total', 'Seconds watchers slept after FloodWaits or errors', ('job', 'reason'))
+WATCHER_RESTARTS = Counter('forwarder_watcher_restarts_total', 'Watchers restarted after they stopped sending heartbeats', ('job',))
+# Connection health, per account
+CONNECTED = Gauge('forwarder_connected', 'Whether the client answered its last heartbeat', ('account',))
+RECONNECTS = Counter('forwarder_reconnects_total', 'Reconnect attempts by outcome', ('account', 'result'))
+RECOVERY_SECONDS = Histogram('forwarder_recovery_seconds', 'Time from detecting a dropped connection to having replayed the missed messages', ('account',),
+                             buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+LOOP_LAG_SECONDS = Gauge('forwarder_loop_lag_seconds', 'How late the last heartbeat woke up', ('account',))
+# Matching and dedup
+MATCH_SECONDS = Histogram('forwarder_match_seconds', 'Duration of scanning one message', ('job',))
+MATCHES = Counter('forwarder_matches_total', 'Messages with at least one match', ('job',))
+COOLDOWN_SECONDS = Histogram('forwarder_cooldown_check_seconds', 'Duration of one cooldown check', ('type',))
+COOLDOWN_CHECKS = Counter('forwarder_cooldown_checks_total', 'Cooldown checks by outcome', ('type', 'result'))
+# Sending
+SEND_SECONDS = Histogram('forwarder_send_seconds', 'Duration of send and forward requests', ('destination',))
+SEND_LATENCY_SECONDS = Histogram('forwarder_send_latency_seconds', 'Time from queueing to delivering a message', ('destination',))
+SENT = Counter('forwarder_sent_total', 'Messages delivered', ('destination',))
+SEND_FAILED = Counter('forwarder_send_failed_total', 'Messages given up after errors or FloodWaits', ('destination',))
+SEND_DROPPED = Counter('forwarder_send_dropped_total', 'Messages dropped because the send queue was full', ('destination',))
+SEND_QUEUE_DEPTH = Gauge('forwarder_send_queue_depth', 'Messages waiting to be sent', ('destination',))
+FLOOD_WAITS = Counter('forwarder_flood_waits_total', 'FloodWaits received while sending', ('destination',))
+FLOOD_WAIT_SECONDS = Counter('forwarder_flood_wait_seconds_total', 'Seconds spent waiting out FloodWaits while sending', ('destination',))
+DIGEST_MATCHES = Counter('forwarder_digest_matches_total', 'Matches folded into digests instead of sent one by one', ('destination',))
+DIGESTS = Counter('forwarder_digests_total', 'Digests sent', ('destination',))
+
+
+def account_label(phone_number):
+    # /metrics is served without a session, so accounts are labelled with a
+    # short HMAC of their phone number. Keyed with SECRET_KEY, the label
+    # cannot be found by hashing candidate numbers.
+    digest = hmac.new(Config.SECRET_KEY.encode('utf-8'), phone_number.encode('utf-8'), hashlib.sha256)
+    return digest.hexdigest()[:12]
+
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of a sorted list, None when it is empty
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class SamplingProfiler:
+    """Samples the stacks of all threads from a background thread.
+
+    Meant to be switched on for a short while on a live process; report()
+    returns collapsed stacks ("outer;inner count") that flamegraph tools read.
+    """
+
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = _Tally()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=None):
+        if self.running:
+            return
+        self.interval = max(MIN_PROFILE_INTERVAL, interval or self.interval)
+        self.samples = _Tally()
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename.rsplit('/', 1)[-1]}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+
+    def report(self, limit=None):
+        return '\n'.join(f"{stack} {count}" for stack, count in self.samples.most_common(limit)) + '\n'
+
+
+profiler = SamplingProfiler()
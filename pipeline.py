@@ -0,0 +1,227 @@
+# pipeline.py
+import asyncio
+import logging
+import time
+
+from ingest import fetch_latest_id, fetch_new_messages
+from matcher import CASHTAG, ETHEREUM, KEYWORD, SOLANA, MessageMatcher
+from metrics import MATCH_SECONDS, MATCHES
+from watcher import WatcherEngine
+
+logger = logging.getLogger(__name__)
+
+
+class Rule:
+    """One section of a job: the chats it reads, what it looks for and its handler.
+
+    `handler(message, matches)` only receives the matches of the rule's own
+    kinds and keywords, even though the chat is scanned for every rule
+    reading it.
+    """
+
+    def __init__(self, job_id, chats, handler, ingest_mode='events', keywords=(), solana=False, ethereum=False,
+                 cashtags=False):
+        self.job_id = job_id
+        self.chats = set(chats)
+        self.handler = handler
+        self.ingest_mode = ingest_mode
+        self.keywords = frozenset(keywords)
+        self.kinds = {kind for kind, enabled in ((KEYWORD, bool(self.keywords)), (SOLANA, solana),
+                                                 (ETHEREUM, ethereum), (CASHTAG, cashtags)) if enabled}
+
+    def select(self, matches):
+        return [match for match in matches
+                if match.kind in self.kinds and (match.kind != KEYWORD or match.value in self.keywords)]
+
+
+class Pipeline:
+    """Ingests each source chat of an account once, whatever the number of rules reading it.
+
+    Every ingest mode has one WatcherEngine. A chat is watched while at least
+    one rule subscribes to it, and each message is scanned once by a matcher
+    built from the union of the chat's rules, then handed to every rule with
+    the matches it asked for.
+
+    A rule joining a chat that is already watched skips what the feed has
+    ingested so far and, when resuming from a saved cursor, catches up on
+    the messages between that cursor and the feed on its own.
+    """
+
+    def __init__(self, client, ingest, albums, cursors):
+        self.client = client
+        self.ingest = ingest
+        self.albums = albums
+        self.cursors = cursors
+        self.engines = {}  # WatcherEngine of each ingest mode in use
+        self._runners = {}
+        self._rules = {}  # (ingest mode, chat ID) -> rules reading the chat
+        self._matchers = {}
+        self._skip_until = {}  # (rule, chat ID) -> last message the rule must not get from the feed
+        self._catch_ups = {}
+
+    def backing_off(self, rules):
+        # Chats of these rules whose watcher is sleeping through a FloodWait or an error
+        chats = set()
+        for rule in rules:
+            engine = self.engines.get(rule.ingest_mode)
+            if engine is not None:
+                chats |= rule.chats & engine.backing_off
+        return chats
+
+    async def subscribe(self, rule, resume_from=None, chats=None):
+        # chats limits the subscription to some of the rule's chats, e.g. ones an update added
+        resume_from = resume_from or {}
+        for chat_id in rule.chats if chats is None else chats:
+            key = (rule.ingest_mode, chat_id)
+            saved = resume_from.get(chat_id)
+            latest = None
+            if saved is not None and self._rules.get(key) and self.engines[rule.ingest_mode].cursors.get(chat_id) is None:
+                # Watched, but nothing ingested yet to tell where the catch-up has to stop
+                try:
+                    latest = await fetch_latest_id(self.client, chat_id)
+                except Exception as e:
+                    logger.error(f"Could not read the latest message of chat {chat_id}: {e}")
+
+            # Looked up after the await, the last reader may have left meanwhile
+            engine = self._engine(rule.ingest_mode)
+            if not self._rules.get(key):
+                # First reader, the feed starts from its cursor
+                if saved is not None:
+                    engine.cursors[chat_id] = saved
+                self._add_rule(key, rule)
+                engine.add_chat(chat_id)
+                continue
+
+            position = engine.cursors.get(chat_id, latest)
+            if position is not None:
+                self._skip_until[(rule, chat_id)] = position
+                if saved is not None and saved < position:
+                    self._catch_ups[(rule, chat_id)] = asyncio.create_task(
+                        self._catch_up(rule, chat_id, saved, position))
+            self._add_rule(key, rule)
+
+    def unsubscribe(self, rule, chats=None):
+        engine = self.engines.get(rule.ingest_mode)
+        for chat_id in rule.chats if chats is None else chats:
+            key = (rule.ingest_mode, chat_id)
+            rules = self._rules.get(key, [])
+            if rule in rules:
+                rules.remove(rule)
+            self._skip_until.pop((rule, chat_id), None)
+            catch_up = self._catch_ups.pop((rule, chat_id), None)
+            if catch_up is not None:
+                catch_up.cancel()
+            if rules:
+                self._matchers[key] = _union_matcher(rules)
+                continue
+            self._rules.pop(key, None)
+            self._matchers.pop(key, None)
+            if engine is not None:
+                engine.remove_chat(chat_id)
+                engine.cursors.pop(chat_id, None)
+
+        if engine is not None and not any(mode == rule.ingest_mode for mode, _ in self._rules):
+            self._runners.pop(rule.ingest_mode).cancel()
+            del self.engines[rule.ingest_mode]
+
+    def position(self, ingest_mode, chat_id):
+        # Last message the feed of a watched chat ingested, None when unknown
+        engine = self.engines.get(ingest_mode)
+        return engine.cursors.get(chat_id) if engine is not None else None
+
+    def update(self, rule, new_rule):
+        # Gives a subscribed rule the handler, keywords and kinds of new_rule.
+        # Union matchers are rebuilt before they replace the old ones, so a
+        # message is scanned either entirely before or entirely after the change.
+        rule.handler = new_rule.handler
+        if (rule.keywords, rule.kinds) == (new_rule.keywords, new_rule.kinds):
+            return
+        rule.keywords, rule.kinds = new_rule.keywords, new_rule.kinds
+        for chat_id in rule.chats:
+            key = (rule.ingest_mode, chat_id)
+            if key in self._rules:
+                self._matchers[key] = _union_matcher(self._rules[key])
+
+    def _engine(self, ingest_mode):
+        engine = self.engines.get(ingest_mode)
+        if engine is None:
+            engine = self.engines[ingest_mode] = WatcherEngine(
+                self.client, self.ingest, lambda chat_id, message: self._dispatch(ingest_mode, chat_id, message),
+                ingest_mode, on_checkpoint=lambda chat_id, message_id: self._checkpoint(ingest_mode, chat_id, message_id),
+                job=f"pipeline-{ingest_mode}")
+            self._runners[ingest_mode] = asyncio.create_task(engine.run([]))
+        return engine
+
+    def _add_rule(self, key, rule):
+        self._rules.setdefault(key, []).append(rule)
+        self._matchers[key] = _union_matcher(self._rules[key])
+
+    async def _dispatch(self, ingest_mode, chat_id, message):
+        key = (ingest_mode, chat_id)
+        rules = self._rules.get(key)
+        if not rules:
+            return
+        # Album members are remembered even when they do not match, so a
+        # matching caption is forwarded together with its media
+        self.albums.record(chat_id, message)
+        started = time.perf_counter()
+        matches = self._matchers[key].find(message.text)
+        MATCH_SECONDS.labels(self.engines[ingest_mode].job).observe(time.perf_counter() - started)
+        if not matches:
+            return
+        await self._deliver(list(rules), chat_id, message, matches)
+
+    async def _deliver(self, rules, chat_id, message, matches, from_feed=True):
+        matched_jobs = set()
+        for rule in rules:
+            if from_feed and message.id <= self._skip_until.get((rule, chat_id), 0):
+                continue
+            selected = rule.select(matches)
+            if not selected:
+                continue
+            matched_jobs.add(rule.job_id or '')
+            try:
+                await rule.handler(message, selected)
+            except Exception as e:
+                logger.error(f"Rule of job {rule.job_id} failed on message {message.id} from chat {chat_id}: {e}")
+        for job_id in matched_jobs:
+            MATCHES.labels(job_id).inc()
+
+    def _checkpoint(self, ingest_mode, chat_id, message_id):
+        for rule in self._rules.get((ingest_mode, chat_id), ()):
+            # A rule still catching up keeps the cursor of its catch-up
+            if rule.job_id is None or (rule, chat_id) in self._catch_ups:
+                continue
+            if message_id > self._skip_until.get((rule, chat_id), 0):
+                self.cursors.set(rule.job_id, chat_id, message_id)
+
+    async def _catch_up(self, rule, chat_id, last_message_id, position):
+        try:
+            messages = await fetch_new_messages(self.client, chat_id, last_message_id, before_id=position + 1)
+            if messages:
+                logger.info(f"Catching up on {len(messages)} messages of chat {chat_id} for job {rule.job_id}")
+            matcher = _union_matcher([rule])
+            for message in messages:
+                self.albums.record(chat_id, message)
+                matches = matcher.find(message.text)
+                if matches:
+                    await self._deliver([rule], chat_id, message, matches, from_feed=False)
+                if rule.job_id is not None:
+                    self.cursors.set(rule.job_id, chat_id, message.id)
+        except Exception as e:
+            logger.error(f"Catch-up of chat {chat_id} for job {rule.job_id} failed: {e}")
+        finally:
+            if self._catch_ups.get((rule, chat_id)) is asyncio.current_task():
+                del self._catch_ups[(rule, chat_id)]
+
+
+def _union_matcher(rules):
+    keywords = set()
+    keyword_rules = 0
+    for rule in rules:
+        keywords |= rule.keywords
+        keyword_rules += bool(rule.keywords)
+    kinds = set().union(*(rule.kinds for rule in rules))
+    # A single keyword rule only needs to know whether any of its keywords matched
+    return MessageMatcher(keywords=sorted(keywords), solana=SOLANA in kinds, ethereum=ETHEREUM in kinds,
+                          cashtags=CASHTAG in kinds, any_keyword=keyword_rules == 1)
@@ -0,0 +1,97 @@
+# runtime.py
+import asyncio
+import logging
+import threading
+
+from telethon import TelegramClient
+
+logger = logging.getLogger(__name__)
+
+# Seconds a Flask request waits for a coroutine submitted to a runtime
+CALL_TIMEOUT = 60
+
+
+class AccountRuntime:
+    """One background event loop, client and forwarder per phone number.
+
+    Every job and web request of the account is multiplexed on this loop, so
+    the session_<phone> SQLite file is opened by a single client and the
+    connection handshake is paid once instead of once per request.
+    """
+
+    def __init__(self, api_id, api_hash, phone_number, forwarder_factory):
+        self.api_id = api_id
+        self.api_hash = api_hash
+        self.phone_number = phone_number
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=f"runtime-{phone_number}", daemon=True)
+        self._thread.start()
+        self.forwarder = self.call(self._create_forwarder(forwarder_factory))
+        self.client = self.forwarder.client
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        # stop() has returned control here; close the selector with the thread
+        self.loop.close()
+
+    async def _create_forwarder(self, forwarder_factory):
+        # Created on the runtime loop so the client binds to it
+        client = TelegramClient('session_' + self.phone_number, self.api_id, self.api_hash)
+        return forwarder_factory(self.api_id, self.api_hash, self.phone_number, client=client)
+
+    def submit(self, coro):
+        # Returns a concurrent.futures.Future usable from any thread
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def call(self, coro, timeout=CALL_TIMEOUT):
+        return self.submit(coro).result(timeout)
+
+    async def _disconnect(self):
+        # disconnect() looks up the event loop of the calling thread, so it
+        # has to be called on the runtime loop itself
+        await self.client.disconnect()
+
+    def start_job(self, coro, name):
+        future = self.submit(coro)
+        future.add_done_callback(lambda done: _log_job_exit(done, self.phone_number, name))
+        return future
+
+    def stop(self):
+        try:
+            self.call(self._disconnect())
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def _log_job_exit(future, phone_number, name):
+    if future.cancelled():
+        logger.info(f"Job {name} of {phone_number} was cancelled")
+    elif future.exception() is not None:
+        logger.error(f"Job {name} of {phone_number} failed: {future.exception()}")
+
+
+_runtimes = {}
+_runtimes_lock = threading.Lock()
+
+
+def get_runtime(api_id, api_hash, phone_number, forwarder_factory):
+    # The credentials only matter when the runtime is created; AccountService
+    # replaces it once new credentials have signed in
+    with _runtimes_lock:
+        runtime = _runtimes.get(phone_number)
+        if runtime is None:
+            runtime = _runtimes[phone_number] = AccountRuntime(api_id, api_hash, phone_number, forwarder_factory)
+        return runtime
+
+
+def find_runtime(phone_number):
+    # The account's runtime in this process, or None; never creates one
+    with _runtimes_lock:
+        return _runtimes.get(phone_number)
+
+
+def pop_runtime(phone_number):
+    # Removes the account's runtime from this process; the caller stops it
+    with _runtimes_lock:
+        return _runtimes.pop(phone_number, None)
@@ -0,0 +1,177 @@
+# store.py
+import glob
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = "forwarder.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (
+    phone_number TEXT PRIMARY KEY,
+    api_id TEXT NOT NULL,
+    api_hash TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    phone_number TEXT NOT NULL,
+    spec TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_by_phone ON jobs (phone_number);
+CREATE TABLE IF NOT EXISTS cursors (
+    job_id TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    phone_number TEXT NOT NULL,
+    message_id INTEGER NOT NULL,
+    PRIMARY KEY (job_id, chat_id)
+);
+CREATE INDEX IF NOT EXISTS cursors_by_phone ON cursors (phone_number);
+CREATE TABLE IF NOT EXISTS cooldowns (
+    job_id TEXT NOT NULL,
+    phone_number TEXT NOT NULL,
+    type TEXT NOT NULL,
+    content TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (job_id, type, content)
+);
+CREATE INDEX IF NOT EXISTS cooldowns_by_phone ON cooldowns (phone_number);
+CREATE INDEX IF NOT EXISTS cooldowns_by_expiry ON cooldowns (expires_at);
+"""
+
+
+class StateStore:
+    """Accounts, jobs, cursors and cooldowns in one SQLite database.
+
+    WAL mode keeps readers from blocking the writer. The connection is shared
+    by Flask request threads and the runtimes' executor threads, so every
+    operation holds a lock and runs in its own transaction.
+    """
+
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    # Accounts
+
+    def get_account(self, phone_number):
+        rows = self._query("SELECT * FROM accounts WHERE phone_number = ?", (phone_number,))
+        if not rows:
+            return None
+        return {'api_id': rows[0]['api_id'], 'api_hash': rows[0]['api_hash'], 'phone_number': phone_number}
+
+    def accounts(self):
+        return [{'api_id': row['api_id'], 'api_hash': row['api_hash'], 'phone_number': row['phone_number']}
+                for row in self._query("SELECT * FROM accounts")]
+
+    def save_account(self, phone_number, api_id, api_hash):
+        self._transaction(lambda db: db.execute(
+            "INSERT INTO accounts (phone_number, api_id, api_hash, updated_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (phone_number) DO UPDATE SET api_id = excluded.api_id, api_hash = excluded.api_hash, "
+            "updated_at = excluded.updated_at",
+            (phone_number, str(api_id), api_hash, time.time())))
+
+    # Jobs
+
+    def jobs(self, phone_number):
+        rows = self._query("SELECT * FROM jobs WHERE phone_number = ? ORDER BY created_at", (phone_number,))
+        return [dict(json.loads(row['spec']), job_id=row['job_id'], state=row['state']) for row in rows]
+
+    def save_job(self, phone_number, job_id, spec, state):
+        self._transaction(lambda db: db.execute(
+            "INSERT INTO jobs (job_id, phone_number, spec, state, created_at) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (job_id) DO UPDATE SET spec = excluded.spec, state = excluded.state",
+            (job_id, phone_number, json.dumps(spec), state, time.time())))
+
+    def set_job_state(self, job_id, state):
+        self._transaction(lambda db: db.execute("UPDATE jobs SET state = ? WHERE job_id = ?", (state, job_id)))
+
+    def delete_job(self, job_id):
+        def delete(db):
+            db.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM cursors WHERE job_id = ?", (job_id,))
+            db.execute("DELETE FROM cooldowns WHERE job_id = ?", (job_id,))
+        self._transaction(delete)
+
+    # Cursors and cooldowns
+
+    def cursors(self, phone_number):
+        cursors = {}
+        for row in self._query("SELECT * FROM cursors WHERE phone_number = ?", (phone_number,)):
+            cursors.setdefault(row['job_id'], {})[row['chat_id']] = row['message_id']
+        return cursors
+
+    def cooldowns(self, phone_number):
+        rows = self._query("SELECT job_id, type, content, expires_at FROM cooldowns "
+                           "WHERE phone_number = ? AND expires_at > ?", (phone_number, time.time()))
+        return [[row['job_id'], row['type'], row['content'], row['expires_at']] for row in rows]
+
+    def save_checkpoint(self, phone_number, cursor_updates, cursor_discards, cooldown_updates):
+        # One transaction, so cursors never get ahead of the cooldowns they depend on
+        def save(db):
+            for job_id, chat_id in cursor_discards:
+                if chat_id is None:
+                    db.execute("DELETE FROM cursors WHERE job_id = ?", (job_id,))
+                else:
+                    db.execute("DELETE FROM cursors WHERE job_id = ? AND chat_id = ?", (job_id, chat_id))
+            db.executemany(
+                "INSERT INTO cursors (job_id, chat_id, phone_number, message_id) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (job_id, chat_id) DO UPDATE SET message_id = excluded.message_id",
+                [(job_id, chat_id, phone_number, message_id) for job_id, chat_id, message_id in cursor_updates])
+            db.executemany(
+                "INSERT INTO cooldowns (job_id, phone_number, type, content, expires_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (job_id, type, content) DO UPDATE SET expires_at = excluded.expires_at",
+                [(job_id, phone_number, forward_type, content, expires_at)
+                 for job_id, forward_type, content, expires_at in cooldown_updates])
+            db.execute("DELETE FROM cooldowns WHERE expires_at <= ?", (time.time(),))
+        self._transaction(save)
+
+
+def migrate_json_files(store, directory="."):
+    # Imports the config_<phone>.json files of earlier versions once, then
+    # renames them so they are not imported again
+    for config_path in glob.glob(os.path.join(directory, "config_*.json")):
+        phone_number = os.path.basename(config_path)[len("config_"):-len(".json")]
+        try:
+            _migrate_account(store, config_path, phone_number)
+        except (OSError, ValueError, KeyError) as e:
+            logger.error(f"Could not migrate {config_path}: {e}")
+
+
+def _migrate_account(store, config_path, phone_number):
+    with open(config_path, "r") as file:
+        config = json.load(file)
+    store.save_account(phone_number, config['api_id'], config['api_hash'])
+    for task in config.get('tasks', []):
+        spec = {key: value for key, value in task.items() if key not in ('task_id', 'job_id', 'state')}
+        store.save_job(phone_number, task.get('job_id') or uuid.uuid4().hex, spec, task.get('state', 'running'))
+    os.replace(config_path, config_path + ".migrated")
+    logger.info(f"Migrated {config_path} into {store.path}")
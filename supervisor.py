@@ -0,0 +1,481 @@
+# supervisor.py
+import logging
+import multiprocessing
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from multiprocessing.connection import wait
+
+from forwarder import TelegramForwarder
+from jobs import JOB_TYPES, RUNNING, JobRegistry
+from logs import configure_logging
+from metrics import REGISTRY, profiler
+from runtime import CALL_TIMEOUT, AccountRuntime, find_runtime, get_runtime, pop_runtime
+from store import StateStore
+
+logger = logging.getLogger(__name__)
+
+# Requests one worker serves at a time; a slow Telegram call only holds one of them
+WORKER_THREADS = 8
+# Seconds the control plane waits for a worker, on top of the runtime's own timeout
+IPC_TIMEOUT = CALL_TIMEOUT + 5
+# Seconds before a dead worker is restarted, doubled per crash up to MAX_RESTART_DELAY
+RESTART_DELAY = 1
+MAX_RESTART_DELAY = 60
+# A worker that stayed up this long restarts without delay
+STABLE_UPTIME = 60
+# Seconds a stopping worker gets to save its checkpoints before it is terminated
+STOP_TIMEOUT = 15
+
+# AccountService methods a worker accepts over its pipe
+SERVICE_METHODS = ('send_code', 'sign_in', 'list_chats', 'create_job', 'list_jobs', 'control_job', 'update_job',
+                   'restore', 'release', 'metrics', 'profile')
+
+
+class WorkerError(Exception):
+    pass
+
+
+class AccountService:
+    """Runs accounts and their jobs inside the current process.
+
+    Used directly by the Flask app when WORKER_PROCESSES is 0, and inside
+    every worker process otherwise. Arguments and results are plain data so
+    the same calls work across a pipe.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.jobs = JobRegistry(store)
+        self._forwarder_factory = partial(TelegramForwarder, store=store)
+        # Clients with new credentials of running accounts, until they have signed in
+        self._candidates = {}
+
+    def start(self):
+        self.restore()
+
+    def _runtime(self, config):
+        # The account's running client, even when `config` holds new
+        # credentials that have not signed in yet
+        return get_runtime(config['api_id'], config['api_hash'], config['phone_number'], self._forwarder_factory)
+
+    def _auth_runtime(self, config):
+        # New credentials of a running account get a client of their own, so
+        # the jobs keep running on the old one until the new one has signed in
+        phone_number = config['phone_number']
+        credentials = (config['api_id'], config['api_hash'])
+        runtime = find_runtime(phone_number)
+        if runtime is None or (runtime.api_id, runtime.api_hash) == credentials:
+            self._drop_candidate(phone_number)
+            return self._runtime(config)
+        candidate = self._candidates.get(phone_number)
+        if candidate is None or (candidate.api_id, candidate.api_hash) != credentials:
+            self._drop_candidate(phone_number)
+            candidate = self._candidates[phone_number] = AccountRuntime(*credentials, phone_number,
+                                                                        self._forwarder_factory)
+        return candidate
+
+    def _drop_candidate(self, phone_number):
+        candidate = self._candidates.pop(phone_number, None)
+        if candidate is not None:
+            try:
+                candidate.call(candidate.forwarder.shutdown())
+            finally:
+                candidate.stop()
+
+    def _signed_in(self, runtime):
+        # The candidate's credentials work: the account's jobs are released,
+        # which saves their cursors, and started again in the state they were
+        # in on a client that loads that last checkpoint
+        phone_number = runtime.phone_number
+        if self._candidates.get(phone_number) is not runtime:
+            return
+        moved = [(job.id, job.spec, job.state == RUNNING) for job in self.jobs.jobs(phone_number)]
+        self.release(phone_number)
+        runtime = get_runtime(runtime.api_id, runtime.api_hash, phone_number, self._forwarder_factory)
+        for job_id, spec, running in moved:
+            self.jobs.create(runtime, spec, job_id=job_id, start=running)
+        logger.info(f"Credentials of {phone_number} changed, moved {len(moved)} jobs to the new client")
+
+    def send_code(self, config):
+        # Returns the phone_code_hash to verify, or None when already authorized
+        runtime = self._auth_runtime(config)
+        try:
+            phone_code_hash = runtime.call(runtime.forwarder.send_code())
+        except Exception:
+            if self._candidates.get(config['phone_number']) is runtime:
+                self._drop_candidate(config['phone_number'])
+            raise
+        if phone_code_hash is None:
+            self._signed_in(runtime)
+        return phone_code_hash
+
+    def sign_in(self, config, code, phone_code_hash):
+        # A wrong code keeps the candidate, so the code can be entered again
+        runtime = self._auth_runtime(config)
+        runtime.call(runtime.forwarder.sign_in(code, phone_code_hash))
+        self._signed_in(runtime)
+
+    def list_chats(self, config, offset=0, limit=None):
+        # (chat descriptions of the page, number of chats)
+        runtime = self._runtime(config)
+        return runtime.call(runtime.forwarder.list_chats(offset, limit))
+
+    def create_job(self, config, spec):
+        return self.jobs.create(self._runtime(config), spec).id
+
+    def list_jobs(self, phone_number):
+        return [{'id': job.id, 'type': job.spec['type'], 'state': job.current_state(),
+                 'error': str(job.error) if job.error else None, 'spec': job.spec}
+                for job in self.jobs.jobs(phone_number)]
+
+    def control_job(self, phone_number, job_id, action):
+        # Pauses, resumes or stops a job; False when the account has no such job
+        job = self.jobs.get(job_id)
+        if job is None or job.phone_number != phone_number:
+            return False
+        if action == 'pause':
+            self.jobs.pause(job_id)
+        elif action == 'resume':
+            self.jobs.resume(job_id)
+        else:
+            self.jobs.stop(job_id)
+        return True
+
+    def update_job(self, phone_number, job_id, changes):
+        # Fields of the job's spec that changed, or None when the account has no such job
+        job = self.jobs.get(job_id)
+        if job is None or job.phone_number != phone_number:
+            return None
+        return self.jobs.update(job_id, changes)
+
+    def restore(self, phone_number=None):
+        # Restarts the saved jobs of one account, or of every account; paused
+        # jobs are registered without running
+        configs = [self.store.get_account(phone_number)] if phone_number else self.store.accounts()
+        for config in configs:
+            if config is None:
+                continue
+            saved_jobs = [saved for saved in self.store.jobs(config['phone_number'])
+                          if saved.get('type') in JOB_TYPES and self.jobs.get(saved['job_id']) is None]
+            if not saved_jobs:
+                continue
+            try:
+                runtime = self._runtime(config)
+            except Exception as e:
+                logger.error(f"Could not restore jobs of {config['phone_number']}: {e}")
+                continue
+            for saved in saved_jobs:
+                spec = {key: value for key, value in saved.items() if key not in ('job_id', 'state')}
+                try:
+                    self.jobs.create(runtime, spec, job_id=saved['job_id'], start=saved['state'] != 'paused')
+                except (KeyError, ValueError) as e:
+                    # Saved before specs were validated, left in the store for inspection
+                    logger.error(f"Could not restore job {saved['job_id']} of {config['phone_number']}: {e}")
+            logger.info(f"Restored {len(saved_jobs)} jobs for {config['phone_number']}")
+
+    def release(self, phone_number):
+        # Stops the account here without touching its saved jobs, so another
+        # process can restore it from the last checkpoint
+        for job in self.jobs.jobs(phone_number):
+            self.jobs.release(job.id)
+        runtime = pop_runtime(phone_number)
+        if runtime is not None:
+            try:
+                runtime.call(runtime.forwarder.shutdown())
+            finally:
+                runtime.stop()
+        # After the old client, so the session file is left as the candidate wrote it
+        self._drop_candidate(phone_number)
+
+    def release_all(self):
+        for phone_number in {job.phone_number for job in self.jobs.jobs()}:
+            try:
+                self.release(phone_number)
+            except Exception as e:
+                logger.error(f"Could not release {phone_number}: {e}")
+
+    def metrics(self, const_labels=()):
+        # A list of collections, to be passed to metrics.render_collected
+        return [REGISTRY.collect(const_labels)]
+
+    def profile(self, action=None, interval=None, limit=None):
+        if action == 'start':
+            profiler.start(interval)
+            return "Profiler started.\n"
+        if action == 'stop':
+            profiler.stop()
+            return "Profiler stopped.\n"
+        return profiler.report(limit)
+
+
+def _worker_main(conn, index, state_db, body_mode):
+    configure_logging(body_mode=body_mode)
+    service = AccountService(StateStore(state_db))
+    executor = ThreadPoolExecutor(WORKER_THREADS)
+    send_lock = threading.Lock()
+
+    def handle(request_id, method, args):
+        try:
+            if method not in SERVICE_METHODS:
+                raise WorkerError(f"Unknown method '{method}'")
+            reply = (request_id, True, getattr(service, method)(*args))
+        except Exception as e:
+            reply = (request_id, False, f"{type(e).__name__}: {e}")
+        with send_lock:
+            conn.send(reply)
+
+    logger.info(f"Worker {index} started")
+    while True:
+        try:
+            request = conn.recv()
+        except (EOFError, OSError):
+            # The control plane went away
+            return
+        if request is None:
+            break
+        request_id, method, args = request
+        executor.submit(handle, request_id, method, args)
+
+    # Asked to stop: release every account so its last checkpoint is saved
+    executor.shutdown()
+    service.release_all()
+
+
+class WorkerHandle:
+    """Control plane side of one worker process and its pipe."""
+
+    def __init__(self, index, context, state_db, body_mode):
+        self.index = index
+        self._conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, index, state_db, body_mode),
+                                       name=f"worker-{index}", daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.started_at = time.monotonic()
+        self._pending = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._read, name=f"worker-{index}-reader", daemon=True).start()
+
+    def call(self, method, *args, timeout=IPC_TIMEOUT):
+        future = Future()
+        with self._lock:
+            self._next_id += 1
+            request_id = self._next_id
+            self._pending[request_id] = future
+            try:
+                self._conn.send((request_id, method, args))
+            except (OSError, ValueError) as e:
+                del self._pending[request_id]
+                raise WorkerError(f"Worker {self.index} is not running: {e}")
+        try:
+            return future.result(timeout)
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+
+    def _read(self):
+        while True:
+            try:
+                request_id, ok, result = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(WorkerError(result))
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(WorkerError(f"Worker {self.index} exited"))
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        # The reader thread sees the pipe close once the worker has exited
+        try:
+            self._conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+
+
+class WorkerPool:
+    """Shards accounts across worker processes.
+
+    Every account lives on exactly one worker, which runs its client, jobs
+    and matching on its own interpreter, so accounts scale past one GIL and
+    a crash only takes down the accounts of that worker. New accounts go to
+    the least loaded worker. When a worker dies its accounts are restored
+    on the remaining workers from their last checkpoint, the worker is
+    restarted with a growing delay, and accounts are rebalanced onto it.
+    """
+
+    def __init__(self, processes, store, state_db, body_mode='full'):
+        self.processes = processes
+        self.store = store
+        self.state_db = state_db
+        self.body_mode = body_mode
+        self.workers = {}
+        self.assignments = {}
+        self._crashes = defaultdict(int)
+        self._lock = threading.Lock()
+        self._stopping = False
+        # Workers never inherit the control plane's threads or sockets
+        self._context = multiprocessing.get_context('spawn')
+
+    def start(self):
+        for index in range(self.processes):
+            self.workers[index] = WorkerHandle(index, self._context, self.state_db, self.body_mode)
+        for config in self.store.accounts():
+            if self.store.jobs(config['phone_number']):
+                self._worker_for(config['phone_number'])
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+
+    def stop(self):
+        self._stopping = True
+        for _, worker in self._live_workers():
+            worker.stop()
+
+    def _worker_for(self, phone_number):
+        with self._lock:
+            index = self.assignments.get(phone_number)
+            if index in self.workers:
+                return self.workers[index]
+            if not self.workers:
+                raise WorkerError("No worker is running, please try again shortly")
+            index = min(self.workers, key=self._load)
+            self.assignments[phone_number] = index
+            worker = self.workers[index]
+        # A newly placed account starts the jobs saved for it
+        logger.info(f"Account {phone_number} assigned to worker {index}")
+        worker.call('restore', phone_number)
+        return worker
+
+    def _load(self, index):
+        return sum(1 for assigned in self.assignments.values() if assigned == index)
+
+    def _monitor(self):
+        while not self._stopping:
+            with self._lock:
+                sentinels = {worker.process.sentinel: index for index, worker in self.workers.items()}
+            for sentinel in wait(list(sentinels), timeout=1):
+                if not self._stopping:
+                    self._recover(sentinels[sentinel])
+
+    def _recover(self, index):
+        with self._lock:
+            dead = self.workers.pop(index)
+            orphans = [phone for phone, assigned in self.assignments.items() if assigned == index]
+            for phone in orphans:
+                del self.assignments[phone]
+        logger.error(f"Worker {index} exited with code {dead.process.exitcode}, "
+                     f"moving {len(orphans)} accounts to the other workers")
+
+        # Serve the orphaned accounts elsewhere while the worker restarts
+        for phone in orphans:
+            self._place(phone)
+
+        if time.monotonic() - dead.started_at >= STABLE_UPTIME:
+            self._crashes[index] = 0
+        delay = min(RESTART_DELAY * 2 ** self._crashes[index], MAX_RESTART_DELAY)
+        self._crashes[index] += 1
+        time.sleep(delay)
+        with self._lock:
+            self.workers[index] = WorkerHandle(index, self._context, self.state_db, self.body_mode)
+        logger.info(f"Worker {index} restarted")
+
+        for phone in orphans:
+            self._place(phone)
+        self.rebalance()
+
+    def _place(self, phone_number):
+        try:
+            self._worker_for(phone_number)
+        except Exception as e:
+            logger.error(f"Could not place account {phone_number}: {e}")
+
+    def rebalance(self):
+        # Moves accounts one at a time until worker loads differ by at most one
+        while not self._stopping:
+            with self._lock:
+                if len(self.workers) < 2:
+                    return
+                loads = {index: self._load(index) for index in self.workers}
+                busiest = max(loads, key=loads.get)
+                idlest = min(loads, key=loads.get)
+                if loads[busiest] - loads[idlest] <= 1:
+                    return
+                phone = next(phone for phone, assigned in self.assignments.items() if assigned == busiest)
+                source, target = self.workers[busiest], self.workers[idlest]
+                self.assignments[phone] = idlest
+            logger.info(f"Moving account {phone} from worker {busiest} to worker {idlest}")
+            try:
+                source.call('release', phone)
+            except Exception as e:
+                logger.error(f"Worker {busiest} failed to release {phone}: {e}")
+            try:
+                target.call('restore', phone)
+            except Exception as e:
+                logger.error(f"Worker {idlest} failed to restore {phone}: {e}")
+
+    def _account_call(self, phone_number, method, *args):
+        return self._worker_for(phone_number).call(method, *args)
+
+    def send_code(self, config):
+        return self._account_call(config['phone_number'], 'send_code', config)
+
+    def sign_in(self, config, code, phone_code_hash):
+        return self._account_call(config['phone_number'], 'sign_in', config, code, phone_code_hash)
+
+    def list_chats(self, config, offset=0, limit=None):
+        return self._account_call(config['phone_number'], 'list_chats', config, offset, limit)
+
+    def create_job(self, config, spec):
+        return self._account_call(config['phone_number'], 'create_job', config, spec)
+
+    def list_jobs(self, phone_number):
+        return self._account_call(phone_number, 'list_jobs', phone_number)
+
+    def control_job(self, phone_number, job_id, action):
+        return self._account_call(phone_number, 'control_job', phone_number, job_id, action)
+
+    def update_job(self, phone_number, job_id, changes):
+        return self._account_call(phone_number, 'update_job', phone_number, job_id, changes)
+
+    def _live_workers(self):
+        with self._lock:
+            return sorted(self.workers.items())
+
+    def metrics(self):
+        collections = []
+        for index, worker in self._live_workers():
+            try:
+                collections.extend(worker.call('metrics', (('worker', str(index)),), timeout=10))
+            except Exception as e:
+                logger.error(f"Worker {index} did not return metrics: {e}")
+        return collections
+
+    def profile(self, action=None, interval=None, limit=None):
+        # Stacks are prefixed with their worker so one flamegraph covers the pool
+        reports = []
+        for index, worker in self._live_workers():
+            try:
+                report = worker.call('profile', action, interval, limit, timeout=10)
+            except Exception as e:
+                logger.error(f"Worker {index} did not answer the profiler: {e}")
+                continue
+            if action:
+                reports.append(f"worker {index}: {report}")
+            else:
+                reports.extend(f"worker-{index};{line}\n" for line in report.splitlines() if line)
+        return ''.join(reports)
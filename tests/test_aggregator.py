@@ -0,0 +1,38 @@
+# tests/test_aggregator.py
+import asyncio
+
+from aggregator import DigestAggregator, split_message
+
+
+def test_short_messages_are_not_split():
+    assert split_message('one\ntwo', limit=10) == ['one\ntwo']
+    assert split_message('', limit=10) == []
+
+
+def test_messages_are_split_on_line_boundaries():
+    assert split_message('aaaa\nbbbb\ncccc', limit=9) == ['aaaa\nbbbb', 'cccc']
+    assert all(len(part) <= 9 for part in split_message('\n'.join(['x' * 4] * 20), limit=9))
+
+
+def test_lines_over_the_limit_are_cut():
+    assert split_message('ab\n' + 'x' * 12 + '\ncd', limit=5) == ['ab', 'xxxxx', 'xxxxx', 'xx\ncd']
+
+
+def test_digest_is_sent_when_full_or_when_its_window_closes():
+    async def run():
+        sent = []
+        digests = DigestAggregator(lambda destination, text: sent.append((destination, text)), 'chat{}'.format)
+        digests.add(-1, 'keywords', 'pump', 10, window=0.05, size=2)
+        digests.add(-1, 'keywords', 'pump', 11, window=0.05, size=2)
+        assert sent == [] and digests.pending() == 1
+        digests.add(-1, 'solana', 'So1', 10, window=0.05, size=2)
+        full = list(sent)
+
+        digests.add(-2, 'cashtags', '$ABC', 10, window=0.05)
+        await asyncio.sleep(0.1)
+        return full, sent[1:], digests.pending()
+
+    full, timed_out, pending = asyncio.run(run())
+    assert full == [(-1, "Keyword matches (1):\npump x2 (chat10, chat11)\n\nSolana contracts (1):\nSo1 x1 (chat10)")]
+    assert timed_out == [(-2, "Cashtags (1):\n$ABC x1 (chat10)")]
+    assert pending == 0
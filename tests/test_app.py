@@ -0,0 +1,44 @@
+# tests/test_app.py
+import importlib
+import sys
+
+import pytest
+
+from benchmarks.fake_telegram import FakeClient
+from config import Config
+
+SPEC = {'type': 'keywords', 'source_chats': ['-100'], 'destinations': ['-201'], 'keywords': ['pump']}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    # main opens the state store and imports old JSON files from the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, 'STATE_DB', str(tmp_path / 'state.db'))
+    monkeypatch.setattr(Config, 'WORKER_PROCESSES', 0)
+    monkeypatch.setattr('runtime.TelegramClient', lambda *args: FakeClient())
+    if 'main' in sys.modules:
+        main = importlib.reload(sys.modules['main'])
+    else:
+        main = importlib.import_module('main')
+    yield main
+    main.accounts.release('+1')
+    main.state_store._db.close()
+
+
+def test_job_config_can_be_posted_back_unchanged(app):
+    config = {'api_id': '1', 'api_hash': 'hash', 'phone_number': '+1'}
+    app.state_store.save_account('+1', '1', 'hash')
+    job_id = app.accounts.create_job(config, dict(SPEC))
+    client = app.app.test_client()
+    with client.session_transaction() as session:
+        session['phone_number'] = '+1'
+
+    spec = client.get(f'/jobs/{job_id}').get_json()
+    assert spec == SPEC
+    response = client.post(f'/jobs/{job_id}', json=spec)
+    assert response.status_code == 200 and response.get_json()['changed'] == []
+
+    response = client.post(f'/jobs/{job_id}', json=dict(spec, keywords=['pump', 'moon']))
+    assert response.get_json()['changed'] == ['keywords']
+    assert client.get(f'/jobs/{job_id}').get_json()['keywords'] == ['pump', 'moon']
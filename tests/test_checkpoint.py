@@ -0,0 +1,84 @@
+# tests/test_checkpoint.py
+import asyncio
+import time
+
+from benchmarks.fake_telegram import FakeClient
+from checkpoint import Checkpointer, CursorStore
+from cooldown import CooldownStore
+from forwarder import TelegramForwarder
+from store import StateStore
+
+
+async def until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def test_restarted_job_resumes_from_its_checkpoint(tmp_path):
+    path = str(tmp_path / 'state.db')
+
+    async def start(client):
+        forwarder = TelegramForwarder(0, '', '+1', client=client, store=StateStore(path))
+        job = asyncio.create_task(forwarder.forward_messages_to_channel(
+            None, ['-100'], ['-201'], ['pump'], job_id='a', keyword_timer=60))
+        await until(lambda: forwarder.pipeline.position('events', -100) is not None)
+        return forwarder, job
+
+    async def stop(forwarder, job):
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        await forwarder.shutdown()
+        forwarder.dispatcher.close()
+
+    async def run():
+        client = FakeClient()
+        await client.connect()
+        forwarder, job = await start(client)
+        await client.push(-100, 'pump 1')
+        await until(lambda: len(client.sent) == 1)
+        await stop(forwarder, job)
+
+        # Missed while the job was down; the repeated text is still cooling down
+        await client.disconnect()
+        for text in ('pump 2', 'pump 1', 'pump 3'):
+            await client.push(-100, text)
+        await client.connect()
+
+        forwarder, job = await start(client)
+        await until(lambda: len(client.sent) == 3)
+        await asyncio.sleep(0.1)
+        await stop(forwarder, job)
+        return [text for _, text, _ in client.sent]
+
+    assert asyncio.run(run()) == ['pump 1', 'pump 2', 'pump 3']
+
+
+class FlakyStore(StateStore):
+    # Fails its first checkpoint write
+    failures = 1
+
+    def save_checkpoint(self, *args):
+        if self.failures:
+            self.failures -= 1
+            raise OSError("disk I/O error")
+        super().save_checkpoint(*args)
+
+
+def test_failed_checkpoint_is_written_with_the_next_one(tmp_path):
+    store = FlakyStore(str(tmp_path / 'state.db'))
+    cursors, cooldowns = CursorStore(), CooldownStore()
+    checkpointer = Checkpointer(store, '+1', cursors, cooldowns)
+    cursors.set('a', -100, 5)
+    cooldowns.check_and_set(('a', 'keywords', 'pump'), 60)
+
+    asyncio.run(checkpointer.flush())
+    assert store.cursors('+1') == {} and store.cooldowns('+1') == []
+    assert cursors.dirty and cooldowns.dirty
+
+    cursors.set('a', -100, 7)
+    asyncio.run(checkpointer.flush())
+    assert store.cursors('+1') == {'a': {-100: 7}}
+    assert [entry[:3] for entry in store.cooldowns('+1')] == [['a', 'keywords', 'pump']]
+    assert not cursors.dirty and not cooldowns.dirty
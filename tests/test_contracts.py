@@ -0,0 +1,121 @@
+# tests/test_contracts.py
+import hashlib
+
+import pytest
+
+import contracts
+from contracts import checksum_digits, is_ethereum_address, is_solana_address, keccak_256
+from matcher import MessageMatcher
+
+# From the EIP-55 specification
+EIP55_ADDRESSES = [
+    '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed',
+    '0xfB6916095ca1df60bB79Ce92cE3Ea74c37c5d359',
+    '0xdbF03B407c01E7cD3CBea99509d93f8DDDC8C6FB',
+    '0xD1220A0cf47c7B9Be7A2E6BA89F429762e7b9aDb',
+    '0x52908400098527886E0F7030069857D2E4169EE7',
+    '0x8617E340B3D01FA5F11F306F4090FD50E238070D',
+    '0xde709f2102306220921060314715629080e2fb77',
+    '0x27b1fdb04752bbc536007a920d24acb045561c26',
+]
+
+
+@pytest.fixture(params=['pycryptodome', 'pure python'])
+def keccak_backend(request, monkeypatch):
+    if request.param == 'pycryptodome':
+        if contracts._keccak is None:
+            pytest.skip("pycryptodome is not installed")
+    else:
+        monkeypatch.setattr(contracts, '_keccak', None)
+    return request.param
+
+
+@pytest.mark.parametrize('data, digest', [
+    (b'', 'c5d2460186f7233c927e7db2dcc703c0e500b653ca82273b7bfad8045d85a470'),
+    (b'abc', '4e03657aea45a94fc7d47ba826c8d667c0d1e6e33a64a036ec44f58fa12d6c45'),
+])
+def test_keccak_256(keccak_backend, data, digest):
+    assert keccak_256(data).hex() == digest
+
+
+@pytest.mark.parametrize('length', [0, 135, 136, 137, 300])
+def test_keccak_f_matches_hashlib_sha3(length):
+    # SHA3-256 runs the same permutation with another padding byte, which
+    # covers the absorbing of messages longer than one block
+    data = bytes(range(256)) * 2
+    padded = bytearray(data[:length])
+    padded.append(0x06)
+    padded.extend(bytes(-len(padded) % contracts._RATE))
+    padded[-1] |= 0x80
+    state = [0] * 25
+    for offset in range(0, len(padded), contracts._RATE):
+        for lane in range(contracts._RATE // 8):
+            state[lane] ^= int.from_bytes(padded[offset + lane * 8:offset + lane * 8 + 8], 'little')
+        state = contracts._keccak_f(state)
+    digest = b''.join(lane.to_bytes(8, 'little') for lane in state[:4])
+    assert digest == hashlib.sha3_256(data[:length]).digest()
+
+
+@pytest.mark.parametrize('address', EIP55_ADDRESSES)
+def test_eip55_checksums(keccak_backend, address):
+    assert checksum_digits(address[2:]) == address[2:]
+
+
+@pytest.mark.parametrize('address', EIP55_ADDRESSES[:4])
+def test_ethereum_addresses(address):
+    assert is_ethereum_address(address)
+    assert is_ethereum_address(address.lower())
+    assert is_ethereum_address('0x' + address[2:].upper())
+    # One letter in the wrong case fails the checksum
+    index = max(index for index, char in enumerate(address) if char.isalpha() and index > 1)
+    assert not is_ethereum_address(address[:index] + address[index].swapcase() + address[index + 1:])
+
+
+@pytest.mark.parametrize('candidate', [
+    '0X5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAed',
+    '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAe',
+    '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAedd',
+    '0x5aAeb6053F3E94C9b9A09f33669435E7Ef1BeAeg',
+])
+def test_malformed_ethereum_addresses(candidate):
+    assert not is_ethereum_address(candidate)
+
+
+@pytest.mark.parametrize('candidate', [
+    '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU',
+    'So11111111111111111111111111111111111111112',
+    'TokenkegQfeZyiNwAJbNbGKPFXCWuBvf9Ss623VQ5DA',
+    '11111111111111111111111111111111',
+])
+def test_solana_addresses(candidate):
+    assert is_solana_address(candidate)
+
+
+@pytest.mark.parametrize('candidate', [
+    '1111111111111111111111111111111',  # 31 bytes
+    'zzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzzz',  # 33 bytes
+    '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsl',  # 'l' is not base58
+    '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAs0',
+    '',
+])
+def test_not_solana_addresses(candidate):
+    assert not is_solana_address(candidate)
+
+
+def test_transaction_hashes_and_signatures_are_not_addresses():
+    compiled = MessageMatcher(solana=True, ethereum=True)
+    # Their first 40 digits and 44 characters are valid addresses on their own
+    transaction_hash = '0x' + EIP55_ADDRESSES[-1][2:] + 'ab' * 12
+    signature = '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU' * 2
+    assert is_ethereum_address(transaction_hash[:42])
+    assert is_solana_address(signature[:44])
+    assert compiled.find(f"tx {transaction_hash} sig {signature}") == []
+    assert compiled.find(f"{EIP55_ADDRESSES[0]}0") == []
+    assert compiled.find(f"x{signature[:44]}") == []
+
+
+def test_addresses_next_to_punctuation_are_found():
+    compiled = MessageMatcher(solana=True, ethereum=True)
+    solana = '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU'
+    text = f"CA: ({EIP55_ADDRESSES[0]}), {solana}."
+    assert [match.value for match in compiled.find(text)] == [EIP55_ADDRESSES[0], solana]
@@ -0,0 +1,70 @@
+# tests/test_cooldown.py
+import asyncio
+import json
+import time
+
+from benchmarks.fake_telegram import FakeClient
+from cooldown import CooldownStore
+from forwarder import TelegramForwarder
+from store import StateStore, migrate_json_files
+
+
+def test_cooldowns_are_kept_per_job():
+    cooldowns = CooldownStore()
+    assert cooldowns.check_and_set(('a', 'keywords', 'pump'), 60)
+    assert not cooldowns.check_and_set(('a', 'keywords', 'pump'), 60)
+    assert cooldowns.check_and_set(('b', 'keywords', 'pump'), 60)
+
+
+def test_cooldowns_of_jobs_without_id_are_not_saved():
+    cooldowns = CooldownStore()
+    cooldowns.check_and_set((None, 'keywords', 'pump'), 60)
+    cooldowns.check_and_set(('a', 'keywords', 'pump'), 60)
+    assert [entry[:3] for entry in cooldowns.changes()] == [['a', 'keywords', 'pump']]
+
+
+def test_jobs_watching_the_same_chat_both_forward():
+    async def run():
+        client = FakeClient()
+        await client.connect()
+        forwarder = TelegramForwarder(0, '', '+1', client=client)
+        jobs = [asyncio.create_task(forwarder.forward_messages_to_channel(
+            None, ['-100'], [destination], ['pump'], job_id=job_id, keyword_timer=60))
+            for job_id, destination in (('a', '-201'), ('b', '-202'))]
+        while len(forwarder.rules) < 2:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        await client.push(-100, 'big pump now')
+        await asyncio.sleep(0.05)
+        await forwarder.dispatcher.join()
+        for job in jobs:
+            job.cancel()
+        await asyncio.gather(*jobs, return_exceptions=True)
+        return sorted(destination for destination, _, _ in client.sent)
+
+    assert asyncio.run(run()) == [-202, -201]
+
+
+def test_cooldowns_are_deleted_with_their_job(tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    expires_at = time.time() + 600
+    store.save_checkpoint('+1', [], [], [['k1', 'keywords', 'pump', expires_at],
+                                         ['k2', 'keywords', 'pump', expires_at]])
+    assert sorted(store.cooldowns('+1')) == [['k1', 'keywords', 'pump', expires_at],
+                                             ['k2', 'keywords', 'pump', expires_at]]
+    store.delete_job('k1')
+    assert store.cooldowns('+1') == [['k2', 'keywords', 'pump', expires_at]]
+
+
+def test_json_config_is_migrated_with_its_jobs(tmp_path):
+    (tmp_path / 'config_+1.json').write_text(json.dumps({
+        'api_id': 1, 'api_hash': 'hash',
+        'tasks': [{'job_id': 'k1', 'type': 'keywords', 'state': 'paused'}, {'task_id': 2, 'type': 'solana'}]}))
+
+    store = StateStore(str(tmp_path / 'state.db'))
+    migrate_json_files(store, str(tmp_path))
+    jobs = store.jobs('+1')
+    assert [(job['job_id'], job['type'], job['state']) for job in jobs[:1]] == [('k1', 'keywords', 'paused')]
+    assert (jobs[1]['type'], jobs[1]['state']) == ('solana', 'running') and 'task_id' not in jobs[1]
+    assert store.get_account('+1') is not None
+    assert (tmp_path / 'config_+1.json.migrated').exists()
@@ -0,0 +1,97 @@
+# tests/test_dispatcher.py
+import asyncio
+import time
+
+import dispatcher
+from benchmarks.fake_telegram import FakeClient
+from dispatcher import SendDispatcher
+from metrics import SEND_QUEUE_DEPTH
+
+
+async def _same_entity(peer):
+    return peer
+
+
+def _run(client, work, **kwargs):
+    async def run():
+        await client.connect()
+        sender = SendDispatcher(client, _same_entity, **kwargs)
+        try:
+            await work(sender)
+        finally:
+            sender.close()
+        return sender
+
+    return asyncio.run(run())
+
+
+def test_flood_waits_are_retried_after_the_wait():
+    client = FakeClient()
+    client.send_flood_waits[-201] = 1
+
+    async def work(sender):
+        started = time.monotonic()
+        sender.submit(-201, 'pump')
+        await sender.join()
+        assert time.monotonic() - started >= 1
+
+    sender = _run(client, work)
+    assert [(destination, text) for destination, text, _ in client.sent] == [(-201, 'pump')]
+    assert (sender.flood_waits, sender.sent, sender.failed) == (1, 1, 0)
+
+
+def test_messages_are_given_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(dispatcher, 'MAX_RETRIES', 2)
+    client = FakeClient(send_flood_wait_rate=1.0, flood_wait_seconds=0)
+
+    async def work(sender):
+        sender.submit(-201, 'pump')
+        await sender.join()
+
+    # A FloodWait empties the bucket, a fast rate keeps the retries quick
+    sender = _run(client, work, rate=100.0)
+    assert client.sent == []
+    assert (sender.flood_waits, sender.sent, sender.failed) == (3, 0, 1)
+
+
+def test_sends_to_one_destination_are_paced_by_its_bucket():
+    client = FakeClient()
+
+    async def work(sender):
+        for number in range(5):
+            sender.submit(-201, f"message {number}")
+        await sender.join()
+
+    _run(client, work, rate=20.0, burst=2)
+    times = [sent_at for _, _, sent_at in client.sent]
+    assert [text for _, text, _ in client.sent] == [f"message {number}" for number in range(5)]
+    # The burst goes out at once, the other three wait 1/20 s each
+    assert times[1] - times[0] < 0.03
+    assert times[4] - times[1] >= 0.14
+
+
+def test_flood_wait_of_one_destination_does_not_delay_the_others():
+    client = FakeClient()
+    client.send_flood_waits[-201] = 1
+
+    async def work(sender):
+        sender.submit(-201, 'slow')
+        sender.submit(-202, 'fast')
+        await sender.join()
+
+    _run(client, work)
+    sent_at = {destination: at for destination, _, at in client.sent}
+    assert sent_at[-202] < sent_at[-201] - 0.5
+
+
+def test_queue_depth_is_reported_when_messages_are_queued():
+    client = FakeClient()
+
+    async def work(sender):
+        for number in range(3):
+            sender.submit(-301, f"message {number}")
+        assert SEND_QUEUE_DEPTH.labels(-301).value == 3
+        await sender.join()
+
+    _run(client, work)
+    assert SEND_QUEUE_DEPTH.labels(-301).value == 0
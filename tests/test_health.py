@@ -0,0 +1,114 @@
+# tests/test_health.py
+import asyncio
+import hashlib
+import time
+
+import health
+from benchmarks.fake_telegram import FakeClient
+from config import Config
+from forwarder import TelegramForwarder
+from health import ConnectionSupervisor, backoff_delay
+from metrics import account_label
+
+
+async def until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+class SilentClient(FakeClient):
+    # Stays connected but leaves the first `silent` pings unanswered
+    silent = 0
+
+    async def __call__(self, request):
+        if self.silent:
+            self.silent -= 1
+            await asyncio.sleep(10)
+        await super().__call__(request)
+
+
+class StubIngest:
+    def resync(self):
+        pass
+
+    async def wait_resynced(self, timeout):
+        return True
+
+
+class StubEngine:
+    # Seconds since each chat's watcher last sent a heartbeat
+    job = 'test'
+
+    def __init__(self, idle):
+        self.idle = idle
+        self.cursors = {}
+        self.restarted = []
+
+    def stalled(self, timeout):
+        return [chat_id for chat_id, seconds in self.idle.items() if seconds > timeout]
+
+    def restart_chat(self, chat_id):
+        self.restarted.append(chat_id)
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    for attempt, delay in ((1, 1), (2, 2), (3, 4), (10, 60)):
+        assert all(delay / 2 <= backoff_delay(attempt) <= delay for _ in range(20))
+
+
+def test_account_label_is_keyed_with_the_secret(monkeypatch):
+    label = account_label('+1')
+    assert label != hashlib.sha256(b'+1').hexdigest()[:12]
+    monkeypatch.setattr(Config, 'SECRET_KEY', 'another key')
+    assert account_label('+1') != label
+
+
+def test_dropped_connection_is_restored_and_the_gap_replayed():
+    async def run():
+        client = FakeClient()
+        await client.connect()
+        forwarder = TelegramForwarder(0, '', '+1', client=client)
+        forwarder.health.interval = 0.05
+        job = asyncio.create_task(forwarder.forward_messages_to_channel(
+            None, ['-100'], ['-201'], ['pump'], job_id='a'))
+        await until(lambda: forwarder.pipeline.position('events', -100) is not None)
+
+        await client.disconnect()
+        await client.push(-100, 'pump while down')
+        await until(lambda: client.sent)
+        job.cancel()
+        await asyncio.gather(job, return_exceptions=True)
+        await forwarder.shutdown()
+        forwarder.dispatcher.close()
+        return [text for _, text, _ in client.sent], forwarder.health
+
+    sent, supervisor = asyncio.run(run())
+    assert sent == ['pump while down']
+    assert supervisor.reconnects == 1 and len(supervisor.recoveries) == 1
+
+
+def test_unanswered_pings_start_a_new_connection():
+    async def run():
+        client = SilentClient()
+        client.silent = health.MAX_MISSED_HEARTBEATS
+        await client.connect()
+        supervisor = ConnectionSupervisor(client, client.connect, StubIngest(), list, '+1', interval=0.01, timeout=0.05)
+        supervisor.start()
+        await until(lambda: supervisor.reconnects == 1)
+        supervisor.stop()
+        return client, supervisor
+
+    client, supervisor = asyncio.run(run())
+    assert client.is_connected() and supervisor.stats()['reconnects'] == 1
+
+
+def test_stalled_watchers_are_restarted(monkeypatch):
+    monkeypatch.setattr(health, 'STALL_TIMEOUT', 30)
+    engine = StubEngine({-100: 50, -200: 5})
+    supervisor = ConnectionSupervisor(FakeClient(), None, None, lambda: [engine], '+1')
+    supervisor._restart_stalled()
+    assert engine.restarted == [-100]
+    assert supervisor.watcher_restarts == 1
+
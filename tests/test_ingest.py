@@ -0,0 +1,50 @@
+# tests/test_ingest.py
+import asyncio
+
+import ingest
+from benchmarks.fake_telegram import FakeClient
+from ingest import EventIngest, open_feed
+
+
+def test_full_feed_drops_updates_and_catches_up_from_its_cursor(monkeypatch):
+    monkeypatch.setattr(ingest, 'FEED_QUEUE_SIZE', 2)
+
+    async def run():
+        client = FakeClient()
+        await client.connect()
+        event_ingest = EventIngest(client)
+        feed = await open_feed(client, event_ingest, -100)
+        for number in range(5):
+            await client.push(-100, f"message {number}")
+        assert event_ingest.dropped == 3
+        assert feed.catch_up_pending
+
+        messages = feed.messages()
+        received = [(await messages.__anext__()).text for _ in range(5)]
+        assert not feed.catch_up_pending
+        await client.push(-100, 'message 5')
+        received.append((await messages.__anext__()).text)
+        await messages.aclose()
+        feed.close()
+        return received
+
+    assert asyncio.run(run()) == [f"message {number}" for number in range(6)]
+
+
+def test_resync_does_not_fail_on_a_full_queue(monkeypatch):
+    monkeypatch.setattr(ingest, 'FEED_QUEUE_SIZE', 1)
+
+    async def run():
+        client = FakeClient()
+        await client.connect()
+        event_ingest = EventIngest(client)
+        feed = await open_feed(client, event_ingest, -100)
+        await client.push(-100, 'queued')
+        event_ingest.resync()
+        messages = feed.messages()
+        text = (await messages.__anext__()).text
+        await messages.aclose()
+        feed.close()
+        return text, event_ingest._queues
+
+    assert asyncio.run(run()) == ('queued', {})
@@ -0,0 +1,95 @@
+# tests/test_jobs.py
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_telegram import FakeClient
+from forwarder import TelegramForwarder
+from jobs import PAUSED, RUNNING, JobRegistry, validate_spec
+from runtime import AccountRuntime
+from store import StateStore
+
+SPEC = {'type': 'keywords', 'source_chats': ['-100'], 'destinations': ['-201'], 'keywords': ['pump'],
+        'keyword_timer': '60', 'send_mode': 'text'}
+
+
+@pytest.fixture
+def runtime(tmp_path, monkeypatch):
+    # The runtime opens its Telethon session in the working directory, the
+    # forwarder talks to a FakeClient instead
+    monkeypatch.chdir(tmp_path)
+    runtime = AccountRuntime(1, 'hash', '+1', lambda *args, client: TelegramForwarder(
+        *args, client=FakeClient()))
+    yield runtime
+    runtime.call(_cancel_tasks())
+    runtime.stop()
+
+
+async def _cancel_tasks():
+    tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+@pytest.mark.parametrize('changes', [
+    {'keywords': 'moon'},
+    {'keywords': ['moon', 1]},
+    {'keyword_timer': 'soon'},
+    {'keyword_timer': [60]},
+    {'keyword_timer': -1},
+    {'digest_window': 'abc'},
+    {'digest_window': 0},
+    {'digest_size': '2.5'},
+    {'send_mode': 'copy'},
+    {'ingest_mode': 'push'},
+    {'type': 'bitcoin'},
+])
+def test_invalid_fields_are_rejected(changes):
+    with pytest.raises(ValueError):
+        validate_spec(changes)
+
+
+def test_valid_fields_pass():
+    validate_spec(dict(SPEC, digest_window='5', digest_size=10, ingest_mode='poll'))
+    validate_spec(dict(SPEC, keyword_timer='', digest_window=None, digest_size=''))
+
+
+def test_invalid_updates_are_not_saved(runtime, tmp_path):
+    store = StateStore(str(tmp_path / 'state.db'))
+    registry = JobRegistry(store)
+    job = registry.create(runtime, dict(SPEC), start=False)
+
+    with pytest.raises(ValueError):
+        registry.update(job.id, {'digest_window': 'abc'})
+    assert job.spec == SPEC
+    assert store.jobs('+1')[0]['keyword_timer'] == '60'
+    assert 'digest_window' not in store.jobs('+1')[0]
+
+    assert registry.update(job.id, {'keyword_timer': '30', 'keywords': ['pump']}) == ['keyword_timer']
+    assert job.spec['keyword_timer'] == '30'
+    assert store.jobs('+1')[0]['keyword_timer'] == '30'
+    assert store.jobs('+1')[0]['state'] == PAUSED
+
+
+def test_invalid_specs_are_not_created(runtime):
+    registry = JobRegistry()
+    with pytest.raises(ValueError):
+        registry.create(runtime, dict(SPEC, digest_window='abc'))
+    assert registry.jobs() == []
+
+
+def test_running_jobs_are_updated_in_place(runtime):
+    runtime.call(runtime.client.connect())
+    registry = JobRegistry()
+    job = registry.create(runtime, dict(SPEC))
+    deadline = time.monotonic() + 5
+    while job.id not in runtime.forwarder.rules and time.monotonic() < deadline:
+        time.sleep(0.01)
+    future = job.future
+
+    assert registry.update(job.id, {'keywords': ['moon'], 'digest_window': 5}) == ['keywords', 'digest_window']
+    assert job.future is future and job.state == RUNNING
+    assert runtime.forwarder.rules[job.id][0].keywords == {'moon'}
+    registry.stop(job.id)
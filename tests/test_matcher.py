@@ -0,0 +1,65 @@
+# tests/test_matcher.py
+import pytest
+
+import matcher
+from matcher import CASHTAG, ETHEREUM, KEYWORD, SOLANA, KeywordAutomaton, MessageMatcher
+
+SOLANA_ADDRESS = '7xKXtg2CW87d97TXJSDpbD5jBkheTqA83TZRuJosgAsU'
+ETHEREUM_ADDRESS = '0x52908400098527886E0F7030069857D2E4169EE7'
+
+
+@pytest.fixture(params=['scan', 'automaton', 'pure python'])
+def backend(request, monkeypatch):
+    # Every way KeywordAutomaton.find can take has to give the same results
+    if request.param != 'scan':
+        monkeypatch.setattr(matcher, 'SCAN_KEYWORDS', 0)
+    if request.param == 'pure python':
+        monkeypatch.setattr(matcher, 'ahocorasick', None)
+    return request.param
+
+
+def test_keywords_are_reported_once_at_their_first_occurrence(backend):
+    automaton = KeywordAutomaton(['pump', 'moon', 'pumping', 'ump', 'missing'])
+    assert automaton.find('moon pumping, pump and moon') == [
+        (0, 4, 'moon'), (5, 9, 'pump'), (5, 12, 'pumping'), (6, 9, 'ump')]
+
+
+def test_first_stops_at_one_keyword(backend):
+    automaton = KeywordAutomaton(['pump', 'moon', 'missing'])
+    [(start, end, word)] = automaton.first('to the moon, pump it')
+    assert 'to the moon, pump it'[start:end] == word and word in ('pump', 'moon')
+    assert automaton.first('nothing here') == []
+    assert KeywordAutomaton(['', 'moon']).first('anything') == [(0, 0, '')]
+
+
+def test_empty_keyword_matches_every_text(backend):
+    assert KeywordAutomaton(['', 'moon']).find('to the moon') == [(0, 0, ''), (7, 11, 'moon')]
+    assert KeywordAutomaton(['']).find('anything') == [(0, 0, '')]
+
+
+def test_matches_of_several_kinds_are_in_text_order(backend):
+    compiled = MessageMatcher(['moon'], solana=True, ethereum=True, cashtags=True)
+    text = f"$PEPE {ETHEREUM_ADDRESS} to the Moon {SOLANA_ADDRESS} moon"
+    assert [(match.kind, match.value) for match in compiled.find(text)] == [
+        (CASHTAG, '$PEPE'), (ETHEREUM, ETHEREUM_ADDRESS), (KEYWORD, 'moon'), (SOLANA, SOLANA_ADDRESS)]
+
+
+def test_invalid_addresses_are_dropped():
+    compiled = MessageMatcher(solana=True, ethereum=True)
+    # One letter of the checksummed address in the wrong case, and base58 that decodes to 40 bytes
+    assert compiled.find(f"{ETHEREUM_ADDRESS[:-2]}e7 {'1' * 40}") == []
+    assert compiled.find('') == []
+
+
+def test_any_keyword_reports_one_keyword_and_every_address():
+    compiled = MessageMatcher(['moon', 'pump'], solana=True, ethereum=True, any_keyword=True)
+    text = f"{ETHEREUM_ADDRESS} pump to the Moon {SOLANA_ADDRESS}"
+    matches = compiled.find(text)
+    assert [match.kind for match in matches] == [ETHEREUM, KEYWORD, SOLANA]
+    assert [match.value for match in matches if match.kind != KEYWORD] == [ETHEREUM_ADDRESS, SOLANA_ADDRESS]
+
+
+def test_addresses_after_non_ascii_text_are_found():
+    compiled = MessageMatcher(solana=True, ethereum=True)
+    text = f"новый токен {SOLANA_ADDRESS} и {ETHEREUM_ADDRESS}"
+    assert [match.value for match in compiled.find(text)] == [SOLANA_ADDRESS, ETHEREUM_ADDRESS]
@@ -0,0 +1,75 @@
+# tests/test_pipeline.py
+import asyncio
+import time
+
+from benchmarks.fake_telegram import FakeClient
+from checkpoint import CursorStore
+from dispatcher import AlbumIndex
+from ingest import EventIngest
+from pipeline import Pipeline, Rule
+
+
+async def until(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+def recording_rule(job_id, received, gate=None):
+    async def handler(message, matches):
+        if gate is not None:
+            await gate.wait()
+        received.append(message.text)
+    return Rule(job_id, [-100], handler, keywords=['pump'])
+
+
+async def watched_pipeline():
+    client = FakeClient()
+    await client.connect()
+    return client, Pipeline(client, EventIngest(client), AlbumIndex(), CursorStore())
+
+
+def test_rule_joining_a_watched_chat_catches_up_from_its_cursor():
+    async def run():
+        client, pipeline = await watched_pipeline()
+        first, second = [], []
+        await pipeline.subscribe(recording_rule('a', first))
+        await until(lambda: pipeline.position('events', -100) is not None)
+        sent = [await client.push(-100, f"pump {number}") for number in range(3)]
+        await until(lambda: len(first) == 3)
+
+        await pipeline.subscribe(recording_rule('b', second), resume_from={-100: sent[0].id})
+        await until(lambda: len(second) == 2)
+        latest = await client.push(-100, 'pump 3')
+        await until(lambda: len(first) == 4 and len(second) == 3)
+        await until(lambda: pipeline.cursors.get('b') == {-100: latest.id})
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == ['pump 0', 'pump 1', 'pump 2', 'pump 3']
+    assert second == ['pump 1', 'pump 2', 'pump 3']
+
+
+def test_rule_joining_a_watched_chat_skips_what_the_feed_already_ingested():
+    async def run():
+        client, pipeline = await watched_pipeline()
+        gate = asyncio.Event()
+        first, second = [], []
+        await pipeline.subscribe(recording_rule('a', first, gate))
+        await until(lambda: pipeline.position('events', -100) is not None)
+        # Four messages hold the match workers at the gate, the fifth waits in the queue
+        sent = [await client.push(-100, f"pump {number}") for number in range(5)]
+        engine = pipeline.engines['events']
+        await until(lambda: engine.queue.qsize() == 1 and pipeline.position('events', -100) == sent[-1].id)
+
+        await pipeline.subscribe(recording_rule('b', second))
+        gate.set()
+        await until(lambda: len(first) == 5)
+        await client.push(-100, 'pump 5')
+        await until(lambda: len(first) == 6 and second)
+        return sorted(first), second
+
+    first, second = asyncio.run(run())
+    assert first == [f"pump {number}" for number in range(6)]
+    assert second == ['pump 5']
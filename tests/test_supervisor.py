@@ -0,0 +1,68 @@
+# tests/test_supervisor.py
+import time
+
+import pytest
+
+from benchmarks.fake_telegram import FakeClient
+from jobs import PAUSED, RUNNING
+from runtime import find_runtime
+from store import StateStore
+from supervisor import AccountService
+
+SPEC = {'type': 'keywords', 'source_chats': ['-100'], 'destinations': ['-201'], 'keywords': ['pump']}
+
+
+class RejectingClient(FakeClient):
+    # A client whose credentials Telegram does not accept
+
+    async def is_user_authorized(self):
+        return False
+
+    async def send_code_request(self, phone_number):
+        raise ValueError("The api_id/api_hash combination is invalid")
+
+
+@pytest.fixture
+def accounts(tmp_path, monkeypatch):
+    monkeypatch.setattr('runtime.TelegramClient',
+                        lambda session, api_id, api_hash: RejectingClient() if api_hash == 'wrong' else FakeClient())
+    store = StateStore(str(tmp_path / 'state.db'))
+    store.save_account('+1', '1', 'old')
+    service = AccountService(store)
+    yield service
+    service.release('+1')
+
+
+def test_changed_credentials_move_the_jobs_once_they_work(accounts):
+    config = {'api_id': '1', 'api_hash': 'old', 'phone_number': '+1'}
+    running = accounts.create_job(config, dict(SPEC))
+    paused = accounts.jobs.create(accounts._runtime(config), dict(SPEC), start=False).id
+    old = find_runtime('+1')
+
+    assert accounts._runtime(dict(config, api_hash='new')) is old
+    assert accounts.send_code(dict(config, api_hash='new')) is None
+    new = find_runtime('+1')
+    assert new is not old and new.api_hash == 'new'
+    assert not old.client.is_connected()
+    assert not accounts._candidates
+    assert {job.id: (job.runtime, job.state) for job in accounts.jobs.jobs('+1')} == {
+        running: (new, RUNNING), paused: (new, PAUSED)}
+
+    deadline = time.monotonic() + 5
+    while running not in new.forwarder.rules and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert running in new.forwarder.rules
+    assert not accounts.jobs.get(running).future.done()
+
+
+def test_rejected_credentials_leave_the_jobs_running(accounts):
+    config = {'api_id': '1', 'api_hash': 'old', 'phone_number': '+1'}
+    running = accounts.create_job(config, dict(SPEC))
+    old = find_runtime('+1')
+
+    with pytest.raises(ValueError):
+        accounts.send_code(dict(config, api_hash='wrong'))
+    assert find_runtime('+1') is old and old.client.is_connected()
+    assert not accounts._candidates
+    job = accounts.jobs.get(running)
+    assert job.runtime is old and not job.future.done()
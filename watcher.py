@@ -0,0 +1,141 @@
+# watcher.py
+import asyncio
+import logging
+import time
+
+from telethon import errors
+
+from ingest import open_feed
+from metrics import BACKOFF_SECONDS, MESSAGES_INGESTED, QUEUE_WAIT_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Messages buffered between ingestion and matching before watchers block
+QUEUE_SIZE = 1000
+# Number of tasks pulling messages off the queue and running the handler
+MATCH_WORKERS = 4
+# Seconds a watcher waits before reopening its feed after an error
+RETRY_DELAY = 5
+
+
+class WatcherEngine:
+    """Watches any number of source chats concurrently on one event loop.
+
+    Every chat gets its own watcher task and cursor, so a chat that stalls or
+    hits FloodWait only delays itself. Watchers push (chat_id, message) pairs
+    into a bounded queue that a small pool of workers drains into `handler`.
+
+    `cursors` resumes chats from saved message IDs instead of the latest
+    message, and `on_checkpoint(chat_id, message_id)` is called once a
+    message has been handled, so it can be persisted. `job` labels the
+    engine's metrics.
+
+    Watchers record a heartbeat every time their feed comes around, so one
+    stuck in a request that never returns shows up in `stalled()` and can
+    be restarted from its cursor.
+    """
+
+    def __init__(self, client, ingest, handler, ingest_mode='events', queue_size=QUEUE_SIZE, workers=MATCH_WORKERS,
+                 cursors=None, on_checkpoint=None, job=''):
+        self.client = client
+        self.ingest = ingest
+        self.handler = handler
+        self.ingest_mode = ingest_mode
+        self.workers = workers
+        self.on_checkpoint = on_checkpoint
+        self.queue = asyncio.Queue(queue_size)
+        self.cursors = dict(cursors or {})
+        # Chats whose watcher is waiting out a FloodWait or an error
+        self.backing_off = set()
+        self.heartbeats = {}  # chat ID -> time.monotonic() of the watcher's last heartbeat
+        self._watchers = {}
+        self.job = job
+        self._ingested = MESSAGES_INGESTED.labels(job)
+        self._queue_wait = QUEUE_WAIT_SECONDS.labels(job)
+
+    def add_chat(self, chat_id):
+        if chat_id not in self._watchers:
+            self._watchers[chat_id] = asyncio.create_task(self._watch(chat_id))
+
+    def remove_chat(self, chat_id):
+        watcher = self._watchers.pop(chat_id, None)
+        self.heartbeats.pop(chat_id, None)
+        if watcher is not None:
+            watcher.cancel()
+
+    def restart_chat(self, chat_id):
+        # The new watcher resumes from the chat's cursor and catches up on the gap
+        if chat_id in self._watchers:
+            self.remove_chat(chat_id)
+            self.add_chat(chat_id)
+
+    def stalled(self, timeout):
+        # Chats whose watcher has not come around for `timeout` seconds. Sleeping
+        # through a back-off or waiting for room in a full queue is not a stall.
+        if self.queue.full():
+            return []
+        now = time.monotonic()
+        return [chat_id for chat_id, beat in self.heartbeats.items()
+                if now - beat > timeout and chat_id not in self.backing_off]
+
+    def _beat(self, chat_id):
+        self.heartbeats[chat_id] = time.monotonic()
+
+    async def run(self, chat_ids):
+        for chat_id in chat_ids:
+            self.add_chat(chat_id)
+        consumers = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        try:
+            await asyncio.gather(*consumers)
+        finally:
+            for chat_id in list(self._watchers):
+                self.remove_chat(chat_id)
+            for consumer in consumers:
+                consumer.cancel()
+
+    async def _watch(self, chat_id):
+        heartbeat = lambda: self._beat(chat_id)
+        while True:
+            heartbeat()
+            try:
+                feed = await open_feed(self.client, self.ingest, chat_id, self.ingest_mode,
+                                       last_message_id=self.cursors.get(chat_id), heartbeat=heartbeat)
+                # A feed opened at the latest message starts its cursor there, so
+                # a restarted watcher resumes from it instead of skipping the gap
+                self.cursors.setdefault(chat_id, feed.last_message_id)
+                try:
+                    async for message in feed.messages():
+                        heartbeat()
+                        self.cursors[chat_id] = message.id
+                        self._ingested.inc()
+                        await self.queue.put((chat_id, message, time.perf_counter()))
+                finally:
+                    feed.close()
+            except errors.FloodWaitError as e:
+                logger.warning(f"FloodWait of {e.seconds}s while watching chat {chat_id}")
+                await self._back_off(chat_id, e.seconds, 'flood_wait')
+            except Exception as e:
+                logger.error(f"Watcher for chat {chat_id} failed: {e}")
+                await self._back_off(chat_id, RETRY_DELAY, 'error')
+
+    async def _back_off(self, chat_id, seconds, reason):
+        BACKOFF_SECONDS.labels(self.job, reason).inc(seconds)
+        self.backing_off.add(chat_id)
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            self.backing_off.discard(chat_id)
+
+    async def _consume(self):
+        while True:
+            chat_id, message, queued_at = await self.queue.get()
+            self._queue_wait.observe(time.perf_counter() - queued_at)
+            try:
+                await self.handler(chat_id, message)
+            except Exception as e:
+                logger.error(f"Failed to handle message {message.id} from chat {chat_id}: {e}")
+            finally:
+                # A message that failed is not retried after a restart either
+                if self.on_checkpoint is not None:
+                    self.on_checkpoint(chat_id, message.id)
+                self.queue.task_done()